@@ -0,0 +1,460 @@
+import asyncio
+import socket
+import time
+from collections import deque, namedtuple
+
+import latency
+from pipeline import MAX_BATCH_BYTES, frame_batches
+from resp import ProtocolError, RespError, encode_command
+
+Message = namedtuple("Message", ["kind", "channel", "data", "pattern"])
+
+
+async def read_response(reader, encoding="utf-8"):
+    line = await reader.readuntil(b"\r\n")
+    prefix = line[0]
+
+    if prefix == 36:  # $
+        length = int(line[1:-2])
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2].decode(encoding) if encoding else data[:-2]
+    elif prefix == 42:  # *
+        count = int(line[1:-2])
+        if count < 0:
+            return None
+        return [await read_response(reader, encoding) for _ in range(count)]
+    elif prefix == 58:  # :
+        return int(line[1:-2])
+    elif prefix == 43:  # +
+        return line[1:-2].decode(encoding) if encoding else line[1:-2]
+    elif prefix == 45:  # -
+        return RespError(line[1:-2].decode(errors="replace"))
+    raise ProtocolError(f"Unknown prefix: {line[:1]!r}")
+
+
+class CountingStreamReader:
+    # Wraps a StreamReader to count reply bytes for the latency recorder.
+    def __init__(self, reader):
+        self._reader = reader
+        self.position = 0
+
+    async def readuntil(self, separator):
+        data = await self._reader.readuntil(separator)
+        self.position += len(data)
+        return data
+
+    async def readexactly(self, n):
+        data = await self._reader.readexactly(n)
+        self.position += n
+        return data
+
+
+async def open_stream(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if latency.recorder is not None:
+        reader = CountingStreamReader(reader)
+    return reader, writer
+
+
+class AsyncCommands:
+    async def ping(self):
+        return await self.execute_command("PING")
+
+    async def flushall(self):
+        return await self.execute_command("FLUSHALL")
+
+    async def get(self, key):
+        return await self.execute_command("GET", key)
+
+    async def set(self, key, value, px=None):
+        if px is None:
+            return await self.execute_command("SET", key, value)
+        return await self.execute_command("SET", key, value, "PX", px)
+
+    async def incr(self, key):
+        return await self.execute_command("INCR", key)
+
+    async def incrby(self, key, amount):
+        return await self.execute_command("INCRBY", key, amount)
+
+    async def lpush(self, key, value):
+        return await self.execute_command("LPUSH", key, value)
+
+    async def rpush(self, key, value):
+        return await self.execute_command("RPUSH", key, value)
+
+    async def lpop(self, key):
+        return await self.execute_command("LPOP", key)
+
+    async def rpop(self, key):
+        return await self.execute_command("RPOP", key)
+
+    async def lrange(self, key, start, stop):
+        return await self.execute_command("LRANGE", key, start, stop)
+
+    async def llen(self, key):
+        return await self.execute_command("LLEN", key)
+
+    async def lrem(self, key, count, value):
+        return await self.execute_command("LREM", key, count, value)
+
+    async def zadd(self, key, mapping):
+        args = []
+        for member, score in mapping.items():
+            args += (score, member)
+        return await self.execute_command("ZADD", key, *args)
+
+    async def zscore(self, key, member):
+        return await self.execute_command("ZSCORE", key, member)
+
+    async def zincrby(self, key, amount, member):
+        return await self.execute_command("ZINCRBY", key, amount, member)
+
+    async def zrem(self, key, *members):
+        return await self.execute_command("ZREM", key, *members)
+
+    async def zcard(self, key):
+        return await self.execute_command("ZCARD", key)
+
+    async def zcount(self, key, min_score, max_score):
+        return await self.execute_command("ZCOUNT", key, min_score, max_score)
+
+    async def zrank(self, key, member):
+        return await self.execute_command("ZRANK", key, member)
+
+    async def zrevrank(self, key, member):
+        return await self.execute_command("ZREVRANK", key, member)
+
+    async def zrange(self, key, start, stop, withscores=False):
+        return await self._range("ZRANGE", key, start, stop, withscores)
+
+    async def zrevrange(self, key, start, stop, withscores=False):
+        return await self._range("ZREVRANGE", key, start, stop, withscores)
+
+    async def zrangebyscore(self, key, min_score, max_score, withscores=False):
+        return await self._range("ZRANGEBYSCORE", key, min_score, max_score, withscores)
+
+    async def zrevrangebyscore(self, key, max_score, min_score, withscores=False):
+        return await self._range(
+            "ZREVRANGEBYSCORE", key, max_score, min_score, withscores
+        )
+
+    async def zremrangebyscore(self, key, min_score, max_score):
+        return await self.execute_command("ZREMRANGEBYSCORE", key, min_score, max_score)
+
+    async def zremrangebyrank(self, key, start, stop):
+        return await self.execute_command("ZREMRANGEBYRANK", key, start, stop)
+
+    async def _range(self, name, key, start, stop, withscores):
+        if withscores:
+            return await self.execute_command(name, key, start, stop, "WITHSCORES")
+        return await self.execute_command(name, key, start, stop)
+
+    async def xadd(self, key, fields, entry_id="*"):
+        args = []
+        for field, value in fields.items():
+            args += (field, value)
+        return await self.execute_command("XADD", key, entry_id, *args)
+
+    async def xrange(self, key, start="-", end="+"):
+        return await self.execute_command("XRANGE", key, start, end)
+
+    async def xread(self, streams, block=None):
+        args = [] if block is None else ["block", block]
+        args.append("streams")
+        args += streams.keys()
+        args += streams.values()
+        return await self.execute_command("XREAD", *args)
+
+    async def publish(self, channel, message):
+        return await self.execute_command("PUBLISH", channel, message)
+
+    async def eval(self, script, keys=(), args=()):
+        return await self.execute_command("EVAL", script, len(keys), *keys, *args)
+
+    async def evalsha(self, sha, keys=(), args=()):
+        return await self.execute_command("EVALSHA", sha, len(keys), *keys, *args)
+
+    async def script_load(self, script):
+        return await self.execute_command("SCRIPT", "LOAD", script)
+
+
+class AsyncConnection(AsyncCommands):
+    # Replies come back in request order, so each request parks a future in a
+    # FIFO and a single reader task resolves them as replies arrive.
+    def __init__(self, reader, writer, encoding="utf-8", max_inflight_bytes=MAX_BATCH_BYTES):
+        self._reader = reader
+        self._writer = writer
+        self.encoding = encoding
+        self.max_inflight_bytes = max_inflight_bytes
+        self._pending = deque()
+        self._waiters = deque()
+        self._inflight_bytes = 0
+        self._error = None
+        self._read_task = asyncio.get_running_loop().create_task(self._read_loop())
+
+    @classmethod
+    async def connect(cls, host, port, password=None, **kwargs):
+        reader, writer = await open_stream(host, port)
+        conn = cls(reader, writer, **kwargs)
+        if password is not None:
+            reply = await conn.execute_command("AUTH", password)
+            if isinstance(reply, RespError):
+                await conn.close()
+                raise reply
+        return conn
+
+    @property
+    def pending(self):
+        return len(self._pending) + len(self._waiters)
+
+    async def execute_command(self, *args):
+        if self._error is not None:
+            raise self._error
+        frame = encode_command(args)
+        size = len(frame)
+        if self._must_wait(size):
+            await self._wait_for_window(size)
+        else:
+            self._inflight_bytes += size
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((future, size, args[0], time.perf_counter()))
+        self._writer.write(frame)
+        return await future
+
+    def _must_wait(self, size):
+        if self.max_inflight_bytes is None:
+            return False
+        if self._waiters:
+            return True
+        return self._inflight_bytes and self._inflight_bytes + size > self.max_inflight_bytes
+
+    async def _wait_for_window(self, size):
+        # RedisServerListener drops commands that straddle its 1024 byte
+        # reads, so only a bounded number of request bytes may be unanswered.
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((size, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(size)
+            raise
+
+    def _release(self, size):
+        self._inflight_bytes -= size
+        while self._waiters:
+            size, waiter = self._waiters[0]
+            if self._inflight_bytes and self._inflight_bytes + size > self.max_inflight_bytes:
+                break
+            self._waiters.popleft()
+            if not waiter.done():
+                self._inflight_bytes += size
+                waiter.set_result(None)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                position = getattr(self._reader, "position", 0)
+                reply = await read_response(self._reader, self.encoding)
+                if not self._pending:
+                    raise ProtocolError(f"Unexpected reply: {reply!r}")
+                future, size, name, started = self._pending.popleft()
+                recorder = latency.recorder
+                if recorder is not None:
+                    recorder.record(
+                        latency.command_name(name),
+                        time.perf_counter() - started,
+                        size,
+                        getattr(self._reader, "position", 0) - position,
+                    )
+                if self.max_inflight_bytes is not None:
+                    self._release(size)
+                if not future.done():
+                    future.set_result(reply)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            self._fail(ConnectionError(f"Connection lost: {e}"))
+        except asyncio.CancelledError:
+            self._fail(ConnectionError("Connection closed"))
+            raise
+        except Exception as e:
+            self._fail(e)
+
+    def _fail(self, error):
+        self._error = error
+        while self._pending:
+            future = self._pending.popleft()[0]
+            if not future.done():
+                future.set_exception(error)
+        while self._waiters:
+            _, waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(error)
+
+    async def close(self):
+        self._read_task.cancel()
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except OSError:
+            pass
+        try:
+            await self._read_task
+        except asyncio.CancelledError:
+            pass
+
+
+class AsyncClient(AsyncCommands):
+    # Spreads commands over a few multiplexed connections, picking the one
+    # with the fewest outstanding requests.
+    def __init__(self, connections):
+        self.connections = connections
+
+    @classmethod
+    async def connect(cls, host, port, password=None, connections=4, **kwargs):
+        conns = await asyncio.gather(
+            *(
+                AsyncConnection.connect(host, port, password, **kwargs)
+                for _ in range(connections)
+            )
+        )
+        return cls(list(conns))
+
+    async def execute_command(self, *args):
+        conn = min(self.connections, key=lambda c: c.pending)
+        return await conn.execute_command(*args)
+
+    async def close(self):
+        await asyncio.gather(*(conn.close() for conn in self.connections))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+class AsyncPubSub:
+    # A subscribed connection receives pushes at any time. Replies are read
+    # one at a time under _read_lock by whichever of the iterator and a
+    # (un)subscribe call needs the next one: confirmations are counted and
+    # messages are queued for the iterator, so neither loses the other's.
+    def __init__(self, reader, writer, encoding="utf-8"):
+        self._reader = reader
+        self._writer = writer
+        self.encoding = encoding
+        self.channels = set()
+        self.patterns = set()
+        self._messages = deque()
+        self._confirmed = 0
+        self._read_lock = asyncio.Lock()
+        self._send_lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, host, port, password=None, encoding="utf-8"):
+        reader, writer = await open_stream(host, port)
+        if password is not None:
+            writer.write(encode_command(["AUTH", password]))
+            reply = await read_response(reader, encoding)
+            if isinstance(reply, RespError):
+                writer.close()
+                raise reply
+        return cls(reader, writer, encoding)
+
+    async def _send(self, name, names):
+        # The server takes one channel per (P)SUBSCRIBE call, so each name is
+        # its own frame. Frames go out in batches of at most MAX_BATCH_BYTES,
+        # each written once every confirmation for the one before it has
+        # been read, so no frame is split across the server's 1024 byte reads.
+        async with self._send_lock:
+            for batch in frame_batches([encode_command([name, item]) for item in names]):
+                expected = self._confirmed + len(batch)
+                self._writer.write(b"".join(batch))
+                await self._writer.drain()
+                while self._confirmed < expected:
+                    async with self._read_lock:
+                        if self._confirmed < expected:
+                            try:
+                                await self._read_one()
+                            except asyncio.IncompleteReadError:
+                                raise ConnectionError(f"Connection closed before {name} was confirmed")
+
+    async def _read_one(self):
+        position = getattr(self._reader, "position", 0)
+        started = time.perf_counter()
+        reply = await read_response(self._reader, self.encoding)
+        recorder = latency.recorder
+        if recorder is not None and isinstance(reply, list) and reply:
+            # For pushes the recorded time is how long we waited for them.
+            recorder.record(
+                latency.command_name(reply[0]),
+                time.perf_counter() - started,
+                0,
+                getattr(self._reader, "position", 0) - position,
+            )
+        if isinstance(reply, RespError):
+            # A rejected (un)subscribe still answers its frame.
+            self._confirmed += 1
+            return
+        if not isinstance(reply, list) or not reply:
+            return
+        kind = reply[0]
+        if isinstance(kind, bytes):
+            kind = kind.decode()
+        if kind == "message":
+            self._messages.append(Message(kind, reply[1], reply[2], None))
+            return
+        if kind == "pmessage":
+            self._messages.append(Message(kind, reply[2], reply[3], reply[1]))
+            return
+        if kind == "subscribe":
+            self.channels.add(reply[1])
+        elif kind == "unsubscribe":
+            self.channels.discard(reply[1])
+        elif kind == "psubscribe":
+            self.patterns.add(reply[1])
+        elif kind == "punsubscribe":
+            self.patterns.discard(reply[1])
+        else:
+            return
+        self._confirmed += 1
+
+    async def subscribe(self, *channels):
+        await self._send("SUBSCRIBE", channels)
+
+    async def psubscribe(self, *patterns):
+        await self._send("PSUBSCRIBE", patterns)
+
+    async def unsubscribe(self, *channels):
+        await self._send("UNSUBSCRIBE", channels or list(self.channels))
+
+    async def punsubscribe(self, *patterns):
+        await self._send("PUNSUBSCRIBE", patterns or list(self.patterns))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._messages:
+            async with self._read_lock:
+                if self._messages:
+                    break
+                try:
+                    await self._read_one()
+                except asyncio.IncompleteReadError:
+                    raise StopAsyncIteration
+        return self._messages.popleft()
+
+    async def close(self):
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except OSError:
+            pass
+
@@ -0,0 +1,117 @@
+import argparse
+import threading
+import time
+
+from connection_pool import Connection
+from pubsub import POLICIES, Subscriber
+from script import AUTH_PASSWORD, MASTER_PORT
+
+
+def drain(subscriber):
+    for _ in subscriber:
+        pass
+
+
+def run_fanout(config):
+    # Every subscriber listens on the same channel (or a pattern matching
+    # it), so each PUBLISH is delivered `subscribers` times.
+    subscribers = []
+    consumers = []
+    try:
+        for _ in range(config["subscribers"]):
+            if config["policy"]:
+                subscriber = Subscriber(
+                    config["host"],
+                    config["port"],
+                    config["password"],
+                    maxsize=config["maxsize"],
+                    policy=config["policy"],
+                )
+                consumer = threading.Thread(target=drain, args=(subscriber,), daemon=True)
+                consumer.start()
+                consumers.append(consumer)
+            else:
+                subscriber = Subscriber(
+                    config["host"], config["port"], config["password"], callback=lambda m: None
+                )
+            subscribers.append(subscriber)
+            if config["pattern"]:
+                subscriber.psubscribe(config["pattern"])
+            else:
+                subscriber.subscribe(config["channel"])
+
+        publisher = Connection(config["host"], config["port"], config["password"])
+        payload = "x" * config["size"]
+        messages = config["messages"]
+        start = time.perf_counter()
+        try:
+            sent = 0
+            while sent < messages:
+                pipe = publisher.pipeline()
+                batch = min(config["pipeline"], messages - sent)
+                for _ in range(batch):
+                    pipe.execute_command("PUBLISH", config["channel"], payload)
+                pipe.execute()
+                sent += batch
+        finally:
+            publisher.close()
+        published = time.perf_counter() - start
+
+        deadline = time.monotonic() + config["timeout"]
+        while time.monotonic() < deadline:
+            if all(s.received >= messages for s in subscribers):
+                break
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - start
+    finally:
+        for subscriber in subscribers:
+            subscriber.close()
+        for consumer in consumers:
+            consumer.join()
+
+    received = sum(s.received for s in subscribers)
+    return {
+        "published_per_sec": messages / published,
+        "delivered_per_sec": received / elapsed,
+        "expected": messages * len(subscribers),
+        "received": received,
+        "delivered": sum(s.delivered for s in subscribers),
+        "dropped": sum(s.dropped for s in subscribers),
+        "elapsed": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pub/Sub fan-out benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=MASTER_PORT)
+    parser.add_argument("--password", default=AUTH_PASSWORD)
+    parser.add_argument("--subscribers", default="1,4,16", help="comma separated counts")
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--size", type=int, default=16, help="payload bytes")
+    parser.add_argument("--pipeline", type=int, default=16)
+    parser.add_argument("--channel", default="bench:fanout")
+    parser.add_argument("--pattern", help="PSUBSCRIBE to this glob instead")
+    parser.add_argument(
+        "--policy", choices=POLICIES, help="queue with this policy instead of a callback"
+    )
+    parser.add_argument("--maxsize", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    config = vars(args).copy()
+    print(
+        f"{'subscribers':>12}{'published/s':>14}{'delivered/s':>14}"
+        f"{'received':>12}{'expected':>12}{'dropped':>10}"
+    )
+    for count in args.subscribers.split(","):
+        config["subscribers"] = int(count)
+        result = run_fanout(config)
+        print(
+            f"{count:>12}{result['published_per_sec']:>14,.0f}{result['delivered_per_sec']:>14,.0f}"
+            f"{result['received']:>12}{result['expected']:>12}{result['dropped']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import shlex
+import socket
+import threading
+import time
+
+from resp import CommandEncoder, RespReader
+
+# Replies shaped like the ones script.py gets back from the server.
+SAMPLE_REPLIES = [
+    b"+OK\r\n",
+    b":42\r\n",
+    b"$-1\r\n",
+    b"$11\r\nearly_value\r\n",
+    b"-ERR unknown command\r\n",
+    b"$1024\r\n" + b"x" * 1024 + b"\r\n",
+    b"*6\r\n$1\r\nc\r\n$1\r\nb\r\n$1\r\na\r\n$1\r\nd\r\n$1\r\ne\r\n$1\r\nf\r\n",
+    b"*2\r\n*2\r\n$15\r\n1718000000000-0\r\n*2\r\n$6\r\nfield1\r\n$6\r\nvalue1\r\n"
+    b"*2\r\n$15\r\n1718000000001-0\r\n*2\r\n$6\r\nfield2\r\n$6\r\nvalue2\r\n",
+]
+
+
+# The byte-at-a-time reader script.py used before RespReader, kept as the
+# baseline.
+def legacy_read_line(sock):
+    line = b""
+    while not line.endswith(b"\r\n"):
+        part = sock.recv(1)
+        if not part:
+            raise ConnectionError("Socket closed")
+        line += part
+    return line[:-2]
+
+
+def legacy_read_bulk_string(sock):
+    length = int(legacy_read_line(sock))
+
+    if length == -1:
+        return "null"
+    data = b""
+    while len(data) < length + 2:
+        data += sock.recv(length + 2 - len(data))
+    return data[:-2].decode()
+
+
+def legacy_read_array(sock):
+    count = int(legacy_read_line(sock))
+    return [legacy_read_response(sock) for _ in range(count)]
+
+
+def legacy_read_response(sock):
+    prefix = sock.recv(1)
+    if not prefix:
+        raise ConnectionError("Socket closed")
+
+    if prefix == b"$":
+        return legacy_read_bulk_string(sock)
+    elif prefix == b"*":
+        return legacy_read_array(sock)
+    elif prefix == b":":
+        return int(legacy_read_line(sock))
+    elif prefix == b"+":
+        return legacy_read_line(sock).decode()
+    elif prefix == b"-":
+        return "ERR: " + legacy_read_line(sock).decode()
+    else:
+        return f"Unknown prefix: {prefix}"
+
+
+def legacy_encode(command):
+    parts = shlex.split(command.strip())
+    resp = f"*{len(parts)}\r\n"
+    for part in parts:
+        resp += f"${len(part)}\r\n{part}\r\n"
+    return resp.encode()
+
+
+def commands_per_second(encode, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        encode(i)
+    return rounds / (time.perf_counter() - start)
+
+
+def replies_per_second(make_read, rounds):
+    payload = b"".join(SAMPLE_REPLIES) * rounds
+    total = len(SAMPLE_REPLIES) * rounds
+    server, client = socket.socketpair()
+    try:
+        writer = threading.Thread(target=server.sendall, args=(payload,), daemon=True)
+        read = make_read(client)
+        start = time.perf_counter()
+        writer.start()
+        for _ in range(total):
+            read()
+        elapsed = time.perf_counter() - start
+        writer.join()
+    finally:
+        server.close()
+        client.close()
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare RESP reply parsing speed")
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    legacy = replies_per_second(
+        lambda sock: lambda: legacy_read_response(sock), args.rounds
+    )
+    buffered = replies_per_second(
+        lambda sock: RespReader(sock).read_response, args.rounds
+    )
+    print(f"{'reader':<12}{'replies/sec':>14}")
+    print(f"{'legacy':<12}{legacy:>14,.0f}")
+    print(f"{'RespReader':<12}{buffered:>14,.0f}")
+    print(f"speedup: {buffered / legacy:.1f}x")
+
+    rounds = args.rounds * 50
+    encoder = CommandEncoder()
+    legacy = commands_per_second(
+        lambda i: legacy_encode(f"ZADD myzset {i}.5 member{i}"), rounds
+    )
+    encoded = commands_per_second(
+        lambda i: encoder.encode("ZADD", "myzset", i + 0.5, f"member{i}"), rounds
+    )
+    print()
+    print(f"{'encoder':<16}{'commands/sec':>14}")
+    print(f"{'shlex + fstring':<16}{legacy:>14,.0f}")
+    print(f"{'CommandEncoder':<16}{encoded:>14,.0f}")
+    print(f"speedup: {encoded / legacy:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
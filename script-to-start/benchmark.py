@@ -0,0 +1,244 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import threading
+import time
+
+from cluster import Cluster
+from connection_pool import Connection
+from latency import LatencyHistogram
+from script import AUTH_PASSWORD, MASTER_PORT, SERVER_DLL
+
+INCRBY_SCRIPT = "return redis.call('incrby', KEYS[1], ARGV[1])"
+SCRIPT_SHA = hashlib.sha1(INCRBY_SCRIPT.encode()).hexdigest()
+
+
+# Each workload yields the argument lists for one logical operation.
+def get_set_ops(key, value):
+    return [("SET", key, value), ("GET", key)]
+
+
+def incrby_ops(key, value):
+    return [("INCRBY", key, 1)]
+
+
+def lpush_lpop_ops(key, value):
+    return [("LPUSH", key, value), ("LPOP", key)]
+
+
+def zadd_zrangebyscore_ops(key, value):
+    score = random.randrange(1000)
+    return [
+        ("ZADD", key, score, value + str(score)),
+        ("ZRANGEBYSCORE", key, score, score + 10),
+    ]
+
+
+def xadd_xrange_ops(key, value):
+    return [("XADD", key, "*", "field", value), ("XRANGE", key, "-", "+")]
+
+
+def evalsha_ops(key, value):
+    return [("EVALSHA", SCRIPT_SHA, 1, key, 1)]
+
+
+WORKLOADS = {
+    "get_set": get_set_ops,
+    "incrby": incrby_ops,
+    "lpush_lpop": lpush_lpop_ops,
+    "zadd_zrangebyscore": zadd_zrangebyscore_ops,
+    "xadd_xrange": xadd_xrange_ops,
+    "evalsha": evalsha_ops,
+}
+
+
+def run_client(config, workload, latencies, errors):
+    conn = Connection(config["host"], config["port"], config["password"])
+    try:
+        if workload == "evalsha":
+            conn.execute_command("SCRIPT", "LOAD", INCRBY_SCRIPT)
+        make_ops = WORKLOADS[workload]
+        value = "v" * config["value_size"]
+        keyspace = config["keyspace"]
+        remaining = config["requests"]
+        while remaining > 0:
+            batch = min(config["pipeline"], remaining)
+            remaining -= batch
+            pipe = conn.pipeline()
+            names = []
+            for _ in range(batch):
+                key = f"bench:{workload}:{random.randrange(keyspace)}"
+                for args in make_ops(key, value):
+                    pipe.execute_command(*args)
+                    names.append(args[0])
+            start = time.perf_counter()
+            replies = pipe.execute()
+            elapsed = time.perf_counter() - start
+            # Every command in a pipelined batch waits for the whole batch.
+            for name, reply in zip(names, replies):
+                histogram = latencies.get(name)
+                if histogram is None:
+                    histogram = latencies[name] = LatencyHistogram()
+                histogram.record(elapsed)
+                if isinstance(reply, Exception):
+                    errors[name] = errors.get(name, 0) + 1
+    finally:
+        conn.close()
+
+
+def run_worker(args):
+    config, workload, clients = args
+    results = [({}, {}) for _ in range(clients)]
+    threads = [
+        threading.Thread(target=run_client, args=(config, workload) + results[i])
+        for i in range(clients)
+    ]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    finished = time.time()
+
+    latencies, errors = {}, {}
+    for client_latencies, client_errors in results:
+        for name, histogram in client_latencies.items():
+            latencies.setdefault(name, LatencyHistogram()).merge(histogram)
+        for name, count in client_errors.items():
+            errors[name] = errors.get(name, 0) + count
+    latencies = {name: histogram.to_dict() for name, histogram in latencies.items()}
+    return started, finished, latencies, errors
+
+
+def run_workload(pool, config, workload):
+    processes = config["processes"]
+    clients = config["clients"]
+    shares = [clients // processes + (i < clients % processes) for i in range(processes)]
+    tasks = [(config, workload, share) for share in shares if share]
+    outcomes = pool.map(run_worker, tasks)
+
+    started = min(outcome[0] for outcome in outcomes)
+    finished = max(outcome[1] for outcome in outcomes)
+    elapsed = finished - started
+    latencies, errors = {}, {}
+    for _, _, worker_latencies, worker_errors in outcomes:
+        for name, data in worker_latencies.items():
+            histogram = LatencyHistogram.from_dict(data)
+            latencies.setdefault(name, LatencyHistogram()).merge(histogram)
+        for name, count in worker_errors.items():
+            errors[name] = errors.get(name, 0) + count
+
+    commands = {}
+    total = 0
+    for name, histogram in latencies.items():
+        total += histogram.count
+        commands[name] = {
+            "count": histogram.count,
+            "errors": errors.get(name, 0),
+            "ops_per_sec": histogram.count / elapsed,
+            "p50_ms": histogram.percentile(50) * 1000,
+            "p99_ms": histogram.percentile(99) * 1000,
+            "p999_ms": histogram.percentile(99.9) * 1000,
+            "histogram": histogram.to_dict(),
+        }
+    return {"elapsed_sec": elapsed, "ops_per_sec": total / elapsed, "commands": commands}
+
+
+def print_results(results):
+    header = f"{'workload':<20}{'command':<16}{'ops/sec':>12}{'p50 ms':>10}{'p99 ms':>10}{'p99.9 ms':>10}{'errors':>8}"
+    print(header)
+    print("-" * len(header))
+    for workload, result in results.items():
+        for name, stats in result["commands"].items():
+            print(
+                f"{workload:<20}{name:<16}{stats['ops_per_sec']:>12,.0f}"
+                f"{stats['p50_ms']:>10.3f}{stats['p99_ms']:>10.3f}"
+                f"{stats['p999_ms']:>10.3f}{stats['errors']:>8}"
+            )
+        print(f"{workload:<20}{'total':<16}{result['ops_per_sec']:>12,.0f}")
+
+
+def server_build(standin=False):
+    # The stand-in is not built from SERVER_DLL, so its hash would mislabel
+    # the results.
+    if standin:
+        return "standin"
+    if not os.path.isfile(SERVER_DLL):
+        return None
+    with open(SERVER_DLL, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Throughput/latency benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=MASTER_PORT)
+    parser.add_argument("--password", default=AUTH_PASSWORD)
+    parser.add_argument(
+        "--start", action="store_true", help="start master and replica first"
+    )
+    parser.add_argument(
+        "--standin", action="store_true", help="start in-process stand-in servers instead"
+    )
+    parser.add_argument("--tests", default=",".join(WORKLOADS))
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--requests", type=int, default=2000, help="per client")
+    parser.add_argument("--pipeline", type=int, default=1)
+    parser.add_argument("--keyspace", type=int, default=1000)
+    parser.add_argument("--value-size", type=int, default=16)
+    parser.add_argument("--json", help="write results to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    workloads = [name.strip() for name in args.tests.split(",") if name.strip()]
+    unknown = [name for name in workloads if name not in WORKLOADS]
+    if unknown:
+        raise SystemExit(f"Unknown tests: {', '.join(unknown)}")
+
+    config = {
+        "host": args.host,
+        "port": args.port,
+        "password": args.password,
+        "clients": args.clients,
+        "processes": max(1, min(args.processes, args.clients)),
+        "requests": args.requests,
+        "pipeline": args.pipeline,
+        "keyspace": args.keyspace,
+        "value_size": args.value_size,
+    }
+
+    cluster = None
+    try:
+        if args.start or args.standin:
+            # Free ports, and returns once the replica has synced.
+            cluster = Cluster(replicas=1, password=args.password, standin=args.standin).start()
+            config["host"], config["port"] = cluster.master
+
+        results = {}
+        with multiprocessing.Pool(config["processes"]) as pool:
+            for workload in workloads:
+                results[workload] = run_workload(pool, config, workload)
+    finally:
+        if cluster is not None:
+            cluster.stop()
+
+    print_results(results)
+    if args.json:
+        report = {
+            "timestamp": time.time(),
+            "server_build": server_build(args.standin),
+            "config": {k: v for k, v in config.items() if k != "password"},
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
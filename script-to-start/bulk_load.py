@@ -0,0 +1,279 @@
+import argparse
+import csv
+import json
+import queue
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+import latency
+from connection_pool import Connection
+from pipeline import MAX_BATCH_BYTES
+from resp import RespError, encode_command
+from script import AUTH_PASSWORD, MASTER_PORT
+
+LoadStats = namedtuple("LoadStats", ["records", "commands", "bytes", "errors", "elapsed"])
+
+
+def read_jsonl(path):
+    # One record per line:
+    #   {"type": "string", "key": "k", "value": "v", "px": 1000}
+    #   {"type": "list", "key": "k", "values": ["a", "b"]}
+    #   {"type": "zset", "key": "k", "members": {"a": 1.5}}
+    #   {"type": "stream", "key": "k", "entries": [{"id": "*", "fields": {"f": "v"}}]}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_csv(path):
+    # type,key,... with the remaining columns depending on the type:
+    #   string,k,value[,px]   list,k,item[,item...]
+    #   zset,k,score,member[,score,member...]   stream,k,id,field,value[,...]
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith("#"):
+                continue
+            record_type, key, rest = row[0].strip().lower(), row[1], row[2:]
+            if record_type == "string":
+                record = {"type": "string", "key": key, "value": rest[0]}
+                if len(rest) > 1 and rest[1]:
+                    record["px"] = int(rest[1])
+            elif record_type == "list":
+                record = {"type": "list", "key": key, "values": rest}
+            elif record_type == "zset":
+                record = {
+                    "type": "zset",
+                    "key": key,
+                    "members": [(rest[i + 1], rest[i]) for i in range(0, len(rest) - 1, 2)],
+                }
+            elif record_type == "stream":
+                fields = dict(zip(rest[1::2], rest[2::2]))
+                record = {"type": "stream", "key": key, "entries": [{"id": rest[0], "fields": fields}]}
+            else:
+                record = {"type": record_type, "key": key}
+            yield record
+
+
+READERS = {"jsonl": read_jsonl, "csv": read_csv}
+
+
+def record_commands(record, max_bytes=MAX_BATCH_BYTES):
+    record_type = record.get("type")
+    key = record["key"]
+    if record_type == "string":
+        if record.get("px") is not None:
+            yield ("SET", key, record["value"], "PX", record["px"])
+        else:
+            yield ("SET", key, record["value"])
+    elif record_type == "list":
+        # The server's RPUSH takes a single value.
+        for value in record["values"]:
+            yield ("RPUSH", key, value)
+    elif record_type == "zset":
+        members = record["members"]
+        if isinstance(members, dict):
+            members = members.items()
+        # Split into ZADDs that each fit in one in-flight window.
+        args = ["ZADD", key]
+        size = 0
+        for member, score in members:
+            pair = (score, member)
+            pair_size = len(str(score)) + len(str(member)) + 32
+            if len(args) > 2 and size + pair_size > max_bytes // 2:
+                yield tuple(args)
+                args, size = ["ZADD", key], 0
+            args.extend(pair)
+            size += pair_size
+        if len(args) > 2:
+            yield tuple(args)
+    elif record_type == "stream":
+        for entry in record["entries"]:
+            args = ["XADD", key, entry.get("id", "*")]
+            for field, value in entry["fields"].items():
+                args.extend((field, value))
+            yield tuple(args)
+    else:
+        raise ValueError(f"Unknown record type {record_type!r} for key {key!r}")
+
+
+def _shard(key, shards):
+    if shards == 1:
+        return 0
+    return zlib.crc32(key.encode() if isinstance(key, str) else bytes(key)) % shards
+
+
+def encode_batches(records, max_bytes=MAX_BATCH_BYTES, counter=None, shards=1):
+    # Yields (shard, payload, command count) with payloads of at most
+    # max_bytes; a single frame larger than that goes out on its own. All
+    # commands for one key land in the same shard, so sending each shard
+    # through one connection keeps a key's RPUSHes and XADDs in order.
+    buffers = [bytearray() for _ in range(shards)]
+    counts = [0] * shards
+    for record in records:
+        if counter is not None:
+            counter[0] += 1
+        shard = _shard(record["key"], shards)
+        buffer = buffers[shard]
+        for args in record_commands(record, max_bytes):
+            frame = encode_command(args)
+            if counts[shard] and len(buffer) + len(frame) > max_bytes:
+                yield shard, bytes(buffer), counts[shard]
+                buffer.clear()
+                counts[shard] = 0
+            buffer += frame
+            counts[shard] += 1
+    for shard, buffer in enumerate(buffers):
+        if counts[shard]:
+            yield shard, bytes(buffer), counts[shard]
+
+
+class BulkLoader:
+    # Batches are encoded on the calling thread and handed to one worker per
+    # connection through bounded queues, so a slow server stalls the reader
+    # instead of letting encoded data pile up in memory. Each key is routed
+    # to one worker by a hash of its name, so batches for the same key are
+    # never in flight on two connections at once. Each worker keeps a single
+    # batch (at most max_batch_bytes) unanswered at a time.
+    def __init__(
+        self,
+        host,
+        port,
+        password=None,
+        connections=4,
+        max_batch_bytes=MAX_BATCH_BYTES,
+        queue_size=64,
+    ):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.connections = connections
+        self.max_batch_bytes = max_batch_bytes
+        self.queue_size = queue_size
+        self.commands = 0
+        self.bytes = 0
+        self.errors = 0
+        self.first_error = None
+        self._failure = None
+        self._lock = threading.Lock()
+
+    def _worker(self, conn, batches):
+        reader = conn.reader
+        while True:
+            item = batches.get()
+            if item is None:
+                return
+            if self._failure is not None:
+                continue
+            payload, count = item
+            try:
+                start = time.perf_counter()
+                position = reader.position
+                conn.sock.sendall(payload)
+                replies = reader.read_responses(count)
+            except OSError as exc:
+                conn.broken = True
+                self._failure = exc
+                continue
+            recorder = latency.recorder
+            if recorder is not None:
+                recorder.record(
+                    "BULK", time.perf_counter() - start, len(payload), reader.position - position
+                )
+            errors = [reply for reply in replies if isinstance(reply, RespError)]
+            with self._lock:
+                self.commands += count
+                self.bytes += len(payload)
+                if errors:
+                    self.errors += len(errors)
+                    if self.first_error is None:
+                        self.first_error = errors[0]
+
+    def load(self, records, progress=None, progress_interval=1.0):
+        conns = [
+            Connection(self.host, self.port, self.password)
+            for _ in range(self.connections)
+        ]
+        shares = [queue.Queue(max(1, self.queue_size // len(conns))) for _ in conns]
+        workers = [
+            threading.Thread(target=self._worker, args=(conn, batches), daemon=True)
+            for conn, batches in zip(conns, shares)
+        ]
+        for worker in workers:
+            worker.start()
+
+        counter = [0]
+        started = time.perf_counter()
+        next_report = started + progress_interval
+        try:
+            for shard, payload, count in encode_batches(
+                records, self.max_batch_bytes, counter, len(conns)
+            ):
+                if self._failure is not None:
+                    break
+                shares[shard].put((payload, count))
+                if progress is not None and time.perf_counter() >= next_report:
+                    next_report += progress_interval
+                    progress(self.stats(counter[0], time.perf_counter() - started))
+        finally:
+            for batches in shares:
+                batches.put(None)
+            for worker in workers:
+                worker.join()
+            for conn in conns:
+                conn.close()
+
+        if self._failure is not None:
+            raise self._failure
+        return self.stats(counter[0], time.perf_counter() - started)
+
+    def stats(self, records, elapsed):
+        with self._lock:
+            return LoadStats(records, self.commands, self.bytes, self.errors, elapsed)
+
+
+def format_stats(stats):
+    elapsed = stats.elapsed or 1e-9
+    return (
+        f"{stats.records:,} records, {stats.commands:,} commands in {stats.elapsed:.1f}s "
+        f"({stats.commands / elapsed:,.0f} cmd/s, "
+        f"{stats.bytes / elapsed / 1_000_000:.2f} MB/s, {stats.errors} errors)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load JSONL or CSV records into the server")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=sorted(READERS), help="default: from extension")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=MASTER_PORT)
+    parser.add_argument("--password", default=AUTH_PASSWORD)
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--batch-bytes", type=int, default=MAX_BATCH_BYTES)
+    parser.add_argument("--queue", type=int, default=64, help="batches buffered ahead")
+    parser.add_argument("--progress", type=float, default=1.0, help="seconds between reports")
+    args = parser.parse_args()
+
+    record_format = args.format or ("csv" if args.path.endswith(".csv") else "jsonl")
+    loader = BulkLoader(
+        args.host,
+        args.port,
+        args.password,
+        connections=args.connections,
+        max_batch_bytes=args.batch_bytes,
+        queue_size=args.queue,
+    )
+    stats = loader.load(
+        READERS[record_format](args.path),
+        progress=lambda s: print(format_stats(s), flush=True),
+        progress_interval=args.progress,
+    )
+    print(format_stats(stats))
+    if loader.first_error is not None:
+        print(f"first error: {loader.first_error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import atexit
+import socket
+import sys
+import time
+from contextlib import contextmanager
+
+from connection_pool import Connection, write_token
+from logcapture import default_collector
+from resp import RespError
+from script import AUTH_PASSWORD, start_server, stop_servers
+from standin import StandInThread
+
+READY_KEY = "__cluster:ready"
+
+
+def free_port(host="127.0.0.1"):
+    # The port is free when this returns; the server binds it moments later.
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def _check_alive(proc, port):
+    if proc is not None and proc.poll() is not None:
+        raise RuntimeError(f"Server on port {port} exited with code {proc.returncode}")
+
+
+def _backoff(delay):
+    time.sleep(delay)
+    return min(delay * 2, 0.1)
+
+
+def wait_until_ready(host, port, password=None, timeout=10.0, proc=None):
+    # Ready means AUTH and PING both succeed, not just that the port accepts
+    # connections.
+    deadline = time.monotonic() + timeout
+    delay = 0.005
+    while True:
+        _check_alive(proc, port)
+        try:
+            conn = Connection(host, port, password, timeout=1.0)
+            try:
+                if conn.execute_command("PING") == "PONG":
+                    return
+            finally:
+                conn.close()
+        except (OSError, RespError):
+            pass
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Server on {host}:{port} not ready after {timeout}s")
+        delay = _backoff(delay)
+
+
+def wait_for_replica(master, replica, password=None, timeout=10.0, proc=None):
+    # A replica applies the master's writes in order, so once it serves a
+    # token written on the master now, the FULLRESYNC has finished and every
+    # earlier write has been applied too.
+    deadline = time.monotonic() + timeout
+    wait_until_ready(*replica, password, timeout, proc)
+    master_conn = Connection(*master, password)
+    try:
+        token = write_token(master_conn, READY_KEY, timeout)
+    finally:
+        master_conn.close()
+
+    conn = Connection(*replica, password)
+    try:
+        delay = 0.001
+        while conn.execute_command("GET", READY_KEY) != token:
+            _check_alive(proc, replica[1])
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Replica {replica[0]}:{replica[1]} did not catch up in {timeout}s")
+            delay = _backoff(delay)
+    finally:
+        conn.close()
+
+
+class Cluster:
+    # A master and its replicas on free ports, so independent runs can share
+    # a machine. start() and add_replica() return once each node is ready,
+    # replacing fixed sleeps. With standin=True the nodes are in-process
+    # stand-in servers instead of dotnet processes.
+    def __init__(self, replicas=1, password=AUTH_PASSWORD, standin=False, host="127.0.0.1", timeout=15.0):
+        self.replica_count = replicas
+        self.password = password
+        self.standin = standin
+        self.host = host
+        self.timeout = timeout
+        self.master = None
+        self.replicas = []
+        self.prefix = "case0:"
+        self._cases = 0
+        self._procs = {}
+        self._threads = {}
+
+    def _launch(self, replicaof=None):
+        if self.standin:
+            node = StandInThread(
+                host=self.host, password=self.password, replicaof=replicaof
+            ).start()
+            address = (self.host, node.port)
+            self._threads[address] = node
+            return address
+        port = free_port(self.host)
+        args = ["--authpass", self.password]
+        if replicaof is not None:
+            args += ["--replicaof", f"{replicaof[0]} {replicaof[1]}"]
+        self._procs[(self.host, port)] = start_server(port, args)
+        return self.host, port
+
+    def start(self):
+        try:
+            self.master = self._launch()
+            with self.logs_on_error(self.master):
+                wait_until_ready(
+                    *self.master, self.password, self.timeout, self._procs.get(self.master)
+                )
+            # Replicas boot in parallel; only the waits are sequential.
+            pending = [self._launch(self.master) for _ in range(self.replica_count)]
+            for replica in pending:
+                self._wait_replica(replica)
+                self.replicas.append(replica)
+        except BaseException:
+            self.stop()
+            raise
+        return self
+
+    def _wait_replica(self, replica):
+        with self.logs_on_error(replica):
+            wait_for_replica(
+                self.master, replica, self.password, self.timeout, self._procs.get(replica)
+            )
+
+    def dump_logs(self, address, n=None, file=None):
+        # Prints the captured output of a dotnet node; stand-ins have none.
+        name = str(address[1])
+        collector = default_collector()
+        if address in self._procs and name in collector.sources:
+            file = file or sys.stderr
+            print(f"--- server output from {address[0]}:{address[1]} ---", file=file)
+            collector.dump(name, n, file=file)
+
+    @contextmanager
+    def logs_on_error(self, address):
+        # For a block that starts or checks one node: if it fails, that
+        # node's server output is printed before the error propagates.
+        try:
+            yield
+        except BaseException:
+            self.dump_logs(address)
+            raise
+
+    def add_replica(self, wait=True):
+        # A late-joining replica, ready once it has been fully resynced. With
+        # wait=False the caller times or waits for the resync itself.
+        replica = self._launch(self.master)
+        if wait:
+            self._wait_replica(replica)
+        self.replicas.append(replica)
+        return replica
+
+    def process(self, address):
+        # The dotnet process behind a node, None for stand-ins.
+        return self._procs.get(address)
+
+    def wait_for_replicas(self):
+        for replica in self.replicas:
+            self._wait_replica(replica)
+
+    def reset(self):
+        # Runs FLUSHALL between cases. On memoryDb that only drops scripts and
+        # there is no DEL, so keys survive: cases should build their keys on
+        # self.prefix, which changes on every reset. Stand-ins are wiped.
+        self._cases += 1
+        self.prefix = f"case{self._cases}:"
+        for address in [self.master] + self.replicas:
+            conn = Connection(*address, self.password)
+            try:
+                conn.execute_command("FLUSHALL")
+            finally:
+                conn.close()
+        for node in self._threads.values():
+            node.reset()
+        self.wait_for_replicas()
+
+    def key(self, name):
+        return self.prefix + name
+
+    def stop(self):
+        for node in self._threads.values():
+            node.stop()
+        self._threads.clear()
+        stop_servers(list(self._procs.values()))
+        self._procs.clear()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+_shared = {}
+
+
+def shared_cluster(replicas=1, standin=False):
+    # One warm cluster per configuration for the whole process; each call
+    # after the first resets it for the next case.
+    key = (replicas, standin)
+    cluster = _shared.get(key)
+    if cluster is None:
+        cluster = _shared[key] = Cluster(replicas, standin=standin).start()
+        atexit.register(cluster.stop)
+    else:
+        cluster.reset()
+    return cluster
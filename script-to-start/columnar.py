@@ -0,0 +1,110 @@
+import math
+from array import array
+from collections import namedtuple
+
+import latency
+from resp import ProtocolError, RespError, RespReader
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Replies decoded into columns: one list of members and one packed array of
+# scores instead of a flat list of strings, and for streams one list of IDs
+# plus one list per field (None where an entry lacks the field).
+ScoredColumns = namedtuple("ScoredColumns", ["members", "scores"])
+StreamColumns = namedtuple("StreamColumns", ["ids", "fields"])
+
+
+def _as_numpy(values, use_numpy):
+    # array('d') and array('q') share their buffer with the NumPy array, so
+    # this does not copy.
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    if not use_numpy:
+        return values
+    if numpy is None:
+        raise RuntimeError("NumPy is not installed")
+    return numpy.frombuffer(values, dtype=numpy.float64 if values.typecode == "d" else numpy.int64)
+
+
+def read_scored(reader, use_numpy=None):
+    # Decodes a WITHSCORES reply (member, score, member, score, ...). Scores
+    # go straight into an array('d'), or a NumPy array when NumPy is
+    # available and use_numpy is not False.
+    count = reader.read_array_header()
+    if not isinstance(count, int):
+        return count
+    if count % 2:
+        raise ProtocolError(f"WITHSCORES reply has an odd length {count}")
+    members = []
+    scores = array("d")
+    for _ in range(count // 2):
+        members.append(reader.read_response())
+        scores.append(float(reader.read_response()))
+    return ScoredColumns(members, _as_numpy(scores, use_numpy))
+
+
+def read_stream(reader):
+    # Decodes an XRANGE reply into an ID column and one column per field.
+    count = reader.read_array_header()
+    if not isinstance(count, int):
+        return count
+    ids = []
+    fields = {}
+    for row in range(count):
+        entry_id, values = reader.read_response()
+        ids.append(entry_id)
+        for i in range(0, len(values), 2):
+            column = fields.get(values[i])
+            if column is None:
+                column = fields[values[i]] = [None] * row
+            column.append(values[i + 1])
+        for column in fields.values():
+            if len(column) == row:
+                column.append(None)
+    return StreamColumns(ids, fields)
+
+
+def _withscores(args):
+    # The server only honours WITHSCORES as the argument after the range.
+    return len(args) > 4 and isinstance(args[4], str) and args[4].upper() == "WITHSCORES"
+
+
+def execute_columnar(conn, *args, use_numpy=None):
+    # Like Connection.execute_command, but ZRANGE / ZRANGEBYSCORE WITHSCORES
+    # and XRANGE replies come back as columns. Other commands are decoded
+    # as usual. Error replies are returned, not raised.
+    name = latency.command_name(args[0])
+    if name in ("ZRANGE", "ZRANGEBYSCORE") and _withscores(args):
+        decode = lambda reader: read_scored(reader, use_numpy)
+    elif name == "XRANGE":
+        decode = read_stream
+    else:
+        decode = RespReader.read_response
+    return conn.execute_decoded(args, decode)
+
+
+def _number(reply, typecode):
+    if isinstance(reply, RespError):
+        raise reply
+    if reply is None:
+        # A missing member (ZSCORE) has no score.
+        if typecode != "d":
+            raise ValueError("Null reply cannot be stored in an integer column")
+        return math.nan
+    return float(reply) if typecode == "d" else int(reply)
+
+
+def execute_numbers(conn, commands, typecode="d", use_numpy=None):
+    # Runs a batch of commands with numeric replies (ZSCORE, INCRBY, LLEN,
+    # ...) through a pipeline and packs the replies into one array: 'd' for
+    # floats, with NaN for a null reply, or 'q' for integers. The first
+    # error reply is raised once the whole batch has been read.
+    pipeline = conn.pipeline()
+    for args in commands:
+        pipeline.execute_command(*args)
+    replies = pipeline.execute()
+    values = array(typecode, [_number(reply, typecode) for reply in replies])
+    return _as_numpy(values, use_numpy)
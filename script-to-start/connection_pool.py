@@ -0,0 +1,190 @@
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from pipeline import Pipeline
+from resp import RespError, RespReader, execute_decoded, reader_for
+
+
+class Connection:
+    def __init__(self, host, port, password=None, timeout=None):
+        self.host = host
+        self.port = port
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = reader_for(self.sock)
+        self.broken = False
+        self.last_used = time.monotonic()
+        if password is not None:
+            reply = self.execute_command("AUTH", password)
+            if isinstance(reply, RespError):
+                self.close()
+                raise reply
+
+    def execute_command(self, *args):
+        return self.execute_decoded(args, RespReader.read_response)
+
+    def execute_decoded(self, args, decode):
+        # decode(reader) reads the reply. If it fails part way the rest of
+        # the reply is still on the socket, so the connection is not reused.
+        try:
+            return execute_decoded(self.sock, args, decode)
+        except BaseException:
+            self.broken = True
+            raise
+        finally:
+            self.last_used = time.monotonic()
+
+    def pipeline(self, transaction=False):
+        return Pipeline(self.sock, transaction=transaction)
+
+    def ping(self):
+        try:
+            return self.execute_command("PING") == "PONG"
+        except OSError:
+            return False
+
+    def close(self):
+        self.broken = True
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def write_token(conn, key, timeout):
+    # Sets key to a fresh unique value for a caller that then waits up to
+    # `timeout` seconds for other nodes to serve it. memoryDb has no DEL
+    # and its FLUSHALL keeps keys, so the token expires a second after the
+    # wait would give up.
+    token = uuid.uuid4().hex
+    reply = conn.execute_command("SET", key, token, "PX", int((timeout + 1) * 1000))
+    if isinstance(reply, RespError):
+        raise reply
+    return token
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        host,
+        port,
+        password=None,
+        max_connections=16,
+        timeout=None,
+        health_check_interval=1.0,
+    ):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.max_connections = max_connections
+        self.timeout = timeout
+        # Connections idle for longer than this are PINGed before reuse;
+        # 0 checks on every checkout.
+        self.health_check_interval = health_check_interval
+        self._idle = deque()
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._created >= self.max_connections:
+                    if self._closed:
+                        raise ConnectionError("Connection pool is closed")
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(
+                            f"No free connection to {self.host}:{self.port}"
+                        )
+                    self._cond.wait(remaining)
+                if self._closed:
+                    raise ConnectionError("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    conn = None
+                    self._created += 1
+
+            if conn is None:
+                try:
+                    return Connection(self.host, self.port, self.password, self.timeout)
+                except BaseException:
+                    self._discard()
+                    raise
+
+            idle_for = time.monotonic() - conn.last_used
+            if idle_for < self.health_check_interval or conn.ping():
+                return conn
+            conn.close()
+            self._discard()
+
+    def release(self, conn):
+        if conn.broken or conn.reader.buffered:
+            conn.close()
+            self._discard()
+            return
+        with self._cond:
+            if self._closed:
+                conn.close()
+                self._created -= 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def _discard(self):
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except BaseException:
+            conn.broken = True
+            raise
+        finally:
+            self.release(conn)
+
+    def execute_command(self, *args):
+        with self.connection() as conn:
+            return conn.execute_command(*args)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(host, port, **kwargs):
+    # One shared pool per address and settings; callers asking for another
+    # password or size get a pool of their own.
+    key = (host, port, tuple(sorted(kwargs.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = _pools[key] = ConnectionPool(host, port, **kwargs)
+        return pool
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,286 @@
+import argparse
+import hashlib
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from connection_pool import get_pool, write_token
+from script import AUTH_PASSWORD, MASTER_PORT, REPLICA_PORT
+
+# Lists, zsets and streams with more elements than this are kept as a SHA1
+# digest instead of the full value, so comparing big keys stays cheap.
+DIGEST_THRESHOLD = 64
+# Keys fetched per pipelined batch, and the unit of work handed to a thread.
+CHUNK_SIZE = 500
+LAG_KEY = "__consistency:lag"
+# The server's ZRANGE does not accept negative indexes, so "everything" is
+# spelled as the largest index it can parse.
+ZRANGE_END = 2**31 - 1
+
+FETCH_COMMANDS = {
+    "string": lambda key: ("GET", key),
+    "list": lambda key: ("LRANGE", key, 0, -1),
+    "zset": lambda key: ("ZRANGE", key, 0, ZRANGE_END, "WITHSCORES"),
+    "stream": lambda key: ("XRANGE", key, "-", "+"),
+}
+
+Divergence = namedtuple("Divergence", ["key", "expected", "actual"])
+Report = namedtuple("Report", ["converged", "rounds", "elapsed", "divergent", "lag"])
+
+
+def parse_node(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def fingerprint(reply, threshold=DIGEST_THRESHOLD):
+    # Reduces a fetched value to something cheap to compare and store.
+    if not isinstance(reply, list):
+        return reply
+    items = _flatten(reply)
+    if len(reply) <= threshold:
+        return tuple(items)
+    digest = hashlib.sha1()
+    for item in items:
+        data = item if isinstance(item, bytes) else str(item).encode()
+        digest.update(b"%d:" % len(data))
+        digest.update(data)
+    return f"sha1:{len(reply)}:{digest.hexdigest()}"
+
+
+def _flatten(reply):
+    items = []
+    for item in reply:
+        if isinstance(item, list):
+            items.append("[")
+            items.extend(_flatten(item))
+            items.append("]")
+        else:
+            items.append(item)
+    return items
+
+
+class ReplicationChecker:
+    def __init__(
+        self,
+        master,
+        replicas,
+        password=None,
+        threshold=DIGEST_THRESHOLD,
+        chunk_size=CHUNK_SIZE,
+        workers=8,
+    ):
+        self.master = master
+        self.replicas = list(replicas)
+        self.password = password
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+        self.workers = workers
+        # Every node gets one pooled connection per worker thread.
+        self._pools = {
+            node: get_pool(*node, password=password, max_connections=workers)
+            for node in [master] + self.replicas
+        }
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _pipelined(self, node, commands):
+        with self._pools[node].connection() as conn:
+            pipe = conn.pipeline()
+            for args in commands:
+                pipe.execute_command(*args)
+            return pipe.execute()
+
+    def _map(self, node, items, func):
+        chunks = list(_chunks(items, self.chunk_size))
+        futures = [self._executor.submit(func, node, chunk) for chunk in chunks]
+        return [future.result() for future in futures]
+
+    def _detect_chunk(self, node, keys):
+        # TYPE only knows strings and streams on this server, so lists and
+        # zsets are told apart by their length.
+        replies = self._pipelined(
+            node,
+            [args for key in keys for args in (("TYPE", key), ("LLEN", key), ("ZCARD", key))],
+        )
+        types = {}
+        for i, key in enumerate(keys):
+            key_type, llen, zcard = replies[3 * i:3 * i + 3]
+            if key_type in FETCH_COMMANDS:
+                types[key] = key_type
+            elif isinstance(llen, int) and llen > 0:
+                types[key] = "list"
+            elif isinstance(zcard, int) and zcard > 0:
+                types[key] = "zset"
+            else:
+                types[key] = "string"
+        return types
+
+    def detect_types(self, keys):
+        types = {}
+        for chunk in self._map(self.master, list(keys), self._detect_chunk):
+            types.update(chunk)
+        return types
+
+    def _fetch_chunk(self, node, items):
+        replies = self._pipelined(node, [FETCH_COMMANDS[t](key) for key, t in items])
+        return {
+            key: fingerprint(reply, self.threshold)
+            for (key, _), reply in zip(items, replies)
+        }
+
+    def snapshot_all(self, types):
+        # Master and replicas are pulled at the same time so a key is read
+        # from every node within roughly the same window.
+        nodes = [self.master] + self.replicas
+        futures = {
+            node: [
+                self._executor.submit(self._fetch_chunk, node, chunk)
+                for chunk in _chunks(list(types.items()), self.chunk_size)
+            ]
+            for node in nodes
+        }
+        snapshots = {}
+        for node, node_futures in futures.items():
+            values = snapshots[node] = {}
+            for future in node_futures:
+                values.update(future.result())
+        return snapshots
+
+    def compare(self, types):
+        snapshots = self.snapshot_all(types)
+        expected = snapshots[self.master]
+        divergent = {}
+        for replica in self.replicas:
+            actual = snapshots[replica]
+            divergent[replica] = [
+                Divergence(key, value, actual.get(key))
+                for key, value in expected.items()
+                if actual.get(key) != value
+            ]
+        return divergent
+
+    def measure_lag(self, timeout=5.0, interval=0.001):
+        # Writes a unique token on the master and times how long each
+        # replica takes to serve it; None means it never showed up.
+        with self._pools[self.master].connection() as conn:
+            token = write_token(conn, LAG_KEY, timeout)
+        written = time.perf_counter()
+
+        def poll(replica):
+            with self._pools[replica].connection() as conn:
+                deadline = written + timeout
+                while True:
+                    if conn.execute_command("GET", LAG_KEY) == token:
+                        return time.perf_counter() - written
+                    if time.perf_counter() >= deadline:
+                        return None
+                    time.sleep(interval)
+
+        futures = {replica: self._executor.submit(poll, replica) for replica in self.replicas}
+        return {replica: future.result() for replica, future in futures.items()}
+
+    def wait_for_convergence(self, keys, timeout=10.0, interval=0.1):
+        # After the first full pass only keys that still differ somewhere are
+        # fetched again.
+        started = time.monotonic()
+        types = keys if isinstance(keys, dict) else self.detect_types(keys)
+        lag = self.measure_lag(timeout)
+        pending = dict(types)
+        rounds = 0
+        divergent = {}
+        while True:
+            rounds += 1
+            divergent = {
+                replica: diffs
+                for replica, diffs in self.compare(pending).items()
+                if diffs
+            }
+            elapsed = time.monotonic() - started
+            if not divergent or elapsed >= timeout:
+                return Report(not divergent, rounds, elapsed, divergent, lag)
+            keys_left = {d.key for diffs in divergent.values() for d in diffs}
+            pending = {key: types[key] for key in keys_left}
+            time.sleep(interval)
+
+
+def print_report(report, master):
+    state = "converged" if report.converged else "DIVERGED"
+    print(
+        f"{state} after {report.rounds} round(s) in {report.elapsed:.3f}s "
+        f"(master {master[0]}:{master[1]})"
+    )
+    for (host, port), lag in report.lag.items():
+        shown = "timed out" if lag is None else f"{lag * 1000:.2f} ms"
+        print(f"  replica {host}:{port} lag {shown}")
+    for (host, port), diffs in report.divergent.items():
+        print(f"  replica {host}:{port}: {len(diffs)} divergent key(s)")
+        for diff in diffs[:20]:
+            print(f"    {diff.key}: master={diff.expected!r} replica={diff.actual!r}")
+        if len(diffs) > 20:
+            print(f"    ... {len(diffs) - 20} more")
+
+
+def read_keys(args):
+    keys = {}
+    names = list(args.keys or [])
+    if args.keys_file:
+        with open(args.keys_file) as f:
+            names.extend(line.strip() for line in f if line.strip())
+    for name in names:
+        # "type:key" pins the type, plain keys are detected on the master.
+        key_type, sep, key = name.partition(":")
+        if sep and key_type in FETCH_COMMANDS:
+            keys[key] = key_type
+        else:
+            keys[name] = None
+    return keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check replicas against the master")
+    parser.add_argument("--master", default=f"127.0.0.1:{MASTER_PORT}")
+    parser.add_argument(
+        "--replica", action="append", help="host:port, may be repeated"
+    )
+    parser.add_argument("--password", default=AUTH_PASSWORD)
+    parser.add_argument("--keys", nargs="*", help="keys, optionally as type:key")
+    parser.add_argument("--keys-file", help="file with one key (or type:key) per line")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--interval", type=float, default=0.1)
+    parser.add_argument("--threshold", type=int, default=DIGEST_THRESHOLD)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    master = parse_node(args.master)
+    replicas = [parse_node(r) for r in args.replica or [f"127.0.0.1:{REPLICA_PORT}"]]
+    keys = read_keys(args)
+    if not keys:
+        raise SystemExit("No keys given (use --keys or --keys-file)")
+
+    with ReplicationChecker(
+        master, replicas, args.password, args.threshold, workers=args.workers
+    ) as checker:
+        unknown = [key for key, key_type in keys.items() if key_type is None]
+        if unknown:
+            keys.update(checker.detect_types(unknown))
+        report = checker.wait_for_convergence(keys, args.timeout, args.interval)
+    print_report(report, master)
+    raise SystemExit(0 if report.converged else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import json
+import threading
+from array import array
+
+# Log-linear buckets in the style of HdrHistogram: values are recorded in
+# microseconds, each power of two is split into SUB_BUCKETS linear buckets,
+# so every bucket is within ~6% of the value it holds.
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_VALUE_BITS = 40
+BUCKET_COUNT = (MAX_VALUE_BITS - SUB_BUCKET_BITS) * SUB_BUCKETS + 2 * SUB_BUCKETS
+MAX_VALUE = (1 << MAX_VALUE_BITS) - 1
+
+
+def bucket_index(value):
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return shift * SUB_BUCKETS + (value >> shift)
+
+
+def bucket_range(index):
+    if index < 2 * SUB_BUCKETS:
+        return index, index
+    shift = index // SUB_BUCKETS - 1
+    low = (index - shift * SUB_BUCKETS) << shift
+    return low, low + (1 << shift) - 1
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * BUCKET_COUNT))
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    def record(self, seconds):
+        value = int(seconds * 1_000_000)
+        if value > MAX_VALUE:
+            value = MAX_VALUE
+        elif value < 0:
+            value = 0
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total_us += value
+        if value > self.max_us:
+            self.max_us = value
+        if self.min_us is None or value < self.min_us:
+            self.min_us = value
+
+    def merge(self, other):
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.count += other.count
+        self.total_us += other.total_us
+        self.max_us = max(self.max_us, other.max_us)
+        if other.min_us is not None:
+            self.min_us = other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+        return self
+
+    def percentile(self, pct):
+        # Returned in seconds, using the upper edge of the matching bucket.
+        if not self.count:
+            return 0.0
+        target = max(1, -(-self.count * pct // 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(bucket_range(index)[1], self.max_us) / 1_000_000
+        return self.max_us / 1_000_000
+
+    @property
+    def mean(self):
+        return self.total_us / self.count / 1_000_000 if self.count else 0.0
+
+    def to_dict(self):
+        return {
+            "buckets": {str(i): c for i, c in enumerate(self.counts) if c},
+            "count": self.count,
+            "total_us": self.total_us,
+            "min_us": self.min_us,
+            "max_us": self.max_us,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        for index, count in data["buckets"].items():
+            histogram.counts[int(index)] = count
+        histogram.count = data["count"]
+        histogram.total_us = data["total_us"]
+        histogram.min_us = data["min_us"]
+        histogram.max_us = data["max_us"]
+        return histogram
+
+
+class CommandStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.bytes_sent += other.bytes_sent
+        self.bytes_received += other.bytes_received
+        return self
+
+    def to_dict(self):
+        return {
+            "latency": self.latency.to_dict(),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.latency = LatencyHistogram.from_dict(data["latency"])
+        stats.bytes_sent = data["bytes_sent"]
+        stats.bytes_received = data["bytes_received"]
+        return stats
+
+
+def command_name(name):
+    if isinstance(name, (bytes, bytearray)):
+        name = name.decode(errors="replace")
+    return str(name).upper()
+
+
+class Recorder:
+    # Each thread records into its own table so the hot path takes no lock;
+    # snapshot() merges the tables.
+    def __init__(self):
+        self._local = threading.local()
+        self._tables = []
+        self._lock = threading.Lock()
+
+    def _table(self):
+        table = getattr(self._local, "table", None)
+        if table is None:
+            table = self._local.table = {}
+            with self._lock:
+                self._tables.append(table)
+        return table
+
+    def record(self, name, seconds, sent=0, received=0):
+        table = self._table()
+        stats = table.get(name)
+        if stats is None:
+            stats = table[name] = CommandStats()
+        stats.latency.record(seconds)
+        stats.bytes_sent += sent
+        stats.bytes_received += received
+
+    def snapshot(self):
+        with self._lock:
+            tables = list(self._tables)
+        merged = {}
+        for table in tables:
+            for name, stats in list(table.items()):
+                merged.setdefault(name, CommandStats()).merge(stats)
+        return merged
+
+    def reset(self):
+        with self._lock:
+            for table in self._tables:
+                table.clear()
+
+
+def merge_snapshots(snapshots):
+    merged = {}
+    for snapshot in snapshots:
+        for name, stats in snapshot.items():
+            merged.setdefault(name, CommandStats()).merge(stats)
+    return merged
+
+
+def snapshot_to_dict(snapshot):
+    return {name: stats.to_dict() for name, stats in snapshot.items()}
+
+
+def snapshot_from_dict(data):
+    return {name: CommandStats.from_dict(stats) for name, stats in data.items()}
+
+
+def summarize(snapshot):
+    summary = {}
+    for name, stats in sorted(snapshot.items()):
+        latency = stats.latency
+        summary[name] = {
+            "count": latency.count,
+            "mean_ms": latency.mean * 1000,
+            "p50_ms": latency.percentile(50) * 1000,
+            "p99_ms": latency.percentile(99) * 1000,
+            "p999_ms": latency.percentile(99.9) * 1000,
+            "max_ms": latency.max_us / 1000,
+            "bytes_sent": stats.bytes_sent,
+            "bytes_received": stats.bytes_received,
+        }
+    return summary
+
+
+def format_table(snapshot):
+    header = (
+        f"{'command':<18}{'count':>10}{'mean ms':>10}{'p50 ms':>10}"
+        f"{'p99 ms':>10}{'p99.9 ms':>10}{'max ms':>10}{'sent':>12}{'received':>12}"
+    )
+    lines = [header, "-" * len(header)]
+    for name, row in summarize(snapshot).items():
+        lines.append(
+            f"{name:<18}{row['count']:>10}{row['mean_ms']:>10.3f}{row['p50_ms']:>10.3f}"
+            f"{row['p99_ms']:>10.3f}{row['p999_ms']:>10.3f}{row['max_ms']:>10.3f}"
+            f"{row['bytes_sent']:>12}{row['bytes_received']:>12}"
+        )
+    return "\n".join(lines)
+
+
+def to_json(snapshot):
+    return json.dumps(
+        {"summary": summarize(snapshot), "histograms": snapshot_to_dict(snapshot)},
+        indent=2,
+    )
+
+
+# Client code checks this before timing anything, so instrumentation costs a
+# single global lookup while disabled.
+recorder = None
+
+
+def enable():
+    global recorder
+    if recorder is None:
+        recorder = Recorder()
+    return recorder
+
+
+def disable():
+    global recorder
+    recorder = None
@@ -0,0 +1,230 @@
+import os
+import re
+import selectors
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+
+# Microsoft.Extensions.Logging short level names, lowest first. The server
+# logs with AddSimpleConsole(SingleLine, "hh:mm:ss "), so the level follows
+# the timestamp; lines without one (Console.WriteLine, stack traces) take
+# the level of the line before them.
+LEVELS = ("trce", "dbug", "info", "warn", "fail", "crit")
+LEVEL_PATTERN = re.compile(rb"^(?:\d\d:\d\d:\d\d )?(trce|dbug|info|warn|fail|crit): ")
+
+LogLine = namedtuple("LogLine", ["time", "stream", "level", "text"])
+LogStats = namedtuple("LogStats", ["lines", "bytes", "filtered", "per_sec", "levels"])
+
+
+class LogSource:
+    def __init__(self, name, capacity):
+        self.name = name
+        self.ring = deque(maxlen=capacity)
+        self.lines = 0
+        self.bytes = 0
+        self.filtered = 0
+        self.levels = dict.fromkeys(LEVELS, 0)
+        # (second, lines) buckets for the rate counter.
+        self.window = deque()
+
+
+class LogCollector:
+    # One thread reads the stdout/stderr pipes of every server process
+    # through a selector, in chunk_size reads, so a chatty server never
+    # blocks on a full pipe. The last `capacity` lines per process are kept
+    # in a ring buffer; nothing reaches the console unless echo is set or
+    # dump() is called. `level` drops lines below that level before they
+    # are stored (they are still counted).
+    #
+    # select() only takes sockets on Windows, so there each pipe gets its
+    # own chunked reader thread instead and there is no selector thread.
+    def __init__(self, capacity=10000, level=None, echo=False, chunk_size=64 * 1024, rate_window=5.0):
+        self.capacity = capacity
+        self.level = level
+        self.echo = echo
+        self.chunk_size = chunk_size
+        self.rate_window = rate_window
+        self.sources = {}
+        self._pending = []
+        self._lock = threading.Lock()
+        self._store_lock = threading.Lock()
+        self._closed = False
+        self._selector = None
+        self._thread = None
+        if os.name == "nt":
+            return
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def level(self):
+        return LEVELS[self.min_level]
+
+    @level.setter
+    def level(self, level):
+        # Applies to lines read from now on.
+        if level is not None and level not in LEVELS:
+            raise ValueError(f"Unknown log level {level!r}")
+        self.min_level = LEVELS.index(level) if level else 0
+
+    def add(self, proc, name):
+        # Registration happens on the collector thread; the selector is not
+        # safe to modify while another thread sits in select().
+        with self._lock:
+            source = self.sources.get(name)
+            if source is None:
+                source = self.sources[name] = LogSource(name, self.capacity)
+            for stream, tag in ((proc.stdout, "STDOUT"), (proc.stderr, "STDERR")):
+                if stream is None:
+                    continue
+                if self._selector is None:
+                    threading.Thread(
+                        target=self._drain, args=(stream, self._state(tag, source)), daemon=True
+                    ).start()
+                else:
+                    os.set_blocking(stream.fileno(), False)
+                    self._pending.append((stream, tag, source))
+        if self._selector is not None:
+            os.write(self._wake_w, b"\0")
+
+    @staticmethod
+    def _state(tag, source):
+        # [tag, source, partial line, level of the last line]
+        return [tag, source, b"", LEVELS.index("info")]
+
+    def _drain(self, stream, state):
+        while True:
+            chunk = stream.read1(self.chunk_size)
+            if not chunk:
+                break
+            self._feed(state, chunk)
+        self._feed(state, b"")
+        stream.close()
+
+    def _run(self):
+        while not self._closed:
+            for key, _ in self._selector.select(timeout=1.0):
+                if key.fileobj == self._wake_r:
+                    self._register_pending()
+                    continue
+                self._read(key)
+
+    def _register_pending(self):
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for stream, tag, source in pending:
+            self._selector.register(stream, selectors.EVENT_READ, self._state(tag, source))
+
+    def _read(self, key):
+        stream = key.fileobj
+        try:
+            chunk = os.read(stream.fileno(), self.chunk_size)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b""
+        if not chunk:
+            self._selector.unregister(stream)
+            stream.close()
+        self._feed(key.data, chunk)
+
+    def _feed(self, state, chunk):
+        # An empty chunk means EOF and flushes the unterminated last line.
+        if not chunk:
+            if state[2]:
+                lines, state[2] = [state[2]], b""
+                with self._store_lock:
+                    self._store(state, lines)
+            return
+        lines = (state[2] + chunk).split(b"\n")
+        state[2] = lines.pop()
+        with self._store_lock:
+            self._store(state, lines)
+
+    def _store(self, state, lines):
+        tag, source = state[0], state[1]
+        now = time.time()
+        for line in lines:
+            match = LEVEL_PATTERN.match(line)
+            if match is not None:
+                state[3] = LEVELS.index(match.group(1).decode())
+            level = state[3]
+            source.bytes += len(line) + 1
+            source.levels[LEVELS[level]] += 1
+            if level < self.min_level:
+                source.filtered += 1
+                continue
+            entry = LogLine(now, tag, LEVELS[level], line.rstrip(b"\r"))
+            source.ring.append(entry)
+            if self.echo:
+                print(f"[{source.name} {tag}] {entry.text.decode(errors='replace')}")
+        source.lines += len(lines)
+        second = int(now)
+        if source.window and source.window[-1][0] == second:
+            source.window[-1][1] += len(lines)
+        else:
+            source.window.append([second, len(lines)])
+        while source.window and source.window[0][0] <= second - self.rate_window:
+            source.window.popleft()
+
+    def tail(self, name, n=None):
+        ring = list(self.sources[name].ring)
+        if n is not None:
+            ring = ring[-n:]
+        return [f"[{name} {line.stream}] {line.text.decode(errors='replace')}" for line in ring]
+
+    def dump(self, name=None, n=None, file=None):
+        file = file or sys.stdout
+        for source_name in [name] if name is not None else list(self.sources):
+            for text in self.tail(source_name, n):
+                print(text, file=file)
+
+    def stats(self):
+        now = int(time.time())
+        result = {}
+        for name, source in list(self.sources.items()):
+            recent = sum(count for second, count in list(source.window) if second > now - self.rate_window)
+            result[name] = LogStats(
+                source.lines,
+                source.bytes,
+                source.filtered,
+                recent / self.rate_window,
+                dict(source.levels),
+            )
+        return result
+
+    def close(self):
+        self._closed = True
+        if self._selector is None:
+            # The reader threads end, and close their pipes, at EOF.
+            return
+        os.write(self._wake_w, b"\0")
+        self._thread.join()
+        for key in list(self._selector.get_map().values()):
+            if key.fileobj != self._wake_r:
+                key.fileobj.close()
+        self._selector.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_collector():
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = LogCollector()
+        return _default
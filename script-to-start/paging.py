@@ -0,0 +1,249 @@
+import itertools
+import time
+from contextlib import nullcontext
+
+from resp import ProtocolError, RespError, encode_command
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_WINDOW_MS = 1000
+
+# Upper sequence bound for a whole-millisecond XRANGE window. memoryDb
+# compares stream IDs as strings, so the bound has to sort after every int32
+# sequence as text as well as numerically.
+SEQ_MAX = 9999999999
+
+
+def _checkout(client):
+    # A pool lends one connection for the whole scan; a Connection is used
+    # as is.
+    if hasattr(client, "connection"):
+        return client.connection()
+    return nullcontext(client)
+
+
+class _Probe(tuple):
+    # Request arguments whose reply only sizes later requests; its items are
+    # read and dropped instead of being yielded.
+    pass
+
+
+def _paged(client, plan, chunk_size, prefetch, width=1):
+    # plan is a generator that yields the arguments of each page request and
+    # is sent the number of items in each reply; it returns after the last
+    # page. Replies are decoded chunk_size items at a time, so an oversized
+    # reply never has to be held whole. The item count is known from the
+    # array header, so with prefetch the next request is written before the
+    # current page is decoded and the server builds it while the caller works
+    # through this one. Without prefetch it is sent when the caller asks for
+    # the page after.
+    #
+    # A caller that stops early (break, close()) leaves the rest of the
+    # current reply, and with prefetch the next one, on the wire; they are
+    # read off and dropped so the connection stays usable. Only an error
+    # part way through a reply closes it.
+    with _checkout(client) as conn:
+        sock, reader = conn.sock, conn.reader
+        unread = 0
+        count = 0
+        try:
+            args = next(plan, None)
+            if args is not None:
+                sock.sendall(encode_command(args))
+                unread += 1
+            while args is not None:
+                current = args
+                count = reader.read_array_header()
+                if isinstance(count, RespError):
+                    unread -= 1
+                    raise count
+                if not isinstance(count, int):
+                    unread -= 1
+                    raise ProtocolError(f"Expected an array reply to {args[0]}, got {count!r}")
+                count //= width
+                if count == 0:
+                    unread -= 1
+                try:
+                    args = plan.send(count)
+                except StopIteration:
+                    args = None
+                if prefetch and args is not None:
+                    sock.sendall(encode_command(args))
+                    unread += 1
+                keep = not isinstance(current, _Probe)
+                while count > 0:
+                    size = min(count, chunk_size)
+                    page = reader.read_responses(size * width)
+                    count -= size
+                    if count == 0:
+                        unread -= 1
+                    if keep:
+                        yield page
+                if not prefetch and args is not None:
+                    sock.sendall(encode_command(args))
+                    unread += 1
+        except GeneratorExit:
+            if unread:
+                try:
+                    _discard(reader, unread, count, chunk_size, width)
+                    unread = 0
+                except OSError:
+                    pass
+            raise
+        finally:
+            if unread:
+                # Replies are still on the wire, so the connection cannot
+                # serve another command.
+                conn.close()
+
+
+def _discard(reader, unread, remaining, chunk_size, width):
+    # Drops the last `remaining` items of the reply being read (0 if none is
+    # part read) and then every reply still to come, a chunk at a time.
+    if remaining:
+        unread -= 1
+    while True:
+        while remaining > 0:
+            size = min(remaining, chunk_size)
+            reader.read_responses(size * width)
+            remaining -= size
+        if not unread:
+            return
+        unread -= 1
+        count = reader.read_array_header()
+        remaining = count // width if isinstance(count, int) else 0
+
+
+def _index_plan(command, key, start, stop, page_size, extra=()):
+    if start < 0 or stop < -1:
+        raise ValueError("Only non-negative indexes and a stop of -1 can be paged")
+    while True:
+        last = start + page_size - 1
+        if stop != -1 and last >= stop:
+            last = stop
+        count = yield (command, key, start, last, *extra)
+        if count < last - start + 1 or last == stop:
+            return
+        start = last + 1
+
+
+def _parse_id(text, default_seq):
+    ms, sep, seq = text.partition("-")
+    return int(ms), int(seq) if sep else default_seq
+
+
+def _window(key, lower, upper, end="+", hi_ms=None):
+    end_arg = end if upper == hi_ms else f"{upper}-{SEQ_MAX}"
+    return ("XRANGE", key, f"{lower}-0", end_arg)
+
+
+def _rescale(width, count, page_size):
+    # Empty windows double; others are resized towards page_size entries.
+    if count == 0:
+        return width * 2
+    return max(width * page_size // count, 1)
+
+
+def _xrange_plan(key, start, end, page_size, window_ms):
+    # XRANGE takes no COUNT, so pages are millisecond windows. A scan from
+    # "-" does not know where the stream begins, and galloping forwards from
+    # ms 0 would end in one window holding most of the stream. Instead it
+    # first walks back from the end of the range (now for "+") in windows
+    # sized from each reply, dropping what they return, down to ms 0; empty
+    # stretches cost one doubling probe each, and a window holding more than
+    # twice page_size is probed again narrower. It then reads the windows
+    # that held entries again, oldest first, so every page reply stays
+    # within twice page_size unless a single millisecond holds more. The
+    # stream is sent twice; a scan that resumes from a known ID skips the
+    # walk.
+    hi_ms = None if end == "+" else _parse_id(end, SEQ_MAX)[0]
+    if start == "-":
+        top = hi_ms if hi_ms is not None else int(time.time() * 1000)
+        windows = []
+        upper, width = top, 1
+        while upper >= 0:
+            lower = max(upper - width + 1, 0)
+            count = yield _Probe(_window(key, lower, upper, end, hi_ms))
+            if count > 2 * page_size and width > 1:
+                # Overshot into the stream after a run of empty windows:
+                # probe the same end again with a narrower window.
+                width = _rescale(width, count, page_size)
+                continue
+            if count:
+                windows.append((lower, upper))
+            width = _rescale(width, count, page_size)
+            upper = lower - 1
+        for lower, upper in reversed(windows):
+            yield _window(key, lower, upper, end, hi_ms)
+        if hi_ms is not None:
+            return
+        lo_ms, lo_seq = top + 1, 0
+    else:
+        lo_ms, lo_seq = _parse_id(start, 0)
+
+    # Forwards from a known ID, each window starting after the last. The
+    # last window of an open-ended scan ends in "+", which also picks up
+    # anything written while the scan was running.
+    width = max(int(window_ms), 1)
+    while True:
+        window_end = lo_ms + width - 1
+        if hi_ms is not None and window_end >= hi_ms:
+            last, end_arg = True, end
+        elif hi_ms is None and window_end >= time.time() * 1000:
+            last, end_arg = True, "+"
+        else:
+            last, end_arg = False, f"{window_end}-{SEQ_MAX}"
+        count = yield ("XRANGE", key, f"{lo_ms}-{lo_seq}", end_arg)
+        if last:
+            return
+        lo_ms, lo_seq = window_end + 1, 0
+        width = _rescale(width, count, page_size)
+
+
+def lrange_pages(client, key, start=0, stop=-1, page_size=DEFAULT_PAGE_SIZE, prefetch=False):
+    # LRANGE in index windows of page_size elements.
+    plan = _index_plan("LRANGE", key, start, stop, page_size)
+    return _paged(client, plan, page_size, prefetch)
+
+
+def zrange_pages(
+    client, key, start=0, stop=-1, withscores=False, page_size=DEFAULT_PAGE_SIZE, prefetch=False
+):
+    # ZRANGE in rank windows; the server rejects negative ranks, so stop=-1
+    # means "to the end" and is never sent. With withscores each item is a
+    # (member, score) tuple with the score as the server formats it. Writes
+    # made during the scan can shift ranks across a page boundary, the same
+    # as with any cursor over a live sorted set.
+    extra = ("WITHSCORES",) if withscores else ()
+    plan = _index_plan("ZRANGE", key, start, stop, page_size, extra)
+    pages = _paged(client, plan, page_size, prefetch, width=2 if withscores else 1)
+    if not withscores:
+        return pages
+    return ([(page[i], page[i + 1]) for i in range(0, len(page), 2)] for page in pages)
+
+
+def xrange_pages(
+    client,
+    key,
+    start="-",
+    end="+",
+    page_size=DEFAULT_PAGE_SIZE,
+    window_ms=DEFAULT_WINDOW_MS,
+    prefetch=False,
+):
+    # XRANGE by advancing millisecond windows from the last one read. Pages
+    # hold at most page_size [id, [field, value, ...]] entries; a window that
+    # turns out larger is split into several pages on the client side.
+    plan = _xrange_plan(key, start, end, page_size, window_ms)
+    return _paged(client, plan, page_size, prefetch)
+
+
+def iter_lrange(client, key, **kwargs):
+    return itertools.chain.from_iterable(lrange_pages(client, key, **kwargs))
+
+
+def iter_zrange(client, key, **kwargs):
+    return itertools.chain.from_iterable(zrange_pages(client, key, **kwargs))
+
+
+def iter_xrange(client, key, **kwargs):
+    return itertools.chain.from_iterable(xrange_pages(client, key, **kwargs))
@@ -0,0 +1,119 @@
+import shlex
+import time
+
+import latency
+from resp import CommandEncoder, RespError, reader_for
+
+# RedisServerListener reads each connection into a 1024 byte buffer and drops
+# a command that is split across two reads, so a pipeline never keeps more
+# than this many request bytes in flight.
+MAX_BATCH_BYTES = 1024
+
+
+def frame_batches(frames, max_bytes=MAX_BATCH_BYTES):
+    # Groups encoded frames into runs of at most max_bytes for callers that
+    # send each run only once the one before it has been answered; a larger
+    # frame goes alone.
+    batch, size = [], 0
+    for frame in frames:
+        if batch and size + len(frame) > max_bytes:
+            yield batch
+            batch, size = [], 0
+        batch.append(frame)
+        size += len(frame)
+    if batch:
+        yield batch
+
+
+class Pipeline:
+    def __init__(self, sock, transaction=False, max_batch_bytes=MAX_BATCH_BYTES):
+        self.sock = sock
+        self.transaction = transaction
+        self.max_batch_bytes = max_batch_bytes
+        self._encoder = CommandEncoder()
+        self._offsets = []
+        self._names = []
+        self.reset()
+
+    def __len__(self):
+        return len(self._offsets) - (1 if self.transaction else 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.reset()
+
+    def command(self, command):
+        return self.execute_command(*shlex.split(command.strip()))
+
+    def execute_command(self, *args):
+        self._offsets.append(self._encoder.append(*args))
+        self._names.append(args[0])
+        return self
+
+    def reset(self):
+        self._encoder.clear()
+        self._offsets = []
+        self._names = []
+        if self.transaction:
+            self.execute_command("MULTI")
+
+    def execute(self):
+        if not len(self):
+            return []
+        if self.transaction:
+            self.execute_command("EXEC")
+
+        try:
+            replies = self._send()
+        finally:
+            self.reset()
+
+        if not self.transaction:
+            return replies
+
+        result = replies[-1]
+        if not isinstance(result, list):
+            if isinstance(result, RespError):
+                raise result
+            raise RespError(f"EXEC failed: {result!r}")
+        return result
+
+    def _send(self):
+        reader = reader_for(self.sock)
+        recorder = latency.recorder
+        replies = []
+        start = 0
+        previous = 0
+        first = 0
+        with memoryview(self._encoder.buffer) as data:
+            for index, end in enumerate(self._offsets):
+                if index > first and end - start > self.max_batch_bytes:
+                    self._flush(reader, recorder, data, start, first, index, replies)
+                    start = previous
+                    first = index
+                previous = end
+            self._flush(reader, recorder, data, start, first, len(self._offsets), replies)
+        return replies
+
+    def _flush(self, reader, recorder, data, start, first, last, replies):
+        end = self._offsets[last - 1]
+        if recorder is None:
+            self.sock.sendall(data[start:end])
+            replies.extend(reader.read_responses(last - first))
+            return
+
+        # Every command in a window waits for the whole window to be sent.
+        started = time.perf_counter()
+        self.sock.sendall(data[start:end])
+        for index in range(first, last):
+            position = reader.position
+            replies.append(reader.read_response())
+            frame_start = self._offsets[index - 1] if index else 0
+            recorder.record(
+                latency.command_name(self._names[index]),
+                time.perf_counter() - started,
+                self._offsets[index] - frame_start,
+                reader.position - position,
+            )
@@ -0,0 +1,219 @@
+import socket
+import threading
+import time
+from collections import deque
+
+import latency
+from aio_client import Message
+from connection_pool import Connection
+from pipeline import frame_batches
+from resp import RespError, encode_command
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+CONFIRMATIONS = ("subscribe", "unsubscribe", "psubscribe", "punsubscribe")
+
+
+class Subscriber:
+    # One connection carries every channel and pattern. A background thread
+    # frames pushes with the shared RespReader and hands them to `callback`
+    # (on that thread) or to a bounded queue read with get() / iteration.
+    #
+    # With the "block" policy a full queue stops the reader thread, which lets
+    # the socket back up; note PublishService sends synchronously, so that
+    # eventually slows PUBLISH itself. The drop policies never stall.
+    # received == delivered + dropped + len(self) at any quiet moment.
+    #
+    # An exception raised by the callback closes the subscriber like a lost
+    # connection does: it is kept in `error` and raised as the cause of the
+    # ConnectionError from later calls.
+    def __init__(
+        self,
+        host,
+        port,
+        password=None,
+        callback=None,
+        maxsize=10000,
+        policy=BLOCK,
+        timeout=None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy!r}")
+        self.callback = callback
+        self.maxsize = maxsize
+        self.policy = policy
+        self.timeout = timeout
+        self.channels = set()
+        self.patterns = set()
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.error = None
+        self._conn = Connection(host, port, password)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._confirmations = deque()
+        self._command_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _command(self, name, names):
+        # The server takes one channel per call, so each name is its own
+        # frame. Frames go out in batches of at most MAX_BATCH_BYTES, each
+        # sent once the one before it is confirmed, so no frame is split
+        # across the server's reads; the confirmations are returned in order.
+        if not names:
+            return []
+        with self._command_lock:
+            if self._closed:
+                raise ConnectionError("Subscriber is closed") from self.error
+            deadline = None if self.timeout is None else time.monotonic() + self.timeout
+            replies = []
+            for batch in frame_batches([encode_command([name, item]) for item in names]):
+                self._conn.sock.sendall(b"".join(batch))
+                expected = len(replies) + len(batch)
+                with self._cond:
+                    while len(replies) < expected:
+                        if self._confirmations:
+                            replies.append(self._confirmations.popleft())
+                            continue
+                        if self._closed:
+                            raise ConnectionError("Subscriber is closed") from self.error
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            raise TimeoutError(f"No reply to {name}")
+                        self._cond.wait(remaining)
+            return replies
+
+    def subscribe(self, *channels):
+        return self._command("SUBSCRIBE", channels)
+
+    def psubscribe(self, *patterns):
+        return self._command("PSUBSCRIBE", patterns)
+
+    def unsubscribe(self, *channels):
+        return self._command("UNSUBSCRIBE", channels or sorted(self.channels))
+
+    def punsubscribe(self, *patterns):
+        return self._command("PUNSUBSCRIBE", patterns or sorted(self.patterns))
+
+    def _run(self):
+        reader = self._conn.reader
+        try:
+            while True:
+                position = reader.position
+                started = time.perf_counter()
+                reply = reader.read_response()
+                recorder = latency.recorder
+                if recorder is not None and isinstance(reply, list) and reply:
+                    # For pushes the recorded time is how long we waited for them.
+                    recorder.record(
+                        latency.command_name(reply[0]),
+                        time.perf_counter() - started,
+                        0,
+                        reader.position - position,
+                    )
+                self._dispatch(reply)
+        except Exception as exc:
+            if not self._closed:
+                self.error = exc
+        finally:
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+            self._conn.close()
+
+    def _dispatch(self, reply):
+        if isinstance(reply, RespError) or not isinstance(reply, list) or not reply:
+            self._confirm(reply)
+            return
+        kind = reply[0]
+        if kind == "message":
+            message = Message(kind, reply[1], reply[2], None)
+        elif kind == "pmessage":
+            message = Message(kind, reply[2], reply[3], reply[1])
+        else:
+            if kind in CONFIRMATIONS:
+                subscriptions = self.patterns if kind[0] == "p" else self.channels
+                if kind.endswith("unsubscribe"):
+                    subscriptions.discard(reply[1])
+                else:
+                    subscriptions.add(reply[1])
+            self._confirm(reply)
+            return
+
+        self.received += 1
+        if self.callback is not None:
+            self.callback(message)
+            self.delivered += 1
+            return
+        with self._cond:
+            if len(self._queue) >= self.maxsize:
+                if self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                if self.policy == DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._queue) >= self.maxsize and not self._closed:
+                        self._cond.wait()
+            self._queue.append(message)
+            self._cond.notify_all()
+
+    def _confirm(self, reply):
+        with self._cond:
+            self._confirmations.append(reply)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._queue:
+                if self._closed:
+                    raise ConnectionError("Subscriber is closed") from self.error
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("No message received")
+                self._cond.wait(remaining)
+            message = self._queue.popleft()
+            self.delivered += 1
+            self._cond.notify_all()
+            return message
+
+    def __iter__(self):
+        # Ends once the subscriber is closed and the queue is drained.
+        while True:
+            try:
+                yield self.get()
+            except ConnectionError:
+                return
+
+    def close(self):
+        with self._cond:
+            already_closed = self._closed
+            self._closed = True
+            self._cond.notify_all()
+        if not already_closed:
+            # shutdown() wakes the reader thread out of recv; close() alone
+            # does not on every platform.
+            try:
+                self._conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._conn.close()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
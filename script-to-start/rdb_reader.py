@@ -0,0 +1,356 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+OP_AUX = 0xFA
+OP_RESIZEDB = 0xFB
+OP_EXPIRETIME_MS = 0xFC
+OP_EXPIRETIME = 0xFD
+OP_SELECTDB = 0xFE
+OP_EOF = 0xFF
+
+# Value types as written by RdbFile/RdbFileBuilderService.cs.
+TYPE_STRING = 0x00
+TYPE_LIST = 0x02
+TYPE_ZSET = 0x03
+TYPE_STREAM = 0x15
+
+TYPE_NAMES = {
+    TYPE_STRING: "string",
+    TYPE_LIST: "list",
+    TYPE_ZSET: "zset",
+    TYPE_STREAM: "stream",
+}
+
+# value is None when the reader skips values; length is the element count
+# (string length for strings) and size the number of bytes in the file.
+Entry = namedtuple("Entry", ["db", "key", "type", "value", "length", "expire_ms", "size"])
+
+
+class RdbError(ValueError):
+    pass
+
+
+def lzf_decompress(data, expected):
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        ctrl = data[i]
+        i += 1
+        if ctrl < 32:
+            out += data[i:i + ctrl + 1]
+            i += ctrl + 1
+        else:
+            length = ctrl >> 5
+            if length == 7:
+                length += data[i]
+                i += 1
+            ref = len(out) - ((ctrl & 0x1F) << 8) - data[i] - 1
+            i += 1
+            for _ in range(length + 2):
+                out.append(out[ref])
+                ref += 1
+    if len(out) != expected:
+        raise RdbError("LZF decompressed length mismatch")
+    return bytes(out)
+
+
+class RdbReader:
+    # Walks the file through a memory map one entry at a time, so only the
+    # entry being decoded is ever held in memory.
+    def __init__(self, path, load_values=True, encoding="utf-8"):
+        self.path = path
+        self.load_values = load_values
+        self.encoding = encoding
+        self.aux = {}
+        self.resize_hints = {}
+        self.version = None
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < 9:
+            self._file.close()
+            raise RdbError(f"{path} is too short to be an RDB file")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = memoryview(self._map)
+        self._pos = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._data is not None:
+            self._data.release()
+            self._data = None
+            self._map.close()
+            self._file.close()
+
+    def _byte(self):
+        return self._take(1)[0]
+
+    def _take(self, n):
+        end = self._pos + n
+        if end > len(self._data):
+            raise RdbError(f"Unexpected end of file at offset {self._pos}")
+        chunk = self._data[self._pos:end]
+        self._pos = end
+        return chunk
+
+    def _unpack(self, fmt, size):
+        (value,) = struct.unpack(fmt, self._take(size))
+        return value
+
+    def _length(self):
+        # Returns (length, special encoding or None).
+        first = self._byte()
+        kind = first >> 6
+        if kind == 0:
+            return first & 0x3F, None
+        if kind == 1:
+            return ((first & 0x3F) << 8) | self._byte(), None
+        if kind == 2:
+            if first == 0x80:
+                return self._unpack(">I", 4), None
+            if first == 0x81:
+                return self._unpack(">Q", 8), None
+            raise RdbError(f"Invalid length encoding 0x{first:02X}")
+        return None, first & 0x3F
+
+    def _read_length(self):
+        length, special = self._length()
+        if special is not None:
+            raise RdbError("Unexpected encoded value where a length was expected")
+        return length
+
+    def _string_bytes(self):
+        length, special = self._length()
+        if special is None:
+            return bytes(self._take(length))
+        if special == 0:
+            return str(self._unpack("<b", 1)).encode()
+        if special == 1:
+            return str(self._unpack("<h", 2)).encode()
+        if special == 2:
+            return str(self._unpack("<i", 4)).encode()
+        if special == 3:
+            compressed = self._read_length()
+            expected = self._read_length()
+            return lzf_decompress(bytes(self._take(compressed)), expected)
+        raise RdbError(f"Unknown string encoding {special}")
+
+    def _skip_string(self):
+        length, special = self._length()
+        if special is None:
+            self._pos += length
+        elif special in (0, 1, 2):
+            self._pos += (1, 2, 4)[special]
+        elif special == 3:
+            compressed = self._read_length()
+            self._read_length()
+            self._pos += compressed
+        else:
+            raise RdbError(f"Unknown string encoding {special}")
+
+    def _string(self):
+        data = self._string_bytes()
+        return data.decode(self.encoding) if self.encoding else data
+
+    def _read_value(self, value_type):
+        load = self.load_values
+        if value_type == TYPE_STRING:
+            if load:
+                value = self._string()
+                return value, len(value)
+            mark = self._pos
+            length, special = self._length()
+            if special is None:
+                self._pos += length
+                return None, length
+            self._pos = mark
+            return None, len(self._string_bytes())
+
+        if value_type == TYPE_LIST:
+            count = self._read_length()
+            if not load:
+                for _ in range(count):
+                    self._skip_string()
+                return None, count
+            return [self._string() for _ in range(count)], count
+
+        if value_type == TYPE_ZSET:
+            count = self._read_length()
+            if not load:
+                for _ in range(count):
+                    self._skip_string()
+                    self._pos += 8
+                return None, count
+            members = []
+            for _ in range(count):
+                member = self._string()
+                members.append((member, self._unpack(">d", 8)))
+            return members, count
+
+        if value_type == TYPE_STREAM:
+            return self._read_stream()
+
+        raise RdbError(f"Unsupported value type 0x{value_type:02X} at offset {self._pos - 1}")
+
+    def _read_stream(self):
+        # RdbFileBuilderService writes the entry count here, followed by one
+        # group per millisecond timestamp, so groups are read until their
+        # counts add up to it.
+        total = self._read_length()
+        entries = [] if self.load_values else None
+        read = 0
+        while read < total:
+            base_id = self._string_bytes().decode()
+            count = self._read_length()
+            if count == 0:
+                raise RdbError(f"Empty stream group at offset {self._pos}")
+            field_count = self._read_length()
+            fields = [self._string() for _ in range(field_count)]
+            ms, seq = base_id.split("-")
+            base_seq = int(seq)
+            for _ in range(count):
+                delta = self._read_length()
+                if entries is None:
+                    for _ in range(field_count):
+                        self._skip_string()
+                else:
+                    values = [self._string() for _ in range(field_count)]
+                    entries.append((f"{ms}-{base_seq + delta}", dict(zip(fields, values))))
+            read += count
+        if read != total:
+            raise RdbError(f"Stream groups hold {read} entries, header says {total}")
+        return entries, total
+
+    def __iter__(self):
+        data = self._data
+        if bytes(data[:5]) != b"REDIS":
+            raise RdbError(f"{self.path} is not an RDB file")
+        self.version = bytes(data[5:9]).decode()
+        self._pos = 9
+
+        db = 0
+        expire_ms = None
+        while self._pos < len(data):
+            start = self._pos
+            opcode = self._byte()
+
+            if opcode == OP_EOF:
+                return
+            if opcode == OP_SELECTDB:
+                db = self._read_length()
+            elif opcode == OP_AUX:
+                key = self._string_bytes().decode(errors="replace")
+                self.aux[key] = self._string_bytes().decode(errors="replace")
+            elif opcode == OP_RESIZEDB:
+                self.resize_hints[db] = (self._read_length(), self._read_length())
+            elif opcode == OP_EXPIRETIME_MS:
+                expire_ms = self._unpack("<q", 8)
+            elif opcode == OP_EXPIRETIME:
+                expire_ms = self._unpack("<i", 4) * 1000
+            else:
+                key = self._string()
+                value, length = self._read_value(opcode)
+                size = self._pos - start
+                yield Entry(db, key, TYPE_NAMES.get(opcode, opcode), value, length, expire_ms, size)
+                expire_ms = None
+        # A file cut between two records parses cleanly up to here.
+        raise RdbError(f"{self.path} ends at offset {self._pos} without an EOF marker")
+
+
+def iter_rdb(path, load_values=True, encoding="utf-8"):
+    with RdbReader(path, load_values, encoding) as reader:
+        yield from reader
+
+
+def value_digest(entry):
+    digest = hashlib.sha1(entry.type.encode())
+    value = entry.value
+    if entry.type == "string":
+        digest.update(value.encode() if isinstance(value, str) else value)
+    elif entry.type == "list":
+        for item in value:
+            digest.update(repr(item).encode())
+    elif entry.type == "zset":
+        for member, score in sorted(value):
+            digest.update(repr((member, score)).encode())
+    elif entry.type == "stream":
+        for entry_id, fields in value:
+            digest.update(repr((entry_id, sorted(fields.items()))).encode())
+    return digest.hexdigest()
+
+
+def size_histogram(path):
+    # Per type: {power-of-two size bucket: key count}.
+    histogram = {}
+    for entry in iter_rdb(path, load_values=False):
+        bucket = 1 << max(entry.size - 1, 0).bit_length()
+        by_type = histogram.setdefault(entry.type, {})
+        by_type[bucket] = by_type.get(bucket, 0) + 1
+    return histogram
+
+
+def diff_rdb(left, right):
+    left_digests = {(e.db, e.key): value_digest(e) for e in iter_rdb(left)}
+    only_right = []
+    changed = []
+    for entry in iter_rdb(right):
+        key = (entry.db, entry.key)
+        digest = left_digests.pop(key, None)
+        if digest is None:
+            only_right.append(key)
+        elif digest != value_digest(entry):
+            changed.append(key)
+    return sorted(left_digests), only_right, changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect RDB dumps offline")
+    parser.add_argument("path")
+    parser.add_argument("--keys", action="store_true", help="list keys")
+    parser.add_argument("--histogram", action="store_true", help="key size histogram")
+    parser.add_argument("--diff", metavar="OTHER", help="compare with another dump")
+    args = parser.parse_args()
+
+    if args.diff:
+        only_left, only_right, changed = diff_rdb(args.path, args.diff)
+        for label, keys in (
+            (f"only in {args.path}", only_left),
+            (f"only in {args.diff}", only_right),
+            ("different values", changed),
+        ):
+            print(f"{label}: {len(keys)}")
+            for db, key in keys:
+                print(f"  db{db} {key}")
+        return
+
+    if args.histogram:
+        for value_type, buckets in size_histogram(args.path).items():
+            print(value_type)
+            for bucket in sorted(buckets):
+                print(f"  <= {bucket:>10} bytes: {buckets[bucket]}")
+        return
+
+    counts = {}
+    with RdbReader(args.path, load_values=False) as reader:
+        for entry in reader:
+            counts[entry.type] = counts.get(entry.type, 0) + 1
+            if args.keys:
+                expiry = f" expires {entry.expire_ms}" if entry.expire_ms else ""
+                print(f"db{entry.db} {entry.type:<7} {entry.key} len={entry.length} bytes={entry.size}{expiry}")
+        print(f"RDB version {reader.version}")
+        for key, value in reader.aux.items():
+            print(f"aux {key}={value}")
+    for value_type, count in sorted(counts.items()):
+        print(f"{value_type}: {count} keys")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import struct
+
+from rdb_reader import (
+    OP_EOF,
+    OP_EXPIRETIME_MS,
+    TYPE_LIST,
+    TYPE_STREAM,
+    TYPE_STRING,
+    TYPE_ZSET,
+)
+
+
+def encode_length(n):
+    if n < 0x40:
+        return bytes((n,))
+    if n < 0x4000:
+        return bytes((0x40 | (n >> 8), n & 0xFF))
+    return b"\x80" + struct.pack(">I", n)
+
+
+def encode_string(value):
+    data = value.encode("utf-8") if isinstance(value, str) else value
+    return encode_length(len(data)) + data
+
+
+class RdbWriter:
+    # Produces the same layout as RdbFile/RdbFileBuilderService.cs. Streams
+    # get the entry count followed by one group per millisecond; where the
+    # server would throw on a millisecond whose entries have different field
+    # lists, the writer starts a new group. RdbFileService on the .NET side
+    # reads that count as a group count, so it misloads any stream with two
+    # entries in one millisecond, from this writer or from a real dump.
+    def __init__(self, version="0009"):
+        self._out = bytearray(b"REDIS" + version.encode())
+
+    def add_string(self, key, value, expire_ms=None):
+        if expire_ms is not None:
+            self._out.append(OP_EXPIRETIME_MS)
+            self._out += struct.pack("<q", int(expire_ms))
+        self._out.append(TYPE_STRING)
+        self._out += encode_string(key)
+        self._out += encode_string(value)
+
+    def add_list(self, key, items):
+        items = list(items)
+        if not items:
+            return
+        self._out.append(TYPE_LIST)
+        self._out += encode_string(key)
+        self._out += encode_length(len(items))
+        for item in items:
+            self._out += encode_string(item)
+
+    def add_zset(self, key, members):
+        # members is an iterable of (member, score).
+        members = list(members)
+        self._out.append(TYPE_ZSET)
+        self._out += encode_string(key)
+        self._out += encode_length(len(members))
+        for member, score in members:
+            self._out += encode_string(member)
+            self._out += struct.pack(">d", score)
+
+    def add_stream(self, key, entries):
+        # entries is an ordered iterable of ((ms, seq), {field: value}). A
+        # group shares a millisecond timestamp and a field list.
+        entries = list(entries)
+        groups = []
+        for (ms, seq), fields in entries:
+            names = tuple(fields)
+            if groups and groups[-1][0] == ms and groups[-1][2] == names:
+                groups[-1][3].append((seq, fields))
+            else:
+                groups.append((ms, seq, names, [(seq, fields)]))
+
+        self._out.append(TYPE_STREAM)
+        self._out += encode_string(key)
+        self._out += encode_length(len(entries))
+        for ms, base_seq, names, group in groups:
+            self._out += encode_string(f"{ms}-{base_seq}")
+            self._out += encode_length(len(group))
+            self._out += encode_length(len(names))
+            for name in names:
+                self._out += encode_string(name)
+            for seq, fields in group:
+                self._out += encode_length(seq - base_seq)
+                for name in names:
+                    self._out += encode_string(fields[name])
+
+    def getvalue(self):
+        return bytes(self._out) + bytes((OP_EOF,))
@@ -0,0 +1,310 @@
+import time
+import weakref
+
+import latency
+
+CRLF = b"\r\n"
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+
+class RespError(Exception):
+    # Error replies are returned, not raised, so a batch of replies can be
+    # drained even when some of them failed.
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+    def __repr__(self):
+        return f"RespError({self.message!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, RespError) and other.message == self.message
+
+    def __hash__(self):
+        return hash(self.message)
+
+
+class ProtocolError(ConnectionError):
+    pass
+
+
+class RespReader:
+    def __init__(self, sock, buffer_size=DEFAULT_BUFFER_SIZE, encoding="utf-8"):
+        self.sock = sock
+        self.encoding = encoding
+        self._buf = bytearray(buffer_size)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+        self._offset = 0
+
+    @property
+    def buffered(self):
+        return self._end - self._start
+
+    @property
+    def position(self):
+        # Total number of bytes consumed from the socket so far.
+        return self._offset + self._start
+
+    def _fill(self):
+        if self._start == self._end:
+            self._offset += self._start
+            self._start = self._end = 0
+        elif self._end == len(self._buf):
+            pending = self._end - self._start
+            if self._start == 0:
+                self._grow(len(self._buf) * 2)
+            else:
+                self._buf[:pending] = self._view[self._start:self._end]
+                self._offset += self._start
+                self._start, self._end = 0, pending
+
+        received = self.sock.recv_into(self._view[self._end:])
+        if not received:
+            raise ConnectionError("Socket closed")
+        self._end += received
+
+    def _grow(self, size):
+        buf = bytearray(size)
+        buf[: self._end - self._start] = self._buf[self._start:self._end]
+        self._offset += self._start
+        self._end -= self._start
+        self._start = 0
+        self._buf = buf
+        self._view = memoryview(buf)
+
+    def _line_end(self):
+        pos = self._buf.find(CRLF, self._start, self._end)
+        while pos < 0:
+            scanned = max(self._end - 1 - self._start, 0)
+            self._fill()
+            pos = self._buf.find(CRLF, self._start + scanned, self._end)
+        return pos
+
+    def read_line(self):
+        pos = self._line_end()
+        line = bytes(self._view[self._start:pos])
+        self._start = pos + 2
+        return line
+
+    def _read_int_line(self):
+        pos = self._line_end()
+        value = int(self._buf[self._start:pos])
+        self._start = pos + 2
+        return value
+
+    def _read_bulk(self, length):
+        needed = length + 2
+        if self._end - self._start < needed and needed > len(self._buf):
+            return self._read_large_bulk(length)
+
+        while self._end - self._start < needed:
+            self._fill()
+
+        start = self._start
+        self._start += needed
+        data = self._view[start:start + length]
+        if self.encoding:
+            return str(data, self.encoding)
+        return bytes(data)
+
+    def _read_large_bulk(self, length):
+        # Payloads bigger than the receive buffer are read straight into
+        # their own buffer instead of growing the shared one.
+        data = bytearray(length + 2)
+        view = memoryview(data)
+        copied = min(self._end - self._start, len(data))
+        view[:copied] = self._view[self._start:self._start + copied]
+        self._start += copied
+        while copied < len(data):
+            received = self.sock.recv_into(view[copied:])
+            if not received:
+                raise ConnectionError("Socket closed")
+            copied += received
+            self._offset += received
+        if self.encoding:
+            return str(view[:length], self.encoding)
+        return bytes(view[:length])
+
+    def read_response(self):
+        if self._start == self._end:
+            self._fill()
+
+        prefix = self._buf[self._start]
+        self._start += 1
+
+        if prefix == 36:  # $
+            length = self._read_int_line()
+            if length < 0:
+                return None
+            return self._read_bulk(length)
+        elif prefix == 42:  # *
+            count = self._read_int_line()
+            if count < 0:
+                return None
+            return [self.read_response() for _ in range(count)]
+        elif prefix == 58:  # :
+            return self._read_int_line()
+        elif prefix == 43:  # +
+            return self._decode(self.read_line())
+        elif prefix == 45:  # -
+            return RespError(self.read_line().decode(errors="replace"))
+        raise ProtocolError(f"Unknown prefix: {bytes([prefix])!r}")
+
+    def read_responses(self, count):
+        return [self.read_response() for _ in range(count)]
+
+    def read_array_header(self):
+        # Reads only the "*<count>" line of an array reply so its elements can
+        # be decoded a few at a time with read_response(). Any other reply
+        # (usually an error) is read whole and returned instead of a count.
+        if self._start == self._end:
+            self._fill()
+        if self._buf[self._start] != 42:  # *
+            return self.read_response()
+        self._start += 1
+        return max(self._read_int_line(), 0)
+
+    def _decode(self, data):
+        if self.encoding:
+            return data.decode(self.encoding)
+        return data
+
+
+COMMON_COMMANDS = (
+    "AUTH", "PING", "SET", "GET", "INCR", "INCRBY", "LPUSH", "RPUSH", "LPOP",
+    "RPOP", "LRANGE", "LLEN", "ZADD", "ZSCORE", "ZINCRBY", "ZRANGE",
+    "ZRANGEBYSCORE", "XADD", "XRANGE", "PUBLISH", "EVAL", "EVALSHA", "MULTI",
+    "EXEC",
+)
+
+_ARRAY_HEADERS = [b"*%d\r\n" % n for n in range(64)]
+_BULK_HEADERS = [b"$%d\r\n" % n for n in range(1024)]
+_command_headers = {}
+
+
+def _bulk(data):
+    size = len(data)
+    if size < 1024:
+        return _BULK_HEADERS[size] + data + CRLF
+    return b"$%d\r\n" % size + data + CRLF
+
+
+def _cache_command_header(name):
+    header = _bulk(name.encode() if isinstance(name, str) else bytes(name))
+    if len(_command_headers) < 512:
+        _command_headers[name] = header
+    return header
+
+
+for _name in COMMON_COMMANDS:
+    _cache_command_header(_name)
+    _cache_command_header(_name.encode())
+    _cache_command_header(_name.lower())
+
+
+def encode_into(out, args, encoding="utf-8"):
+    count = len(args)
+    out += _ARRAY_HEADERS[count] if count < 64 else b"*%d\r\n" % count
+
+    name = args[0]
+    if isinstance(name, (bytearray, memoryview)):
+        # Mutable and unhashable, so they can't key the header cache.
+        name = bytes(name)
+    header = _command_headers.get(name)
+    out += header if header is not None else _cache_command_header(name)
+
+    for arg in args[1:]:
+        if isinstance(arg, str):
+            arg = arg.encode(encoding)
+        elif isinstance(arg, (bytes, bytearray)):
+            pass
+        elif isinstance(arg, memoryview):
+            arg = arg.cast("B")
+        elif isinstance(arg, int) and not isinstance(arg, bool):
+            arg = b"%d" % arg
+        elif isinstance(arg, float):
+            arg = repr(arg).encode()
+        else:
+            raise TypeError(f"Cannot encode argument of type {type(arg).__name__}")
+
+        size = len(arg)
+        out += _BULK_HEADERS[size] if size < 1024 else b"$%d\r\n" % size
+        out += arg
+        out += CRLF
+    return out
+
+
+def encode_command(args):
+    return bytes(encode_into(bytearray(), args))
+
+
+class CommandEncoder:
+    # Reusable output buffer: commands are appended back to back and the
+    # buffer is handed to sendall without building intermediate strings.
+    def __init__(self, encoding="utf-8"):
+        self.encoding = encoding
+        self.buffer = bytearray()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def append(self, *args):
+        encode_into(self.buffer, args, self.encoding)
+        return len(self.buffer)
+
+    def encode(self, *args):
+        self.buffer.clear()
+        encode_into(self.buffer, args, self.encoding)
+        return self.buffer
+
+    def take(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+    def clear(self):
+        self.buffer.clear()
+
+
+_readers = weakref.WeakKeyDictionary()
+
+
+def reader_for(sock):
+    # Buffered bytes belong to the socket, so every helper that reads from the
+    # same socket has to share one reader.
+    reader = _readers.get(sock)
+    if reader is None:
+        reader = _readers[sock] = RespReader(sock)
+    return reader
+
+
+def execute_command(sock, *args):
+    return execute_decoded(sock, args, RespReader.read_response)
+
+
+def execute_decoded(sock, args, decode):
+    # Sends one command and reads its reply with decode(reader), so callers
+    # with their own reply decoding still share the latency recording.
+    frame = encode_command(args)
+    reader = reader_for(sock)
+    recorder = latency.recorder
+    if recorder is None:
+        sock.sendall(frame)
+        return decode(reader)
+
+    position = reader.position
+    started = time.perf_counter()
+    sock.sendall(frame)
+    reply = decode(reader)
+    recorder.record(
+        latency.command_name(args[0]),
+        time.perf_counter() - started,
+        len(frame),
+        reader.position - position,
+    )
+    return reply
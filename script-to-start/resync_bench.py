@@ -0,0 +1,297 @@
+import argparse
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+
+from bulk_load import BulkLoader
+from cluster import Cluster, wait_until_ready
+from connection_pool import Connection
+from rdb_reader import iter_rdb
+from resp import RespError, RespReader, encode_command
+from script import AUTH_PASSWORD
+
+MIXES = {
+    "strings": {"string": 1},
+    "mixed": {"string": 4, "list": 2, "zset": 2, "stream": 2},
+}
+MARKER_KEY = "__resync:marker"
+
+
+def parse_mix(text):
+    # "strings", "mixed" or weights such as "string=6,zset=4".
+    if text in MIXES:
+        return MIXES[text]
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("string", "list", "zset", "stream"):
+            raise ValueError(f"Unknown key type {name.strip()!r} in mix {text!r}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def dataset(keys, mix, elements=10, value_size=16, seed=0):
+    # bulk_load records for `keys` keys with types drawn from the mix.
+    rng = random.Random(seed)
+    types, weights = zip(*mix.items())
+    value = "v" * value_size
+    for i in range(keys):
+        key = f"resync:{i}"
+        key_type = rng.choices(types, weights)[0]
+        if key_type == "string":
+            yield {"type": "string", "key": key, "value": value}
+        elif key_type == "list":
+            yield {"type": "list", "key": key, "values": [value] * elements}
+        elif key_type == "zset":
+            yield {"type": "zset", "key": key, "members": [(f"m{n}", n) for n in range(elements)]}
+        else:
+            yield {
+                "type": "stream",
+                "key": key,
+                "entries": [{"id": "*", "fields": {"f": value}} for _ in range(elements)],
+            }
+
+
+class WriteLoad:
+    # Keeps writing SETs to the master from a background thread, in
+    # pipelined batches and at most `rate` commands a second (0 is
+    # unthrottled), so the replica has a backlog to catch up on.
+    def __init__(self, host, port, password=None, rate=1000, batch=20, value_size=16):
+        self.address = (host, port)
+        self.password = password
+        self.rate = rate
+        self.batch = batch
+        self.value = "w" * value_size
+        self.commands = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        conn = Connection(*self.address, self.password)
+        try:
+            started = time.perf_counter()
+            while not self._stop.is_set():
+                pipe = conn.pipeline()
+                for n in range(self.commands, self.commands + self.batch):
+                    pipe.execute_command("SET", f"resync:live:{n % 10000}", self.value)
+                replies = pipe.execute()
+                self.errors += sum(isinstance(reply, RespError) for reply in replies)
+                self.commands += len(replies)
+                if self.rate:
+                    delay = started + self.commands / self.rate - time.perf_counter()
+                    if delay > 0:
+                        self._stop.wait(delay)
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def probe_fullresync(host, port, password=None, timeout=120.0):
+    # Plays the replica side of the handshake on a raw socket. Every part of
+    # the PSYNC reply is written after the RDB has been built, so the first
+    # byte of +FULLRESYNC marks the end of the build and the rest of the
+    # bulk reply is the transfer. Returns (build_s, transfer_s, rdb bytes).
+    sock = socket.create_connection((host, port), timeout=timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    reader = RespReader(sock, encoding=None)
+    try:
+        handshake = [("REPLCONF", "listening-port", "0"), ("REPLCONF", "capa", "psync2")]
+        if password is not None:
+            handshake.insert(0, ("AUTH", password))
+        for args in handshake:
+            sock.sendall(encode_command(args))
+            reply = reader.read_response()
+            if isinstance(reply, RespError):
+                raise reply
+
+        started = time.perf_counter()
+        sock.sendall(encode_command(("PSYNC", "?", "-1")))
+        # Writes can be propagated to the new replica socket before the
+        # reply itself; they are skipped.
+        while True:
+            reply = reader.read_response()
+            if isinstance(reply, RespError):
+                raise reply
+            if isinstance(reply, bytes) and reply.startswith(b"FULLRESYNC"):
+                break
+        built = time.perf_counter()
+        rdb = reader.read_response()
+        transferred = time.perf_counter()
+    finally:
+        sock.close()
+    return built - started, transferred - built, rdb
+
+
+def count_rdb_keys(rdb):
+    with tempfile.NamedTemporaryFile(suffix=".rdb", delete=False) as f:
+        f.write(rdb)
+    try:
+        return sum(1 for _ in iter_rdb(f.name, load_values=False))
+    finally:
+        os.unlink(f.name)
+
+
+def _wait_for_value(conn, key, value, deadline, what):
+    while conn.execute_command("GET", key) != value:
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Replica did not {what} in time")
+        time.sleep(0.0005)
+    return time.perf_counter()
+
+
+def run_case(keys, mix_name, config):
+    mix = parse_mix(mix_name)
+    timeout = config["timeout"]
+    with Cluster(replicas=0, password=config["password"], standin=config["standin"]) as cluster:
+        host, port = cluster.master
+        loader = BulkLoader(host, port, config["password"], connections=config["connections"])
+        fill = loader.load(dataset(keys, mix, config["elements"], config["value_size"]))
+
+        load = WriteLoad(host, port, config["password"], config["write_rate"]).start()
+        master = Connection(host, port, config["password"])
+        replica_conn = None
+        try:
+            build_s, transfer_s, rdb = probe_fullresync(host, port, config["password"], timeout)
+
+            marker = f"before:{time.time()}"
+            master.execute_command("SET", MARKER_KEY, marker)
+            backlog_from = load.commands
+            attached = time.perf_counter()
+            replica = cluster.add_replica(wait=False)
+            deadline = time.monotonic() + timeout
+            wait_until_ready(*replica, config["password"], timeout, cluster.process(replica))
+            booted = time.perf_counter()
+            replica_conn = Connection(*replica, config["password"])
+            synced = _wait_for_value(replica_conn, MARKER_KEY, marker, deadline, "finish the resync")
+
+            # Everything written up to now is the backlog; the replica has
+            # caught up once it serves a write made after it.
+            backlog = load.commands - backlog_from
+            marker = f"after:{time.time()}"
+            master.execute_command("SET", MARKER_KEY, marker)
+            caught_up = _wait_for_value(
+                replica_conn, MARKER_KEY, marker, time.monotonic() + timeout, "catch up"
+            )
+        finally:
+            load.stop()
+            master.close()
+            if replica_conn is not None:
+                replica_conn.close()
+
+    sync_s = synced - attached
+    boot_s = booted - attached
+    # The replica's own load time is not visible from outside; it is what
+    # is left of the resync once boot, build and transfer are taken off.
+    load_s = max(sync_s - boot_s - build_s - transfer_s, 0.0)
+    megabytes = len(rdb) / 1_000_000
+    millions = keys / 1_000_000
+    result = {
+        "keys": keys,
+        "mix": mix_name,
+        "fill_sec": fill.elapsed,
+        "rdb_bytes": len(rdb),
+        "build_sec": build_s,
+        "transfer_sec": transfer_s,
+        "boot_sec": boot_s,
+        "load_sec": load_s,
+        "sync_sec": sync_s,
+        "catchup_sec": caught_up - synced,
+        "backlog_commands": backlog,
+        "write_errors": load.errors,
+        "transfer_mb_per_sec": megabytes / transfer_s if transfer_s else None,
+        "load_mb_per_sec": megabytes / load_s if load_s else None,
+        "build_sec_per_mkeys": build_s / millions,
+        "load_sec_per_mkeys": load_s / millions,
+        "sync_sec_per_mkeys": sync_s / millions,
+    }
+    if config["verify"]:
+        # The probe's RDB also holds the write load's keys and the marker.
+        result["rdb_keys"] = count_rdb_keys(rdb)
+    return result
+
+
+def _rate(value, unit):
+    return f"{value:>9.1f}{unit}" if value is not None else f"{'-':>9}{unit}"
+
+
+def print_results(results):
+    header = (
+        f"{'keys':>10}{'RDB MB':>8}{'build s':>9}{'xfer MB/s':>11}"
+        f"{'load MB/s':>11}{'sync s':>9}{'s/Mkeys':>9}{'catchup s':>11}{'backlog':>9}  mix"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['keys']:>10,}{r['rdb_bytes'] / 1_000_000:>8.1f}"
+            f"{r['build_sec']:>9.3f}{_rate(r['transfer_mb_per_sec'], '  ')}"
+            f"{_rate(r['load_mb_per_sec'], '  ')}{r['sync_sec']:>9.3f}"
+            f"{r['sync_sec_per_mkeys']:>9.2f}{r['catchup_sec']:>11.3f}{r['backlog_commands']:>9,}  {r['mix']}"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Full-resync and replication catch-up benchmark")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="key counts")
+    parser.add_argument(
+        "--mix",
+        action="append",
+        help="'strings', 'mixed' or weights such as string=6,zset=4; repeatable (default: strings and mixed)",
+    )
+    parser.add_argument("--elements", type=int, default=10, help="items per list, zset and stream")
+    parser.add_argument("--value-size", type=int, default=16)
+    parser.add_argument("--write-rate", type=int, default=1000, help="background writes/s, 0 = unthrottled")
+    parser.add_argument("--connections", type=int, default=4, help="for filling the master")
+    parser.add_argument("--password", default=AUTH_PASSWORD)
+    parser.add_argument("--standin", action="store_true", help="use in-process stand-in servers")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--verify", action="store_true", help="count the keys in the RDB")
+    parser.add_argument("--json", help="write results to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    mixes = args.mix or list(MIXES)
+    for mix in mixes:
+        parse_mix(mix)
+    config = {
+        "password": args.password,
+        "standin": args.standin,
+        "elements": args.elements,
+        "value_size": args.value_size,
+        "write_rate": args.write_rate,
+        "connections": args.connections,
+        "timeout": args.timeout,
+        "verify": args.verify,
+    }
+
+    results = []
+    for mix in mixes:
+        for size in sizes:
+            result = run_case(size, mix, config)
+            results.append(result)
+            print(f"{mix} {size:,} keys: resync {result['sync_sec']:.3f}s", flush=True)
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"timestamp": time.time(), "config": config, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
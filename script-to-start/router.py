@@ -0,0 +1,139 @@
+import itertools
+import threading
+import time
+
+from connection_pool import get_pool
+from resp import RespError
+
+READ_COMMANDS = frozenset({"GET", "LRANGE", "XRANGE", "ZRANGEBYSCORE", "ZSCORE"})
+
+ROUND_ROBIN = "round_robin"
+LEAST_OUTSTANDING = "least_outstanding"
+
+
+class Router:
+    # Writes (anything not in read_commands) go to the master; reads are
+    # spread over the replicas and fall back to the master when a replica
+    # cannot be reached.
+    #
+    # With max_staleness set, a read only goes to a replica if every write
+    # made through this router is either younger than max_staleness seconds
+    # or has been acknowledged by all replicas. Otherwise the router issues
+    # WAIT (which makes the master send REPLCONF GETACK) and reads from the
+    # master if the replicas do not catch up within wait_timeout.
+    # max_staleness=0 gives read-your-writes.
+    def __init__(
+        self,
+        master,
+        replicas,
+        password=None,
+        strategy=ROUND_ROBIN,
+        max_staleness=None,
+        wait_timeout=0.1,
+        read_commands=READ_COMMANDS,
+        **pool_kwargs,
+    ):
+        if strategy not in (ROUND_ROBIN, LEAST_OUTSTANDING):
+            raise ValueError(f"Unknown routing strategy {strategy!r}")
+        self.strategy = strategy
+        self.max_staleness = max_staleness
+        self.wait_timeout = wait_timeout
+        self.read_commands = frozenset(name.upper() for name in read_commands)
+        self.master = get_pool(*master, password=password, **pool_kwargs)
+        self.replicas = [
+            get_pool(*replica, password=password, **pool_kwargs) for replica in replicas
+        ]
+        self.outstanding = {pool: 0 for pool in self.replicas}
+        self.served = {pool: 0 for pool in [self.master] + self.replicas}
+        self._cycle = itertools.cycle(self.replicas)
+        self._unacked_since = None
+        self._wait_failed_at = None
+        self._lock = threading.Lock()
+        self._wait_lock = threading.Lock()
+
+    def _pick_replica(self):
+        with self._lock:
+            if self.strategy == ROUND_ROBIN:
+                pool = next(self._cycle)
+            else:
+                pool = min(self.replicas, key=self.outstanding.__getitem__)
+            self.outstanding[pool] += 1
+            return pool
+
+    def _replicas_fresh(self):
+        if self.max_staleness is None:
+            return True
+        fresh = self._fresh_or_failed()
+        if fresh is not None:
+            return fresh
+        # One WAIT at a time: readers that queue behind it see its outcome
+        # when they get the lock instead of issuing their own.
+        with self._wait_lock:
+            fresh = self._fresh_or_failed()
+            if fresh is not None:
+                return fresh
+            with self._lock:
+                since = self._unacked_since
+            acked = self.master.execute_command(
+                "WAIT", len(self.replicas), int(self.wait_timeout * 1000)
+            )
+            with self._lock:
+                if isinstance(acked, int) and acked >= len(self.replicas):
+                    # Writes made while WAIT was running are not covered by it.
+                    if self._unacked_since == since:
+                        self._unacked_since = None
+                    self._wait_failed_at = None
+                    return True
+                self._wait_failed_at = time.monotonic()
+                return False
+
+    def _fresh_or_failed(self):
+        # True if replicas can serve reads without a WAIT, False if one
+        # failed too recently to try again, None if a WAIT is needed.
+        with self._lock:
+            since = self._unacked_since
+            failed_at = self._wait_failed_at
+        now = time.monotonic()
+        if since is None or now - since < self.max_staleness:
+            return True
+        # Don't stall every read on WAIT while the replicas are behind.
+        if failed_at is not None and now - failed_at < self.wait_timeout:
+            return False
+        return None
+
+    def _execute(self, pool, args):
+        reply = pool.execute_command(*args)
+        with self._lock:
+            self.served[pool] += 1
+        return reply
+
+    def execute_command(self, *args):
+        name = args[0].upper() if isinstance(args[0], str) else args[0].decode().upper()
+        if name not in self.read_commands:
+            reply = self._execute(self.master, args)
+            if not isinstance(reply, RespError):
+                with self._lock:
+                    if self._unacked_since is None:
+                        self._unacked_since = time.monotonic()
+            return reply
+
+        if self.replicas and self._replicas_fresh():
+            pool = self._pick_replica()
+            try:
+                return self._execute(pool, args)
+            except OSError:
+                pass
+            finally:
+                with self._lock:
+                    self.outstanding[pool] -= 1
+        return self._execute(self.master, args)
+
+    def close(self):
+        for pool in [self.master] + self.replicas:
+            pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,3 +1,4 @@
+import argparse
 import socket
 import subprocess
 import threading
@@ -6,6 +7,13 @@ import os
 import signal
 import shlex
 
+from connection_pool import close_pools
+from logcapture import LEVELS, default_collector
+from pipeline import Pipeline
+from pubsub import Subscriber
+from resp import RespError, execute_command, reader_for
+from scripts import ScriptRegistry
+
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 SERVER_DLL = os.path.join(SCRIPT_DIR, "../memoryDb/out/memoryDb.dll")
 if not os.path.isfile(SERVER_DLL):
@@ -15,6 +23,7 @@ SERVER_PATH = "dotnet"
 
 MASTER_PORT = 6379
 REPLICA_PORT = 6380
+AUTH_PASSWORD = "your_password"
 
 
 def wait_for_server(host, port, timeout=5):
@@ -28,77 +37,52 @@ def wait_for_server(host, port, timeout=5):
     raise TimeoutError(f"Server not available on {host}:{port}")
 
 
-def read_line(sock):
-    line = b""
-    while not line.endswith(b"\r\n"):
-        part = sock.recv(1)
-        if not part:
-            raise ConnectionError("Socket closed")
-        line += part
-    return line[:-2]
-
-
-def read_bulk_string(sock):
-    length = int(read_line(sock))
-
-    if length == -1:
+def legacy_reply(value):
+    if value is None:
         return "null"
-    data = b""
-    while len(data) < length + 2:
-        data += sock.recv(length + 2 - len(data))
-    return data[:-2].decode()
-
-
-def read_array(sock):
-    count = int(read_line(sock))
-    return [read_response(sock) for _ in range(count)]
+    if isinstance(value, RespError):
+        return "ERR: " + value.message
+    if isinstance(value, list):
+        return [legacy_reply(item) for item in value]
+    return value
 
 
 def read_response(sock):
-    prefix = sock.recv(1)
-    if not prefix:
-        raise ConnectionError("Socket closed")
-
-    if prefix == b"$":
-        return read_bulk_string(sock)
-    elif prefix == b"*":
-        return read_array(sock)
-    elif prefix == b":":
-        return int(read_line(sock))
-    elif prefix == b"+":
-        return read_line(sock).decode()
-    elif prefix == b"-":
-        return "ERR: " + read_line(sock).decode()
-    else:
-        return f"Unknown prefix: {prefix}"
+    return legacy_reply(reader_for(sock).read_response())
 
 
 def send_command(sock, command):
-    parts = shlex.split(command.strip())
-    resp = f"*{len(parts)}\r\n"
-    for part in parts:
-        resp += f"${len(part)}\r\n{part}\r\n"
-    sock.sendall(resp.encode())
-    return read_response(sock)
+    return legacy_reply(execute_command(sock, *shlex.split(command.strip())))
+
+
+def send_pipelined(sock, commands, transaction=False):
+    pipe = Pipeline(sock, transaction=transaction)
+    for command in commands:
+        pipe.command(command)
+    return [legacy_reply(reply) for reply in pipe.execute()]
+
 
+def print_pipelined(sock, commands, transaction=False):
+    for command, reply in zip(commands, send_pipelined(sock, commands, transaction)):
+        print(f"{command} →", reply)
 
-def psubscribe_and_listen(port, pattern, results):
-    with socket.create_connection(("127.0.0.1", port)) as sock:
-        print("AUTHENTICATING (pattern)...")
-        print(send_command(sock, "AUTH your_password"))
 
-        print("PSUBSCRIBING...", send_command(sock, f"PSUBSCRIBE {pattern}"))
+def psubscribe_and_listen(port, pattern, results, subscribed=None):
+    with Subscriber("127.0.0.1", port, password=AUTH_PASSWORD) as subscriber:
+        print("PSUBSCRIBING...", legacy_reply(subscriber.psubscribe(pattern)[0]))
+        if subscribed is not None:
+            subscribed.set()
 
         try:
             for _ in range(2):
-                data = sock.recv(1024)
-                results.append(data.decode())
+                message = subscriber.get(timeout=5)
+                results.append(message.data)
                 print("PATTERN MESSAGE RECEIVED:")
-                print(data.decode())
-        except socket.timeout:
+                print(message)
+        except TimeoutError:
             print("No pattern message received (timeout)")
 
-        print("PUNSUBSCRIBING...", send_command(sock, f"PUNSUBSCRIBE {pattern}"))
+        print("PUNSUBSCRIBING...", legacy_reply(subscriber.punsubscribe(pattern)[0]))
 
 
 def print_nested(data, indent=0):
@@ -109,12 +93,9 @@ def print_nested(data, indent=0):
         print(" " * indent + str(data))
 
 
-def stream_logs(stream, prefix=""):
-    for line in iter(stream.readline, b""):
-        print(f"{prefix}{line.decode().rstrip()}")
-
-
-def start_server(port, extra_args=None):
+def start_server(port, extra_args=None, collector=None):
+    # Output goes to a LogCollector (one thread for all servers) rather than
+    # straight to the console; see logcapture.py.
     args = [SERVER_DLL, "--port", str(port), "--dbfilename", f"dump{port}.rdb"]
     if extra_args:
         args.extend(extra_args)
@@ -123,33 +104,42 @@ def start_server(port, extra_args=None):
         [SERVER_PATH] + args,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
-        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,
+        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == "nt" else 0,
     )
-    threading.Thread(
-        target=stream_logs, args=(proc.stdout, f"[{port} STDOUT] "), daemon=True
-    ).start()
-    threading.Thread(
-        target=stream_logs, args=(proc.stderr, f"[{port} STDERR] "), daemon=True
-    ).start()
+    (collector or default_collector()).add(proc, str(port))
     return proc
 
 
-def subscribe_and_listen(port, channel, results):
-    with socket.create_connection(("127.0.0.1", port)) as sock:
-        print("AUTHENTICATING...")
-        print(send_command(sock, "AUTH your_password"))
-
-        print("SUBSCRIBING...", send_command(sock, f"SUBSCRIBE {channel}"))
+def stop_servers(procs):
+    if procs:
+        print("Shutting down servers...")
+    for proc in procs:
+        try:
+            if os.name == "nt":
+                proc.send_signal(signal.CTRL_BREAK_EVENT)
+            else:
+                proc.terminate()
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            print("Force killing server...")
+            proc.kill()
+
+
+def subscribe_and_listen(port, channel, results, subscribed=None):
+    with Subscriber("127.0.0.1", port, password=AUTH_PASSWORD) as subscriber:
+        print("SUBSCRIBING...", legacy_reply(subscriber.subscribe(channel)[0]))
+        if subscribed is not None:
+            subscribed.set()
 
         try:
-            data = sock.recv(1024)
-            results.append(data.decode())
+            message = subscriber.get(timeout=5)
+            results.append(message.data)
             print("RECEIVED MESSAGE:")
-            print(data.decode())
-        except socket.timeout:
+            print(message)
+        except TimeoutError:
             print("No message received (timeout)")
 
-        print("UNSUBSCRIBING...", send_command(sock, f"UNSUBSCRIBE {channel}"))
+        print("UNSUBSCRIBING...", legacy_reply(subscriber.unsubscribe(channel)[0]))
 
 def runTestForScripts(master_sock, ):
     script = """
@@ -182,121 +172,132 @@ def runTestForScripts(master_sock, ):
     result_post_flush = send_command(master_sock, evalsha_cmd)
     print("EVALSHA after FLUSHALL", result_post_flush)  # 
 
+    incrby = ScriptRegistry().register(script)
+    print(
+        "Registered script after FLUSHALL",
+        legacy_reply(incrby(master_sock, [key], [5, 10, 15, 20])),
+    )
+
 def test_zadd_zscore(master_sock):
-    print("ZADD myzset 10.5 member1 →", send_command(master_sock, "ZADD myzset 10.5 member1"))
-    print("ZADD myzset 5 member2 →", send_command(master_sock, "ZADD myzset 5 member2"))
-    print("ZADD myzset 20.1 member1 →", send_command(master_sock, "ZADD myzset 20.1 member1"))  # update score
-
-    print("ZSCORE myzset member1 →", send_command(master_sock, "ZSCORE myzset member1"))  # should be 20.1
-    print("ZSCORE myzset member2 →", send_command(master_sock, "ZSCORE myzset member2"))  # should be 5
-    print("ZSCORE myzset unknown →", send_command(master_sock, "ZSCORE myzset unknown"))  # should be nil
-
-    print("ZINCRBY myzset 4.9 member2 →", send_command(master_sock, "ZINCRBY myzset 4.9 member2"))  # should be 9.9
-    print("ZSCORE myzset member2 →", send_command(master_sock, "ZSCORE myzset member2"))  # should now be 9.9
-
-    print("ZREM myzset member1 →", send_command(master_sock, "ZREM myzset member1"))  # should return :1
-    print("ZREM myzset unknown →", send_command(master_sock, "ZREM myzset unknown"))  # should return :0
-    print("ZSCORE myzset member1 →", send_command(master_sock, "ZSCORE myzset member1"))  # should be nil
-
-    # Add more members for range testing
-    print("ZADD myzset 1 memberA →", send_command(master_sock, "ZADD myzset 1 memberA"))
-    print("ZADD myzset 3 memberB →", send_command(master_sock, "ZADD myzset 3 memberB"))
-    print("ZADD myzset 6 memberC →", send_command(master_sock, "ZADD myzset 6 memberC"))
-
-    print("ZSCORE myzset memberA →", send_command(master_sock, "ZSCORE myzset memberA"))  # should be 1
-    print("ZSCORE myzset memberB →", send_command(master_sock, "ZSCORE myzset memberB"))  # should be 3
-    print("ZSCORE myzset memberC →", send_command(master_sock, "ZSCORE myzset memberC"))  # should be 6
-
-    # Remove members by score range
-    print("ZREMRANGEBYSCORE myzset 1 5 →", send_command(master_sock, "ZREMRANGEBYSCORE myzset 1 5"))  # should remove A and B
-    print("ZSCORE myzset memberA →", send_command(master_sock, "ZSCORE myzset memberA"))  # should be nil
-    print("ZSCORE myzset memberB →", send_command(master_sock, "ZSCORE myzset memberB"))  # should be nil
-    print("ZSCORE myzset memberC →", send_command(master_sock, "ZSCORE myzset memberC"))  # should still be 6
-
-    # Edge case: empty removal
-    print("ZREMRANGEBYSCORE myzset 100 200 →", send_command(master_sock, "ZREMRANGEBYSCORE myzset 100 200"))  # should return :0
-
-    print("ZADD myzset 2 memberX →", send_command(master_sock, "ZADD myzset 2 memberX"))
-    print("ZADD myzset 4 memberY →", send_command(master_sock, "ZADD myzset 4 memberY"))
-    print("ZADD myzset 7 memberZ →", send_command(master_sock, "ZADD myzset 7 memberZ"))
-
-    # Confirm scores
-    print("ZSCORE myzset memberX →", send_command(master_sock, "ZSCORE myzset memberX"))
-    print("ZSCORE myzset memberY →", send_command(master_sock, "ZSCORE myzset memberY"))
-    print("ZSCORE myzset memberZ →", send_command(master_sock, "ZSCORE myzset memberZ"))
-
-    # Remove by rank (rank 0 is lowest score)
-    print("ZREMRANGEBYRANK myzset 0 1 →", send_command(master_sock, "ZREMRANGEBYRANK myzset 0 1"))  # Should remove 2 lowest
-
-    # Confirm removals
-    print("ZSCORE myzset memberA →", send_command(master_sock, "ZSCORE myzset memberA"))  # Possibly already removed by score
-    print("ZSCORE myzset memberX →", send_command(master_sock, "ZSCORE myzset memberX"))  # Should be nil
-    print("ZSCORE myzset memberY →", send_command(master_sock, "ZSCORE myzset memberY"))  # Should be present or not depending on rank
-
-    # Edge case: out-of-range
-    print("ZREMRANGEBYRANK myzset 100 200 →", send_command(master_sock, "ZREMRANGEBYRANK myzset 100 200"))  # Should return :0
-    
-    print("ZADD myzsetRANK 3 memberD →", send_command(master_sock, "ZADD myzsetRANK 3 memberD"))
-    print("ZADD myzsetRANK 9 memberE →", send_command(master_sock, "ZADD myzsetRANK 9 memberE"))
-    print("ZADD myzsetRANK 11 memberF →", send_command(master_sock, "ZADD myzsetRANK 11 memberF"))
-    print("ZADD myzsetRANK 6 memberH →", send_command(master_sock, "ZADD myzsetRANK 6 memberH"))
-    print("ZADD myzsetRANK 15 memberG →", send_command(master_sock, "ZADD myzsetRANK 15 memberG"))
-
-    print("ZRANK myzsetRANK memberD →", send_command(master_sock, "ZRANK myzsetRANK memberD"))  # should be 0 or lowest
-    print("ZRANK myzsetRANK memberE →", send_command(master_sock, "ZRANK myzsetRANK memberE"))  # should be 1
-    print("ZRANK myzsetRANK memberF →", send_command(master_sock, "ZRANK myzsetRANK memberF"))  # should be 2
-    print("ZRANK myzsetRANK unknown →", send_command(master_sock, "ZRANK myzsetRANK unknown"))  # should be nil ($-1)
-
-    # ZREVRANK tests (descending rank: highest score = rank 0)
-    print("ZCARD myzsetRANK →", send_command(master_sock, "ZCARD myzsetRANK")) 
-    print("ZCOUNT myzsetRANK 2 10 →", send_command(master_sock, "ZCOUNT myzsetRANK 2 10")) # should be 2
-    print("ZRangeByScore myzsetRANK 3 10 WITHSCORES →", send_command(master_sock, "ZRangeByScore myzsetRANK 3 10 WITHSCORES")) 
-    print("ZRevRangeByScore myzsetRANK 10 3 WITHSCORES →", send_command(master_sock, "ZRevRangeByScore myzsetRANK 10 3 WITHSCORES")) 
-    print("ZRange myzsetRANK 0 2 WITHSCORES →", send_command(master_sock, "ZRange myzsetRANK 0 2 WITHSCORES")) 
-    print("ZRange myzsetRANK 2 4 WITHSCORES →", send_command(master_sock, "ZRange myzsetRANK 2 4 WITHSCORES"))
-    print("ZReverseRange myzsetRANK 2 4 WITHSCORES →", send_command(master_sock, "ZRevRange myzsetRANK 4 2 WITHSCORES"))
-    print("ZREVRANK myzsetRANK memberD →", send_command(master_sock, "ZREVRANK myzsetRANK memberD"))  # should be 2
-    print("ZREVRANK myzsetRANK memberE →", send_command(master_sock, "ZREVRANK myzsetRANK memberE"))  # should be 1
-    print("ZREVRANK myzsetRANK memberF →", send_command(master_sock, "ZREVRANK myzsetRANK memberF"))  # should be 0
-    print("ZREVRANK myzsetRANK unknown →", send_command(master_sock, "ZREVRANK myzsetRANK unknown"))  # should be nil ($-1)
-
-
-def run():
-    procs = []
-    try:
-        print("Starting master server...")
-        master_proc = start_server(MASTER_PORT, ["--authpass", "your_password"])
-        procs.append(master_proc)
-
-        print("Starting replica server...")
-        replica_proc = start_server(
-            REPLICA_PORT,
-            ["--replicaof", "127.0.0.1 6379", "--authpass", "your_password"],
+    commands = [
+        "ZADD myzset 10.5 member1",
+        "ZADD myzset 5 member2",
+        "ZADD myzset 20.1 member1",  # update score
+
+        "ZSCORE myzset member1",  # should be 20.1
+        "ZSCORE myzset member2",  # should be 5
+        "ZSCORE myzset unknown",  # should be nil
+
+        "ZINCRBY myzset 4.9 member2",  # should be 9.9
+        "ZSCORE myzset member2",  # should now be 9.9
+
+        "ZREM myzset member1",  # should return :1
+        "ZREM myzset unknown",  # should return :0
+        "ZSCORE myzset member1",  # should be nil
+
+        # Add more members for range testing
+        "ZADD myzset 1 memberA",
+        "ZADD myzset 3 memberB",
+        "ZADD myzset 6 memberC",
+
+        "ZSCORE myzset memberA",  # should be 1
+        "ZSCORE myzset memberB",  # should be 3
+        "ZSCORE myzset memberC",  # should be 6
+
+        # Remove members by score range
+        "ZREMRANGEBYSCORE myzset 1 5",  # should remove A and B
+        "ZSCORE myzset memberA",  # should be nil
+        "ZSCORE myzset memberB",  # should be nil
+        "ZSCORE myzset memberC",  # should still be 6
+
+        # Edge case: empty removal
+        "ZREMRANGEBYSCORE myzset 100 200",  # should return :0
+
+        "ZADD myzset 2 memberX",
+        "ZADD myzset 4 memberY",
+        "ZADD myzset 7 memberZ",
+
+        # Confirm scores
+        "ZSCORE myzset memberX",
+        "ZSCORE myzset memberY",
+        "ZSCORE myzset memberZ",
+
+        # Remove by rank (rank 0 is lowest score)
+        "ZREMRANGEBYRANK myzset 0 1",  # Should remove 2 lowest
+
+        # Confirm removals
+        "ZSCORE myzset memberA",  # Possibly already removed by score
+        "ZSCORE myzset memberX",  # Should be nil
+        "ZSCORE myzset memberY",  # Should be present or not depending on rank
+
+        # Edge case: out-of-range
+        "ZREMRANGEBYRANK myzset 100 200",  # Should return :0
+
+        "ZADD myzsetRANK 3 memberD",
+        "ZADD myzsetRANK 9 memberE",
+        "ZADD myzsetRANK 11 memberF",
+        "ZADD myzsetRANK 6 memberH",
+        "ZADD myzsetRANK 15 memberG",
+
+        "ZRANK myzsetRANK memberD",  # should be 0 or lowest
+        "ZRANK myzsetRANK memberE",  # should be 1
+        "ZRANK myzsetRANK memberF",  # should be 2
+        "ZRANK myzsetRANK unknown",  # should be nil ($-1)
+
+        # ZREVRANK tests (descending rank: highest score = rank 0)
+        "ZCARD myzsetRANK",
+        "ZCOUNT myzsetRANK 2 10",  # should be 2
+        "ZRangeByScore myzsetRANK 3 10 WITHSCORES",
+        "ZRevRangeByScore myzsetRANK 10 3 WITHSCORES",
+        "ZRange myzsetRANK 0 2 WITHSCORES",
+        "ZRange myzsetRANK 2 4 WITHSCORES",
+        "ZRevRange myzsetRANK 4 2 WITHSCORES",
+        "ZREVRANK myzsetRANK memberD",  # should be 2
+        "ZREVRANK myzsetRANK memberE",  # should be 1
+        "ZREVRANK myzsetRANK memberF",  # should be 0
+        "ZREVRANK myzsetRANK unknown",  # should be nil ($-1)
+    ]
+    print_pipelined(master_sock, commands)
+
+
+def print_log_stats(collector):
+    for name, stats in sorted(collector.stats().items()):
+        levels = ", ".join(f"{level} {count}" for level, count in stats.levels.items() if count)
+        print(
+            f"Server {name} output: {stats.lines} lines, {stats.bytes} bytes,"
+            f" {stats.filtered} filtered ({levels or 'none'})"
         )
-        procs.append(replica_proc)
 
-        wait_for_server("127.0.0.1", MASTER_PORT)
-        wait_for_server("127.0.0.1", REPLICA_PORT)
-        time.sleep(1.0)
+
+def run(standin=False):
+    # Imported here because cluster imports this module.
+    from cluster import Cluster
+
+    print("Starting master and replica...")
+    with Cluster(replicas=1, standin=standin) as cluster:
+        master_port = cluster.master[1]
+        replica_port = cluster.replicas[0][1]
 
         subscription_results = []
+        subscribed = threading.Event()
         listener_thread = threading.Thread(
             target=subscribe_and_listen,
-            args=(MASTER_PORT, "news", subscription_results),
+            args=(master_port, "news", subscription_results, subscribed),
         )
         listener_thread.start()
 
         psubscription_results = []
+        psubscribed = threading.Event()
         pattern_listener_thread = threading.Thread(
             target=psubscribe_and_listen,
-            args=(MASTER_PORT, "news*", psubscription_results),
+            args=(master_port, "news*", psubscription_results, psubscribed),
         )
         pattern_listener_thread.start()
 
-        # give it time to subscribe
-        time.sleep(1)
+        subscribed.wait(timeout=5)
+        psubscribed.wait(timeout=5)
 
-        with socket.create_connection(("127.0.0.1", MASTER_PORT)) as master_sock:
+        with cluster.logs_on_error(cluster.master), socket.create_connection(cluster.master) as master_sock:
             print(
                 "SET key without auth →",
                 send_command(master_sock, "SET key early_value"),
@@ -338,64 +339,60 @@ def run():
                 send_command(master_sock, "XRANGE mystream - +"),
             )
 
-            print("LPUSH list1 a →", send_command(master_sock, "LPUSH list1 a"))
-            print("LPUSH list1 b →", send_command(master_sock, "LPUSH list1 b"))
-            print("LPUSH list1 c →", send_command(master_sock, "LPUSH list1 c"))
-            print("RPUSH list1 d →", send_command(master_sock, "RPUSH list1 d"))
-            print("RPUSH list1 e →", send_command(master_sock, "RPUSH list1 e"))
-            print("RPUSH list1 f →", send_command(master_sock, "RPUSH list1 f"))
-
-            print("LRANGE list1 0 -1 →", send_command(master_sock, "LRANGE list1 0 -1"))
-
-            print("LPOP list1 →", send_command(master_sock, "LPOP list1"))
-            print("RPOP list1 →", send_command(master_sock, "RPOP list1"))
-
-            print("LRANGE list1 0 -1 →", send_command(master_sock, "LRANGE list1 0 -1"))
-
-            # Different key to verify isolation
-            print("LPUSH otherlist x →", send_command(master_sock, "LPUSH otherlist x"))
-            print("RPUSH otherlist y →", send_command(master_sock, "RPUSH otherlist y"))
-            print("LPUSH otherlist z →", send_command(master_sock, "LPUSH otherlist z"))
-
-            print(
-                "LRANGE otherlist 0 -1 →",
-                send_command(master_sock, "LRANGE otherlist 0 -1"),
+            print_pipelined(
+                master_sock,
+                [
+                    "LPUSH list1 a",
+                    "LPUSH list1 b",
+                    "LPUSH list1 c",
+                    "RPUSH list1 d",
+                    "RPUSH list1 e",
+                    "RPUSH list1 f",
+                    "LRANGE list1 0 -1",
+                    "LPOP list1",
+                    "RPOP list1",
+                    "LRANGE list1 0 -1",
+                    # Different key to verify isolation
+                    "LPUSH otherlist x",
+                    "RPUSH otherlist y",
+                    "LPUSH otherlist z",
+                    "LRANGE otherlist 0 -1",
+                    # Pop all elements to test underflow behavior
+                    "LPOP otherlist",
+                    "LPOP otherlist",
+                    "LPOP otherlist",
+                    "LPOP otherlist",
+                    # Length of lists
+                    "LLEN list1",
+                    "LLEN otherlist",
+                    "LLEN nonexistent",
+                ],
             )
 
-            # Pop all elements to test underflow behavior
-            print("LPOP otherlist →", send_command(master_sock, "LPOP otherlist"))
-            print("LPOP otherlist →", send_command(master_sock, "LPOP otherlist"))
-            print("LPOP otherlist →", send_command(master_sock, "LPOP otherlist"))
-            print("LPOP otherlist →", send_command(master_sock, "LPOP otherlist"))
-
-            # Length of lists
-            print("LLEN list1 →", send_command(master_sock, "LLEN list1"))
-            print("LLEN otherlist →", send_command(master_sock, "LLEN otherlist"))
-            print("LLEN nonexistent →", send_command(master_sock, "LLEN nonexistent"))
-
             # Remove elements
-            print("LPUSH list2 a →", send_command(master_sock, "LPUSH list2 a"))
-            print("LPUSH list2 b →", send_command(master_sock, "LPUSH list2 b"))
-            print("LPUSH list2 a →", send_command(master_sock, "LPUSH list2 a"))
-            print("LPUSH list2 c →", send_command(master_sock, "LPUSH list2 c"))
-            print("LPUSH list2 a →", send_command(master_sock, "LPUSH list2 a"))
-
-            print("LRANGE list2 0 -1 →", send_command(master_sock, "LRANGE list2 0 -1"))
-
-            # Remove 2 'a' from left to right
-            print("LREM list2 2 a →", send_command(master_sock, "LREM list2 2 a"))
-            print("LRANGE list2 0 -1 →", send_command(master_sock, "LRANGE list2 0 -1"))
-
-            # Remove all remaining 'a'
-            print("LREM list2 0 a →", send_command(master_sock, "LREM list2 0 a"))
-            print("LRANGE list2 0 -1 →", send_command(master_sock, "LRANGE list2 0 -1"))
-
-            # Add again to test negative count (right-to-left)
-            print("RPUSH list2 a →", send_command(master_sock, "RPUSH list2 a"))
-            print("RPUSH list2 a →", send_command(master_sock, "RPUSH list2 a"))
-            print("LPUSH list2 a →", send_command(master_sock, "LPUSH list2 a"))
-            print("LREM list2 -2 a →", send_command(master_sock, "LREM list2 -2 a"))
-            print("LRANGE list2 0 -1 →", send_command(master_sock, "LRANGE list2 0 -1"))
+            print_pipelined(
+                master_sock,
+                [
+                    "LPUSH list2 a",
+                    "LPUSH list2 b",
+                    "LPUSH list2 a",
+                    "LPUSH list2 c",
+                    "LPUSH list2 a",
+                    "LRANGE list2 0 -1",
+                    # Remove 2 'a' from left to right
+                    "LREM list2 2 a",
+                    "LRANGE list2 0 -1",
+                    # Remove all remaining 'a'
+                    "LREM list2 0 a",
+                    "LRANGE list2 0 -1",
+                    # Add again to test negative count (right-to-left)
+                    "RPUSH list2 a",
+                    "RPUSH list2 a",
+                    "LPUSH list2 a",
+                    "LREM list2 -2 a",
+                    "LRANGE list2 0 -1",
+                ],
+            )
 
             print(
                 "PUBLISH news 'Breaking News!' →",
@@ -417,13 +414,16 @@ def run():
         listener_thread.join(timeout=5.0)
         if listener_thread.is_alive():
             print("Listener timed out waiting for message.")
+            cluster.dump_logs(cluster.master)
 
         print("SUBSCRIBE/UNSUBSCRIBE test results:")
         for entry in subscription_results:
             print(entry.strip())
 
-        time.sleep(1)
-        with socket.create_connection(("127.0.0.1", REPLICA_PORT)) as replica_sock:
+        cluster.wait_for_replicas()
+        with cluster.logs_on_error(cluster.replicas[0]), socket.create_connection(
+            ("127.0.0.1", replica_port)
+        ) as replica_sock:
             print(
                 "REPLICA GET early_key without auth →",
                 send_command(replica_sock, "GET early_key"),
@@ -448,28 +448,19 @@ def run():
                 send_command(replica_sock, "LRANGE list2 0 -1"),
             )
 
-        print("Starting late-joining replica...")
-        LATE_REPLICA_PORT = 6381
-        late_replica_proc = start_server(
-            LATE_REPLICA_PORT,
-            ["--replicaof", "127.0.0.1 6379", "--authpass", "your_password"],
-        )
-        procs.append(late_replica_proc)
-
         pattern_listener_thread.join(timeout=5.0)
         if pattern_listener_thread.is_alive():
             print("Pattern listener timed out.")
+            cluster.dump_logs(cluster.master)
 
         print("PSUBSCRIBE/PUNSUBSCRIBE test results:")
         for entry in psubscription_results:
             print(entry.strip())
 
-        wait_for_server("127.0.0.1", LATE_REPLICA_PORT)
-        time.sleep(4)
+        print("Starting late-joining replica...")
+        late_replica = cluster.add_replica()
 
-        with socket.create_connection(
-            ("127.0.0.1", LATE_REPLICA_PORT)
-        ) as late_replica_sock:
+        with cluster.logs_on_error(late_replica), socket.create_connection(late_replica) as late_replica_sock:
             print(
                 "LATE REPLICA GET without auth early_key →",
                 send_command(late_replica_sock, "GET early_key"),
@@ -501,21 +492,19 @@ def run():
                 send_command(late_replica_sock, "LRANGE list2 0 -1"),
             )
 
-        time.sleep(1.5)
-
-    finally:
-        print("Shutting down servers...")
-        for proc in procs:
-            try:
-                if os.name == "nt":
-                    proc.send_signal(signal.CTRL_BREAK_EVENT)
-                else:
-                    proc.terminate()
-                proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                print("Force killing server...")
-                proc.kill()
+        print_log_stats(default_collector())
+        close_pools()
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Run the end-to-end client checks")
+    parser.add_argument("--standin", action="store_true", help="use in-process stand-in servers")
+    parser.add_argument("--logs", action="store_true", help="print server output as it arrives")
+    parser.add_argument(
+        "--log-level", choices=LEVELS, help="keep only server lines at or above this level"
+    )
+    args = parser.parse_args()
+    collector = default_collector()
+    collector.echo = args.logs
+    collector.level = args.log_level
+    run(args.standin)
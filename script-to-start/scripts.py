@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+import threading
+import weakref
+
+from pipeline import Pipeline
+from resp import RespError, execute_command
+
+
+def script_sha(body):
+    # Same digest LuaScriptStorage.StoreScript computes: SHA1 over UTF-8.
+    return hashlib.sha1(body.encode("utf-8")).hexdigest()
+
+
+def is_noscript(reply):
+    return isinstance(reply, RespError) and reply.message.startswith("NOSCRIPT")
+
+
+def _socket(conn):
+    # Accepts a raw socket or anything with one (connection_pool.Connection).
+    return getattr(conn, "sock", conn)
+
+
+class Script:
+    def __init__(self, registry, body):
+        self.registry = registry
+        self.body = body
+        self.sha = script_sha(body)
+
+    def __repr__(self):
+        return f"Script({self.sha})"
+
+    def __call__(self, conn, keys=(), args=()):
+        return self.registry.evalsha(conn, self, keys, args)
+
+    async def call_async(self, client, keys=(), args=()):
+        return await self.registry.evalsha_async(client, self, keys, args)
+
+
+class ScriptRegistry:
+    # Scripts are called with EVALSHA only. The first time a connection is
+    # used every registered script is sent in one pipelined SCRIPT LOAD
+    # batch; a NOSCRIPT reply (FLUSHALL, restart) reloads them all and the
+    # call is retried once.
+    def __init__(self):
+        self._scripts = {}
+        self._loaded = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._scripts)
+
+    def __iter__(self):
+        return iter(list(self._scripts.values()))
+
+    def register(self, body):
+        sha = script_sha(body)
+        with self._lock:
+            script = self._scripts.get(sha)
+            if script is None:
+                script = self._scripts[sha] = Script(self, body)
+        return script
+
+    def _missing(self, target):
+        with self._lock:
+            loaded = self._loaded.setdefault(target, set())
+            return [s for sha, s in self._scripts.items() if sha not in loaded], loaded
+
+    def preload(self, conn, force=False):
+        sock = _socket(conn)
+        if force:
+            self._loaded.pop(sock, None)
+        missing, loaded = self._missing(sock)
+        if not missing:
+            return
+        pipe = Pipeline(sock)
+        for script in missing:
+            pipe.execute_command("SCRIPT", "LOAD", script.body)
+        for script, reply in zip(missing, pipe.execute()):
+            if isinstance(reply, RespError):
+                raise reply
+            loaded.add(script.sha)
+
+    def evalsha(self, conn, script, keys=(), args=()):
+        sock = _socket(conn)
+        loaded = self._loaded.get(sock)
+        if loaded is None or script.sha not in loaded:
+            self.preload(sock)
+        reply = execute_command(sock, "EVALSHA", script.sha, len(keys), *keys, *args)
+        if is_noscript(reply):
+            self.preload(sock, force=True)
+            reply = execute_command(sock, "EVALSHA", script.sha, len(keys), *keys, *args)
+        return reply
+
+    async def preload_async(self, client, force=False):
+        # client is an aio_client.AsyncConnection or AsyncClient; the loads
+        # are issued together and share the connection's in-flight window.
+        if force:
+            self._loaded.pop(client, None)
+        missing, loaded = self._missing(client)
+        if not missing:
+            return
+        replies = await asyncio.gather(
+            *(client.script_load(script.body) for script in missing)
+        )
+        for script, reply in zip(missing, replies):
+            if isinstance(reply, RespError):
+                raise reply
+            loaded.add(script.sha)
+
+    async def evalsha_async(self, client, script, keys=(), args=()):
+        loaded = self._loaded.get(client)
+        if loaded is None or script.sha not in loaded:
+            await self.preload_async(client)
+        reply = await client.evalsha(script.sha, keys, args)
+        if is_noscript(reply):
+            await self.preload_async(client, force=True)
+            reply = await client.evalsha(script.sha, keys, args)
+        return reply
@@ -0,0 +1,1281 @@
+import argparse
+import asyncio
+import bisect
+import fnmatch
+import math
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import deque
+from decimal import Decimal
+from operator import itemgetter
+
+from aio_client import CountingStreamReader, read_response
+from rdb_reader import RdbReader
+from rdb_writer import RdbWriter
+from resp import encode_command
+from scripts import script_sha
+
+# Reply formats follow the .NET server (CommandHandlers/*.cs), quirks
+# included: LPUSH/RPUSH answer +OK, ZREM counts the members it was given,
+# ZRANGE has no negative indexes, Pub/Sub pushes are always "message" and
+# FLUSHALL only drops scripts. Known bugs are not copied: INCRBY adds, the
+# stream sequence for a repeated millisecond keeps counting up, and every
+# write is replicated (CommandTypeMapper misspells zadd and zincrby).
+
+OK = b"+OK\r\n"
+NIL = b"$-1\r\n"
+QUEUED = b"+QUEUED\r\n"
+NOAUTH = b"-NOAUTH Authentication required.\r\n"
+
+REPLID = "8371b4fb1155b71f4a04d3e1bc3e18c4a990aeeb"
+
+WRITE_COMMANDS = frozenset({
+    "SET", "INCR", "INCRBY",
+    "LPUSH", "RPUSH", "LPOP", "RPOP", "LREM",
+    "ZADD", "ZINCRBY", "ZREM", "ZREMRANGEBYSCORE", "ZREMRANGEBYRANK",
+    "XADD",
+})
+
+# Accepted before AUTH, and while a MULTI is open.
+SAFE_COMMANDS = frozenset({"AUTH", "PING"})
+TRANSACTION_COMMANDS = frozenset({"EXEC", "DISCARD"})
+
+WRITE_HIGH_WATER = 256 * 1024
+MAX_INT32 = 2**31 - 1
+
+
+def bulk(value):
+    if value is None:
+        return NIL
+    data = value.encode("utf-8", "surrogateescape")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+def integer(n):
+    return b":%d\r\n" % n
+
+
+def error(message):
+    return f"-{message}\r\n".encode()
+
+
+def array(items):
+    return b"*%d\r\n" % len(items) + b"".join(items)
+
+
+def bulk_array(values):
+    return array([bulk(value) for value in values])
+
+
+def arity_error(name):
+    return error(f"ERR wrong number of arguments for '{name.lower()}'")
+
+
+def format_score(score):
+    # Double.ToString() on .NET: the shortest digits that round-trip, with
+    # exponent form below 1E-04 and from 1E+15 up.
+    if math.isnan(score):
+        return "NaN"
+    if math.isinf(score):
+        return "Infinity" if score > 0 else "-Infinity"
+    if score == 0:
+        return "-0" if math.copysign(1.0, score) < 0 else "0"
+    sign, digit_tuple, exponent = Decimal(repr(score)).as_tuple()
+    digits = "".join(map(str, digit_tuple))
+    stripped = digits.rstrip("0")
+    exponent += len(digits) - len(stripped)
+    digits = stripped
+    point = len(digits) + exponent
+    sci = point - 1
+    if -5 < sci < 15:
+        if point <= 0:
+            text = "0." + "0" * -point + digits
+        elif point >= len(digits):
+            text = digits + "0" * (point - len(digits))
+        else:
+            text = digits[:point] + "." + digits[point:]
+    else:
+        mantissa = digits[0] + ("." + digits[1:] if len(digits) > 1 else "")
+        text = f"{mantissa}E{'+' if sci >= 0 else '-'}{abs(sci):02d}"
+    return ("-" if sign else "") + text
+
+
+def parse_double(text):
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    return None if math.isnan(value) else value
+
+
+def parse_int32(text):
+    try:
+        value = int(text)
+    except ValueError:
+        return None
+    return value if -MAX_INT32 - 1 <= value <= MAX_INT32 else None
+
+
+_score = itemgetter(0)
+
+
+class SortedSet:
+    # member -> score, plus (score, member) pairs kept in order so ranks and
+    # score ranges are binary searches. Inserts shift the list (a memmove),
+    # which stays cheap well past the sizes the benchmarks use.
+    def __init__(self):
+        self.scores = {}
+        self._items = []
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, member, score):
+        old = self.scores.get(member)
+        if old is not None:
+            if old == score:
+                return
+            del self._items[bisect.bisect_left(self._items, (old, member))]
+        self.scores[member] = score
+        bisect.insort(self._items, (score, member))
+
+    def remove(self, member):
+        score = self.scores.pop(member, None)
+        if score is None:
+            return False
+        del self._items[bisect.bisect_left(self._items, (score, member))]
+        return True
+
+    def rank(self, member):
+        score = self.scores.get(member)
+        if score is None:
+            return None
+        return bisect.bisect_left(self._items, (score, member))
+
+    def _score_bounds(self, low, high):
+        return (
+            bisect.bisect_left(self._items, low, key=_score),
+            bisect.bisect_right(self._items, high, key=_score),
+        )
+
+    def count(self, low, high):
+        lo, hi = self._score_bounds(low, high)
+        return max(hi - lo, 0)
+
+    def range_by_score(self, low, high):
+        lo, hi = self._score_bounds(low, high)
+        return self._items[lo:hi]
+
+    def range_by_rank(self, start, end):
+        # Skiplist.GetByIndex: inclusive ranks, start <= end, no negatives.
+        if end < start or end < 0:
+            return []
+        return self._items[max(start, 0):end + 1]
+
+    def remove_range(self, lo, hi):
+        removed = self._items[lo:hi]
+        del self._items[lo:hi]
+        for _, member in removed:
+            del self.scores[member]
+        return len(removed)
+
+    def remove_range_by_score(self, low, high):
+        lo, hi = self._score_bounds(low, high)
+        return self.remove_range(lo, max(hi, lo))
+
+    def remove_range_by_rank(self, start, end):
+        if end < start or end < 0:
+            return 0
+        return self.remove_range(max(start, 0), end + 1)
+
+    def items(self):
+        return [(member, score) for score, member in self._items]
+
+
+class Stream:
+    def __init__(self):
+        self.ids = []
+        self.entries = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, entry_id, fields):
+        self.ids.append(entry_id)
+        self.entries.append(fields)
+
+    def range(self, start, end=None):
+        # Both ends inclusive; end=None means up to the last entry.
+        lo = bisect.bisect_left(self.ids, start)
+        hi = len(self.ids) if end is None else bisect.bisect_right(self.ids, end)
+        return list(zip(self.ids[lo:hi], self.entries[lo:hi]))
+
+
+def format_id(entry_id):
+    return f"{entry_id[0]}-{entry_id[1]}"
+
+
+def parse_range_id(text, default_seq):
+    ms, sep, seq = text.partition("-")
+    return int(ms), int(seq) if sep else default_seq
+
+
+def encode_entries(entries):
+    items = []
+    for entry_id, fields in entries:
+        values = []
+        for field, value in fields.items():
+            values += (field, value)
+        items.append(array([bulk(format_id(entry_id)), bulk_array(values)]))
+    return array(items)
+
+
+def split_commands(data):
+    # CommandParser.ParseCommands on one read: bytes up to the next "*" are
+    # skipped, so a read that starts inside a command resynchronises on a
+    # later one, and a command that does not end inside the read is lost.
+    commands = []
+    offset = 0
+    while True:
+        start = data.find(b"*", offset)
+        line_end = data.find(b"\r\n", start)
+        if start < 0 or line_end < 0:
+            return commands
+        try:
+            count = int(data[start + 1:line_end])
+        except ValueError:
+            offset = start + 1
+            continue
+        offset = line_end + 2
+        args = []
+        for _ in range(count):
+            line_end = data.find(b"\r\n", offset)
+            if data[offset:offset + 1] != b"$" or line_end < 0:
+                return commands
+            try:
+                length = int(data[offset + 1:line_end])
+            except ValueError:
+                return commands
+            offset = line_end + 2
+            if offset + length + 2 > len(data):
+                return commands
+            args.append(data[offset:offset + length])
+            offset += length + 2
+        if args:
+            commands.append(args)
+
+
+class Client:
+    def __init__(self, writer, authed):
+        self.writer = writer
+        self.authed = authed
+        self.queued = None
+        self.channels = set()
+        self.patterns = set()
+        self.is_replica = False
+        self.ack_offset = 0
+        self.task = asyncio.current_task()
+
+    def send(self, data):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+
+class StandInServer:
+    # A pure-Python server speaking the same RESP subset as memoryDb, for
+    # running clients and benchmarks without the .NET runtime. Everything
+    # runs on one event loop, so handlers need no locks. With replicaof set
+    # it does the same PSYNC handshake as ReplicationClientHandler and then
+    # applies the master's command stream.
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        password=None,
+        replicaof=None,
+        dir=None,
+        dbfilename=None,
+        read_size=None,
+    ):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.replicaof = replicaof
+        self.dir = dir or tempfile.gettempdir()
+        self.dbfilename = dbfilename
+        # With read_size set, requests are read in chunks of that many bytes
+        # and a command cut off by the end of a chunk is dropped, like
+        # RedisServerListener with its 1024 byte buffer. None reads whole
+        # frames, however they arrive.
+        self.read_size = read_size
+        # Bytes sent to replicas (master) or applied from the master (replica).
+        self.sent_offset = 0
+        self.applied_offset = 0
+        self.synced = None
+        self._server = None
+        self._replication = None
+        self._clients = set()
+        self._replicas = []
+        self._channels = {}
+        self._patterns = {}
+        self._stream_waiters = {}
+        self._ack_event = None
+        self._commands = self._command_table()
+        self.reset()
+
+    def _command_table(self):
+        return {name[4:].upper(): getattr(self, name) for name in dir(self) if name.startswith("cmd_")}
+
+    def reset(self):
+        # Drops every key and script; there is no command for this because
+        # the .NET FLUSHALL keeps the data.
+        self.strings = {}
+        self.lists = {}
+        self.zsets = {}
+        self.streams = {}
+        self.scripts = {}
+        self.last_stream_id = None
+
+    @property
+    def repl_offset(self):
+        return self.applied_offset if self.replicaof else self.sent_offset
+
+    @property
+    def role(self):
+        return "slave" if self.replicaof else "master"
+
+    # -- lifecycle --------------------------------------------------------
+
+    async def start(self):
+        self.synced = asyncio.Event()
+        self._ack_event = asyncio.Event()
+        if self.dbfilename:
+            path = os.path.join(self.dir, self.dbfilename)
+            if not self.replicaof and os.path.exists(path):
+                self.load_rdb(path)
+        self._server = await asyncio.start_server(self._serve_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.replicaof:
+            self._replication = asyncio.create_task(self._replicate())
+        else:
+            self.synced.set()
+        return self
+
+    async def stop(self):
+        if self._replication is not None:
+            self._replication.cancel()
+            try:
+                await self._replication
+            except (asyncio.CancelledError, OSError):
+                pass
+        if self._server is not None:
+            self._server.close()
+        clients = list(self._clients)
+        for client in clients:
+            client.writer.close()
+        # Closed transports end each reader with EOF; let them finish.
+        await asyncio.gather(*(client.task for client in clients), return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    async def _serve_client(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = Client(writer, authed=self.password is None)
+        self._clients.add(client)
+        try:
+            async for frame in self._frames(reader):
+                if not isinstance(frame, list) or not frame:
+                    continue
+                args = [
+                    item.decode("utf-8", "surrogateescape") if isinstance(item, bytes) else str(item)
+                    for item in frame
+                ]
+                reply = await self.execute(client, args)
+                if reply:
+                    writer.write(reply)
+                    if writer.transport.get_write_buffer_size() > WRITE_HIGH_WATER:
+                        await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._disconnect(client)
+
+    async def _frames(self, reader):
+        if not self.read_size:
+            while True:
+                yield await read_response(reader, None)
+        while True:
+            chunk = await reader.read(self.read_size)
+            if not chunk:
+                return
+            for frame in split_commands(chunk):
+                yield frame
+
+    def _disconnect(self, client):
+        self._clients.discard(client)
+        for channel in client.channels:
+            self._channels.get(channel, set()).discard(client)
+        for pattern in client.patterns:
+            self._patterns.get(pattern, set()).discard(client)
+        if client in self._replicas:
+            self._replicas.remove(client)
+        client.writer.close()
+
+    # -- dispatch ---------------------------------------------------------
+
+    async def execute(self, client, args):
+        name = args[0].upper()
+        if client.queued is not None and name not in TRANSACTION_COMMANDS:
+            client.queued.append(args)
+            return QUEUED
+        if not client.authed and name not in SAFE_COMMANDS:
+            return NOAUTH
+        handler = self._commands.get(name)
+        if handler is None:
+            return error(f"ERR invalid command {args[0]}")
+        params = args[1:]
+        try:
+            reply = handler(client, params)
+            if asyncio.iscoroutine(reply):
+                reply = await reply
+        except (ValueError, IndexError):
+            return error("ERR unexpected error")
+        if name in WRITE_COMMANDS and self._replicas and not reply.startswith(b"-"):
+            # Handlers may rewrite params (XADD fills in the generated ID).
+            self.propagate([args[0], *params])
+        return reply
+
+    def propagate(self, args):
+        frame = encode_command(args)
+        for replica in self._replicas:
+            replica.send(frame)
+        self.sent_offset += len(frame)
+
+    # -- connection, server and replication commands ----------------------
+
+    def cmd_ping(self, client, args):
+        return b"+PONG\r\n"
+
+    def cmd_echo(self, client, args):
+        if not args:
+            return arity_error("echo")
+        return bulk(args[0])
+
+    def cmd_auth(self, client, args):
+        if not args:
+            return arity_error("auth")
+        if self.password is None or args[-1] == self.password:
+            client.authed = True
+            return OK
+        return error("ERR invalid password")
+
+    def cmd_info(self, client, args):
+        # master_repl_offset is the live offset here; the .NET server always
+        # reports 0.
+        text = (
+            f"role:{self.role}\n"
+            f"master_replid:{REPLID}\n"
+            f"master_repl_offset:{self.repl_offset}\n"
+            f"dir:{self.dir.lower()}\n"
+            f"db_file_name:{(self.dbfilename or 'rdbfile').lower()}\n"
+        )
+        return bulk(text)
+
+    def cmd_config(self, client, args):
+        if len(args) < 2:
+            return arity_error("config")
+        values = {"dir": self.dir, "dbfilename": self.dbfilename or "rdbfile"}
+        found = {}
+        for name in args[1:]:
+            name = name.lower()
+            if name in values:
+                found[name] = values[name]
+        return bulk_array([item for pair in found.items() for item in pair])
+
+    def cmd_keys(self, client, args):
+        if not args:
+            return arity_error("keys")
+        self._expire_strings()
+        keys = [*self.strings, *self.lists, *self.zsets, *self.streams]
+        return bulk_array([key for key in keys if fnmatch.fnmatchcase(key, args[0])])
+
+    def cmd_type(self, client, args):
+        # Like MemoryDatabaseRouter.GetType: only strings and streams.
+        if not args:
+            return arity_error("type")
+        if self._get_string(args[0]) is not None:
+            return b"+string\r\n"
+        if args[0] in self.streams:
+            return b"+stream\r\n"
+        return b"+none\r\n"
+
+    def cmd_multi(self, client, args):
+        client.queued = []
+        return OK
+
+    async def cmd_exec(self, client, args):
+        if client.queued is None:
+            return error("ERR EXEC without MULTI")
+        queued, client.queued = client.queued, None
+        replies = [await self.execute(client, command) for command in queued]
+        return array(replies)
+
+    def cmd_discard(self, client, args):
+        if client.queued is None:
+            return error("ERR DISCARD without MULTI")
+        client.queued = None
+        return OK
+
+    def cmd_replconf(self, client, args):
+        if len(args) >= 2 and args[0].lower() == "ack":
+            client.ack_offset = int(args[1])
+            self._ack_event.set()
+            return b""
+        return OK
+
+    def cmd_psync(self, client, args):
+        # Same framing as PSYNC.Commander.cs, trailing CRLF after the RDB
+        # included. From here on the connection receives every write.
+        rdb = self.dump_rdb()
+        client.is_replica = True
+        client.ack_offset = self.sent_offset
+        self._replicas.append(client)
+        return (
+            f"+FULLRESYNC {REPLID} 0\r\n".encode()
+            + b"$%d\r\n" % len(rdb)
+            + rdb
+            + b"\r\n"
+        )
+
+    async def cmd_wait(self, client, args):
+        if len(args) < 2:
+            return arity_error("wait")
+        wanted, timeout = int(args[0]), int(args[1]) / 1000
+        target = self.sent_offset
+
+        def in_sync():
+            return sum(1 for replica in self._replicas if replica.ack_offset >= target)
+
+        if in_sync() == len(self._replicas):
+            return integer(len(self._replicas))
+        self.propagate(["REPLCONF", "GETACK", "*"])
+        deadline = time.monotonic() + timeout
+        while in_sync() < wanted:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._ack_event.clear()
+            try:
+                await asyncio.wait_for(self._ack_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return integer(in_sync())
+
+    # -- strings ----------------------------------------------------------
+
+    def _get_string(self, key):
+        item = self.strings.get(key)
+        if item is None:
+            return None
+        value, expire_ms = item
+        if expire_ms is not None and expire_ms <= time.time() * 1000:
+            del self.strings[key]
+            return None
+        return value
+
+    def _expire_strings(self):
+        for key in list(self.strings):
+            self._get_string(key)
+
+    def cmd_set(self, client, args):
+        if len(args) < 2:
+            return arity_error("set")
+        expire_ms = None
+        for i in range(2, len(args) - 1, 2):
+            flag = args[i].lower()
+            if flag == "px":
+                expire_ms = time.time() * 1000 + int(args[i + 1])
+            elif flag == "ex":
+                expire_ms = time.time() * 1000 + int(args[i + 1]) * 1000
+        self.strings[args[0]] = (args[1], expire_ms)
+        return OK
+
+    def cmd_get(self, client, args):
+        if not args:
+            return arity_error("get")
+        return bulk(self._get_string(args[0]))
+
+    def _increment(self, key, amount):
+        value = self._get_string(key)
+        if value is None:
+            number = amount
+        else:
+            try:
+                number = int(value) + amount
+            except ValueError:
+                return error("ERR value is not an integer or out of range")
+        self.strings[key] = (str(number), self.strings.get(key, (None, None))[1])
+        return integer(number)
+
+    def cmd_incr(self, client, args):
+        if not args:
+            return arity_error("incr")
+        return self._increment(args[0], 1)
+
+    def cmd_incrby(self, client, args):
+        if len(args) < 2:
+            return arity_error("incrby")
+        return self._increment(args[0], int(args[1]))
+
+    # -- lists ------------------------------------------------------------
+
+    def cmd_lpush(self, client, args):
+        if len(args) < 2:
+            return arity_error("lpush")
+        self.lists.setdefault(args[0], deque()).appendleft(args[1])
+        return OK
+
+    def cmd_rpush(self, client, args):
+        if len(args) < 2:
+            return arity_error("rpush")
+        self.lists.setdefault(args[0], deque()).append(args[1])
+        return OK
+
+    def _pop(self, key, left):
+        items = self.lists.get(key)
+        if not items:
+            return NIL
+        value = items.popleft() if left else items.pop()
+        if not items:
+            del self.lists[key]
+        return bulk(value)
+
+    def cmd_lpop(self, client, args):
+        if not args:
+            return arity_error("lpop")
+        return self._pop(args[0], left=True)
+
+    def cmd_rpop(self, client, args):
+        if not args:
+            return arity_error("rpop")
+        return self._pop(args[0], left=False)
+
+    def cmd_lrange(self, client, args):
+        if len(args) < 3:
+            return arity_error("lrange")
+        items = self.lists.get(args[0], ())
+        start, end = int(args[1]), int(args[2])
+        size = len(items)
+        if start < 0:
+            start = max(size + start, 0)
+        if end < 0:
+            end = size + end
+        end = min(end, size - 1)
+        if start > end:
+            return array([])
+        if start == 0 and end == size - 1:
+            return bulk_array(items)
+        return bulk_array([items[i] for i in range(start, end + 1)])
+
+    def cmd_llen(self, client, args):
+        if not args:
+            return arity_error("llen")
+        return integer(len(self.lists.get(args[0], ())))
+
+    def cmd_lrem(self, client, args):
+        if len(args) < 3:
+            return arity_error("lrem")
+        count = parse_int32(args[1])
+        if count is None:
+            return error("ERR count is not an integer")
+        items = self.lists.get(args[0])
+        if not items:
+            return integer(0)
+        value = args[2]
+        limit = abs(count) or len(items)
+        ordered = list(items) if count >= 0 else list(reversed(items))
+        kept = []
+        removed = 0
+        for item in ordered:
+            if item == value and removed < limit:
+                removed += 1
+            else:
+                kept.append(item)
+        if count < 0:
+            kept.reverse()
+        if kept:
+            self.lists[args[0]] = deque(kept)
+        else:
+            del self.lists[args[0]]
+        return integer(removed)
+
+    # -- sorted sets ------------------------------------------------------
+
+    def cmd_zadd(self, client, args):
+        if len(args) < 3:
+            return arity_error("zadd")
+        zset = self.zsets.setdefault(args[0], SortedSet())
+        added = 0
+        for i in range(1, len(args) - 1, 2):
+            score = parse_double(args[i])
+            if score is not None:
+                zset.add(args[i + 1], score)
+                added += 1
+        if not zset:
+            del self.zsets[args[0]]
+        return integer(added)
+
+    def cmd_zscore(self, client, args):
+        if len(args) < 2:
+            return arity_error("zscore")
+        zset = self.zsets.get(args[0])
+        score = zset.scores.get(args[1]) if zset is not None else None
+        return NIL if score is None else bulk(format_score(score))
+
+    def cmd_zincrby(self, client, args):
+        if len(args) < 3:
+            return arity_error("zincrby")
+        amount = parse_double(args[1])
+        if amount is None:
+            return error("ERR improper value type for arg increaseBy")
+        zset = self.zsets.setdefault(args[0], SortedSet())
+        score = zset.scores.get(args[2], 0.0) + amount
+        zset.add(args[2], score)
+        return bulk(format_score(score))
+
+    def cmd_zrem(self, client, args):
+        if len(args) < 2:
+            return arity_error("zrem")
+        zset = self.zsets.get(args[0])
+        if zset is not None:
+            for member in args[1:]:
+                zset.remove(member)
+            if not zset:
+                del self.zsets[args[0]]
+        return integer(len(args) - 1)
+
+    def _score_args(self, args):
+        low, high = parse_double(args[1]), parse_double(args[2])
+        if low is None or high is None:
+            return None
+        return low, high
+
+    def _rank_args(self, args):
+        start, end = parse_int32(args[1]), parse_int32(args[2])
+        if start is None or end is None:
+            return None
+        return start, end
+
+    def cmd_zremrangebyscore(self, client, args):
+        if len(args) < 3:
+            return arity_error("zremrangebyscore")
+        bounds = self._score_args(args)
+        if bounds is None:
+            return error("ERR min or max is not a valid double")
+        zset = self.zsets.get(args[0])
+        return integer(zset.remove_range_by_score(*bounds) if zset is not None else 0)
+
+    def cmd_zremrangebyrank(self, client, args):
+        if len(args) < 3:
+            return arity_error("zremrangebyrank")
+        bounds = self._rank_args(args)
+        if bounds is None:
+            return error("ERR start or end is not a valid int")
+        zset = self.zsets.get(args[0])
+        return integer(zset.remove_range_by_rank(*bounds) if zset is not None else 0)
+
+    def cmd_zrank(self, client, args):
+        if len(args) < 2:
+            return arity_error("zrank")
+        zset = self.zsets.get(args[0])
+        rank = zset.rank(args[1]) if zset is not None else None
+        return integer(-1 if rank is None else rank)
+
+    def cmd_zrevrank(self, client, args):
+        if len(args) < 2:
+            return arity_error("zrevrank")
+        zset = self.zsets.get(args[0])
+        rank = zset.rank(args[1]) if zset is not None else None
+        return integer(-1 if rank is None else len(zset) - 1 - rank)
+
+    def cmd_zcard(self, client, args):
+        if not args:
+            return arity_error("zcard")
+        return integer(len(self.zsets.get(args[0], ())))
+
+    def cmd_zcount(self, client, args):
+        if len(args) < 3:
+            return arity_error("zcount")
+        bounds = self._score_args(args)
+        if bounds is None:
+            return error("ERR min or max is not a valid double")
+        zset = self.zsets.get(args[0])
+        return integer(zset.count(*bounds) if zset is not None else 0)
+
+    def _zrange_reply(self, items, args, reverse):
+        with_scores = len(args) > 3 and args[3].upper() == "WITHSCORES"
+        if reverse:
+            items = items[::-1]
+        values = []
+        for score, member in items:
+            values.append(member)
+            if with_scores:
+                values.append(format_score(score))
+        return bulk_array(values)
+
+    def _zrange(self, args, reverse):
+        # ZREVRANGE key a b reads ranks b..a and reverses them, as
+        # ZReverseRangeCommand does; same for the score bounds.
+        bounds = self._rank_args(args)
+        if bounds is None:
+            return error("ERR start or end is not a valid int")
+        start, end = bounds[::-1] if reverse else bounds
+        zset = self.zsets.get(args[0])
+        items = zset.range_by_rank(start, end) if zset is not None else []
+        return self._zrange_reply(items, args, reverse)
+
+    def _zrangebyscore(self, args, reverse):
+        bounds = self._score_args(args)
+        if bounds is None:
+            return error("ERR min or max is not a valid double")
+        low, high = bounds[::-1] if reverse else bounds
+        zset = self.zsets.get(args[0])
+        items = zset.range_by_score(low, high) if zset is not None else []
+        return self._zrange_reply(items, args, reverse)
+
+    def cmd_zrange(self, client, args):
+        if len(args) < 3:
+            return arity_error("zrange")
+        return self._zrange(args, reverse=False)
+
+    def cmd_zrevrange(self, client, args):
+        if len(args) < 3:
+            return arity_error("zrevrange")
+        return self._zrange(args, reverse=True)
+
+    def cmd_zrangebyscore(self, client, args):
+        if len(args) < 3:
+            return arity_error("zrangebyscore")
+        return self._zrangebyscore(args, reverse=False)
+
+    def cmd_zrevrangebyscore(self, client, args):
+        if len(args) < 3:
+            return arity_error("zrevrangebyscore")
+        return self._zrangebyscore(args, reverse=True)
+
+    # -- streams ----------------------------------------------------------
+
+    def _new_stream_id(self, spec):
+        # IDs are checked against the last ID of any stream, like
+        # StreamIdHandler, not per stream.
+        last = self.last_stream_id
+        if spec == "*":
+            ms = int(time.time() * 1000)
+            if last is not None and last[0] > ms:
+                ms = last[0]
+            seq = None
+        else:
+            ms_text, sep, seq_text = spec.partition("-")
+            if not sep:
+                raise ValueError(spec)
+            ms = int(ms_text)
+            seq = None if seq_text == "*" else int(seq_text)
+        if seq is None:
+            if last is not None and last[0] == ms:
+                seq = last[1] + 1
+            else:
+                seq = 1 if ms == 0 else 0
+
+        if (ms == 0 and seq < 1) or seq < 0 or ms < 0:
+            return None, error("ERR The ID specified in XADD must be greater than 0-0")
+        if last is not None and (ms, seq) <= last:
+            return None, error(
+                "ERR The ID specified in XADD is equal or smaller than the target stream top item"
+            )
+        return (ms, seq), None
+
+    def cmd_xadd(self, client, args):
+        if len(args) < 2:
+            return arity_error("xadd")
+        entry_id, failure = self._new_stream_id(args[1])
+        if failure is not None:
+            return failure
+        fields = {args[i].lower(): args[i + 1] for i in range(2, len(args) - 1, 2)}
+        self.last_stream_id = entry_id
+        self.streams.setdefault(args[0], Stream()).append(entry_id, fields)
+        # Replicas get the generated ID rather than "*".
+        args[1] = format_id(entry_id)
+        for waiter in self._stream_waiters.pop(args[0], ()):
+            if not waiter.done():
+                waiter.set_result((entry_id, fields))
+        return bulk(args[1])
+
+    def cmd_xrange(self, client, args):
+        if len(args) < 3:
+            return arity_error("xrange")
+        stream = self.streams.get(args[0])
+        if stream is None:
+            return array([])
+        start = (0, 0) if args[1] == "-" else parse_range_id(args[1], 0)
+        end = None if args[2] == "+" else parse_range_id(args[2], math.inf)
+        return encode_entries(stream.range(start, end))
+
+    async def _read_stream(self, key, start, timeout):
+        # StreamService.GetEntriesInReadAsync: entries from start on
+        # (inclusive), else wait up to timeout for the next XADD.
+        if start != "$":
+            stream = self.streams.get(key)
+            begin = (0, 0) if start == "-" else parse_range_id(start, 0)
+            entries = stream.range(begin) if stream is not None else []
+            if entries or timeout is None:
+                return entries
+        if timeout is None:
+            return []
+        waiter = asyncio.get_running_loop().create_future()
+        self._stream_waiters.setdefault(key, []).append(waiter)
+        try:
+            return [await asyncio.wait_for(waiter, timeout)]
+        except asyncio.TimeoutError:
+            return []
+
+    async def cmd_xread(self, client, args):
+        if len(args) < 3:
+            return arity_error("xread")
+        timeout = None
+        keys, starts = [], []
+        i = 0
+        while i < len(args):
+            if args[i] == "streams":
+                names = args[i + 1:]
+                half = len(names) // 2
+                keys, starts = names[:half], names[half:half * 2]
+                break
+            if args[i].lower() == "block" and i + 1 < len(args):
+                timeout = parse_double(args[i + 1])
+                timeout = None if timeout is None else timeout / 1000
+                i += 1
+            i += 1
+        results = await asyncio.gather(
+            *(self._read_stream(key, start, timeout) for key, start in zip(keys, starts))
+        )
+        found = [
+            array([bulk(key), encode_entries(entries)])
+            for key, entries in zip(keys, results)
+            if entries
+        ]
+        return array(found) if found else NIL
+
+    # -- pub/sub ----------------------------------------------------------
+
+    def _subscription_reply(self, client, kind, name):
+        count = len(client.channels) + len(client.patterns)
+        return bulk_array([kind, name, str(count)])
+
+    def cmd_subscribe(self, client, args):
+        if not args:
+            return arity_error("subscribe")
+        replies = []
+        for channel in args:
+            client.channels.add(channel)
+            self._channels.setdefault(channel, set()).add(client)
+            replies.append(self._subscription_reply(client, "subscribe", channel))
+        return b"".join(replies)
+
+    def cmd_unsubscribe(self, client, args):
+        if not args:
+            return arity_error("unsubscribe")
+        replies = []
+        for channel in args:
+            client.channels.discard(channel)
+            self._channels.get(channel, set()).discard(client)
+            replies.append(self._subscription_reply(client, "unsubscribe", channel))
+        return b"".join(replies)
+
+    def cmd_psubscribe(self, client, args):
+        if not args:
+            return arity_error("psubscribe")
+        replies = []
+        for pattern in args:
+            client.patterns.add(pattern)
+            self._patterns.setdefault(pattern, set()).add(client)
+            replies.append(self._subscription_reply(client, "psubscribe", pattern))
+        return b"".join(replies)
+
+    def cmd_punsubscribe(self, client, args):
+        if not args:
+            return arity_error("punsubscribe")
+        replies = []
+        for pattern in args:
+            client.patterns.discard(pattern)
+            self._patterns.get(pattern, set()).discard(client)
+            replies.append(self._subscription_reply(client, "punsubscribe", pattern))
+        return b"".join(replies)
+
+    def cmd_publish(self, client, args):
+        if len(args) < 2:
+            return arity_error("publish")
+        channel, data = args[0], args[1]
+        # Pattern matches get a plain "message" push too, like PublishService.
+        push = bulk_array(["message", channel, data])
+        receivers = 0
+        for subscriber in self._channels.get(channel, ()):
+            subscriber.send(push)
+            receivers += 1
+        for pattern, subscribers in self._patterns.items():
+            if subscribers and fnmatch.fnmatchcase(channel, pattern):
+                for subscriber in subscribers:
+                    subscriber.send(push)
+                    receivers += 1
+        return integer(receivers)
+
+    # -- scripts ----------------------------------------------------------
+
+    def cmd_script(self, client, args):
+        sub = args[0].upper() if args else ""
+        if sub == "LOAD":
+            if len(args) < 2:
+                return error("ERR wrong number of arguments for 'SCRIPT LOAD'")
+            sha = script_sha(args[1])
+            self.scripts[sha] = args[1]
+            return bulk(sha)
+        if sub == "EXISTS":
+            if len(args) < 2:
+                return error("ERR wrong number of arguments for 'SCRIPT EXISTS'")
+            return array([integer(1 if sha in self.scripts else 0) for sha in args[1:]])
+        if sub == "FLUSH":
+            if len(args) < 2:
+                return error("ERR wrong number of arguments for 'SCRIPT FLUSH'")
+            if self.scripts.pop(args[1], None) is None:
+                return error("NOSCRIPT No matching script to flush")
+            return OK
+        return error("ERR wrong argument for 'SCRIPT'")
+
+    def cmd_flushall(self, client, args):
+        self.scripts.clear()
+        return OK
+
+    def cmd_eval(self, client, args):
+        return error("ERR Lua scripts are not supported by the stand-in server")
+
+    def cmd_evalsha(self, client, args):
+        if len(args) < 2:
+            return error("ERR wrong number of arguments for 'EVALSHA'")
+        if args[0] not in self.scripts:
+            return error("NOSCRIPT No matching script.")
+        return self.cmd_eval(client, args)
+
+    # -- RDB --------------------------------------------------------------
+
+    def dump_rdb(self):
+        self._expire_strings()
+        writer = RdbWriter()
+        for key, (value, expire_ms) in self.strings.items():
+            writer.add_string(key, value, None if expire_ms is None else int(expire_ms))
+        for key, stream in self.streams.items():
+            writer.add_stream(key, zip(stream.ids, stream.entries))
+        for key, items in self.lists.items():
+            writer.add_list(key, items)
+        for key, zset in self.zsets.items():
+            writer.add_zset(key, zset.items())
+        return writer.getvalue()
+
+    def load_rdb(self, path):
+        now_ms = time.time() * 1000
+        with RdbReader(path) as reader:
+            for entry in reader:
+                if entry.type == "string":
+                    if entry.expire_ms is None or entry.expire_ms > now_ms:
+                        self.strings[entry.key] = (entry.value, entry.expire_ms)
+                elif entry.type == "list":
+                    self.lists[entry.key] = deque(entry.value)
+                elif entry.type == "zset":
+                    zset = self.zsets[entry.key] = SortedSet()
+                    for member, score in entry.value:
+                        zset.add(member, score)
+                elif entry.type == "stream":
+                    stream = self.streams.setdefault(entry.key, Stream())
+                    for entry_id, fields in entry.value:
+                        parsed = parse_range_id(entry_id, 0)
+                        stream.append(parsed, fields)
+                        if self.last_stream_id is None or parsed > self.last_stream_id:
+                            self.last_stream_id = parsed
+
+    async def _replicate(self):
+        host, port = self.replicaof
+        reader, writer = await asyncio.open_connection(host, port)
+        reader = CountingStreamReader(reader)
+        try:
+            handshake = [["PING"]]
+            if self.password is not None:
+                handshake.append(["AUTH", self.password])
+            handshake += [
+                ["REPLCONF", "listening-port", str(self.port)],
+                ["REPLCONF", "capa", "psync2"],
+            ]
+            for command in handshake:
+                writer.write(encode_command(command))
+                await read_response(reader)
+            writer.write(encode_command(["PSYNC", "?", "-1"]))
+            line = await reader.readuntil(b"\r\n")
+            if not line.startswith(b"+FULLRESYNC"):
+                raise ConnectionError(f"Unexpected PSYNC reply {line!r}")
+            length = int((await reader.readuntil(b"\r\n"))[1:-2])
+            rdb = await reader.readexactly(length)
+            await reader.readexactly(2)
+            self._load_rdb_bytes(rdb)
+            self.synced.set()
+
+            master = Client(writer, authed=True)
+            while True:
+                start = reader.position
+                frame = await read_response(reader, None)
+                args = [item.decode("utf-8", "surrogateescape") for item in frame]
+                if args[0].upper() == "REPLCONF" and len(args) > 1 and args[1].upper() == "GETACK":
+                    # Acknowledge what was applied before this GETACK.
+                    writer.write(encode_command(["REPLCONF", "ACK", str(self.applied_offset)]))
+                else:
+                    await self.execute(master, args)
+                self.applied_offset += reader.position - start
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    def _load_rdb_bytes(self, rdb):
+        self.reset()
+        if self.dbfilename:
+            path = os.path.join(self.dir, self.dbfilename)
+            with open(path, "wb") as f:
+                f.write(rdb)
+            self.load_rdb(path)
+            return
+        with tempfile.NamedTemporaryFile(suffix=".rdb", delete=False) as f:
+            f.write(rdb)
+        try:
+            self.load_rdb(f.name)
+        finally:
+            os.unlink(f.name)
+
+
+class StandInThread:
+    # Runs a StandInServer on its own event loop thread, for synchronous
+    # callers such as script.py and the benchmarks:
+    #
+    #   with StandInThread(password="pw") as master:
+    #       Connection("127.0.0.1", master.port, "pw")
+    def __init__(self, **kwargs):
+        self.server = StandInServer(**kwargs)
+        self.loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._error = None
+
+    @property
+    def port(self):
+        return self.server.port
+
+    def start(self, timeout=5.0):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout):
+            raise TimeoutError("Stand-in server did not start")
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.server.start())
+        except Exception as exc:
+            self._error = exc
+            self._ready.set()
+            self.loop.close()
+            return
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self.server.stop())
+            self.loop.close()
+
+    def call(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def wait_synced(self, timeout=5.0):
+        async def synced():
+            await asyncio.wait_for(self.server.synced.wait(), timeout)
+
+        self.call(synced())
+
+    def reset(self):
+        async def reset():
+            self.server.reset()
+
+        self.call(reset())
+
+    def stop(self):
+        if self._thread is None:
+            return
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def parse_args(argv=None):
+    # Same flags as the .NET server, so it can stand in for SERVER_DLL.
+    parser = argparse.ArgumentParser(description="Pure-Python stand-in for memoryDb")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--authpass")
+    parser.add_argument("--replicaof", metavar='"HOST PORT"')
+    parser.add_argument("--dir")
+    parser.add_argument("--dbfilename")
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    replicaof = None
+    if args.replicaof:
+        host, port = args.replicaof.split()
+        replicaof = (host, int(port))
+    server = StandInServer(
+        args.host,
+        args.port,
+        password=args.authpass,
+        replicaof=replicaof,
+        dir=args.dir,
+        dbfilename=args.dbfilename,
+    )
+    async with server:
+        print(f"Stand-in {server.role} listening on {server.host}:{server.port}", flush=True)
+        await asyncio.Event().wait()
+
+
+def main():
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# The tools are plain modules in script-to-start, not a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def warm_cluster():
+    # One stand-in master and replica for the whole session, started on
+    # first use and stopped at exit by shared_cluster.
+    from cluster import shared_cluster
+
+    return shared_cluster(replicas=1, standin=True)
+
+
+@pytest.fixture
+def cluster(warm_cluster):
+    # The warm cluster, reset for this test: build keys with cluster.key().
+    from cluster import shared_cluster
+
+    return shared_cluster(replicas=1, standin=True)
@@ -0,0 +1,53 @@
+import asyncio
+
+from aio_client import AsyncPubSub
+from connection_pool import Connection
+from standin import StandInThread
+
+
+def test_pubsub_subscribes_to_many_channels_through_split_reads():
+    # read_size makes the stand-in drop commands that straddle its 1024 byte
+    # reads the way memoryDb does, so every channel is only confirmed when
+    # no batch was split.
+    channels = [f"channel:{i:04}" for i in range(300)]
+
+    async def run(port):
+        pubsub = await AsyncPubSub.connect("127.0.0.1", port)
+        try:
+            await asyncio.wait_for(pubsub.subscribe(*channels), 5.0)
+            assert pubsub.channels == set(channels)
+
+            conn = Connection("127.0.0.1", port)
+            try:
+                assert conn.execute_command("PUBLISH", channels[-1], "hello") == 1
+            finally:
+                conn.close()
+            message = await asyncio.wait_for(pubsub.__anext__(), 5.0)
+            assert (message.channel, message.data) == (channels[-1], "hello")
+
+            await asyncio.wait_for(pubsub.unsubscribe(), 5.0)
+            assert pubsub.channels == set()
+        finally:
+            await pubsub.close()
+
+    with StandInThread(read_size=1024) as server:
+        asyncio.run(run(server.port))
+
+
+def test_pubsub_keeps_messages_read_while_subscribing():
+    async def run(port):
+        pubsub = await AsyncPubSub.connect("127.0.0.1", port)
+        conn = Connection("127.0.0.1", port)
+        try:
+            await pubsub.subscribe("first")
+            conn.execute_command("PUBLISH", "first", "early")
+            await pubsub.subscribe("second")
+            conn.execute_command("PUBLISH", "second", "late")
+            received = [await asyncio.wait_for(pubsub.__anext__(), 5.0) for _ in range(2)]
+            assert [(m.channel, m.data) for m in received] == [("first", "early"), ("second", "late")]
+        finally:
+            conn.close()
+            await pubsub.close()
+
+    with StandInThread() as server:
+        asyncio.run(run(server.port))
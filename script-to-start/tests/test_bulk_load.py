@@ -0,0 +1,24 @@
+from bulk_load import BulkLoader
+from connection_pool import Connection
+from standin import StandInThread
+
+
+def test_records_spanning_batches_keep_their_order():
+    items = [f"item{i}" for i in range(3000)]
+    entries = [{"id": f"1-{i + 1}", "fields": {"f": str(i)}} for i in range(300)]
+    records = [
+        {"type": "list", "key": "list", "values": items},
+        {"type": "stream", "key": "stream", "entries": entries},
+    ] + [{"type": "string", "key": f"k{i}", "value": "v"} for i in range(500)]
+
+    with StandInThread() as server:
+        loader = BulkLoader("127.0.0.1", server.port, connections=4, queue_size=8)
+        stats = loader.load(records)
+        conn = Connection("127.0.0.1", server.port)
+        try:
+            assert stats.errors == 0, loader.first_error
+            assert conn.execute_command("LRANGE", "list", 0, -1) == items
+            ids = [entry[0] for entry in conn.execute_command("XRANGE", "stream", "-", "+")]
+            assert ids == [entry["id"] for entry in entries]
+        finally:
+            conn.close()
@@ -0,0 +1,50 @@
+from cluster import READY_KEY, shared_cluster
+from connection_pool import Connection
+
+
+def _get(address, password, key):
+    conn = Connection(*address, password)
+    try:
+        return conn.execute_command("GET", key)
+    finally:
+        conn.close()
+
+
+def test_the_fixture_reuses_one_cluster(cluster, warm_cluster):
+    assert cluster is warm_cluster
+    master = cluster.master
+    assert shared_cluster(replicas=1, standin=True).master == master
+
+
+def test_reset_rotates_the_key_prefix(cluster):
+    key = cluster.key("counter")
+    assert key.startswith(cluster.prefix)
+    cluster.reset()
+    assert cluster.key("counter") != key
+    assert cluster.key("counter").startswith(cluster.prefix)
+
+
+def test_reset_leaves_replicas_synced(cluster):
+    replica = cluster.replicas[0]
+    key = cluster.key("value")
+    conn = Connection(*cluster.master, cluster.password)
+    try:
+        conn.execute_command("SET", key, "before")
+    finally:
+        conn.close()
+    cluster.reset()
+
+    # reset() returns once each replica serves the master's ready token,
+    # and the stand-ins drop keys written before it.
+    token = _get(cluster.master, cluster.password, READY_KEY)
+    assert token is not None
+    assert _get(replica, cluster.password, READY_KEY) == token
+    assert _get(replica, cluster.password, key) is None
+
+    conn = Connection(*cluster.master, cluster.password)
+    try:
+        conn.execute_command("SET", cluster.key("value"), "after")
+    finally:
+        conn.close()
+    cluster.wait_for_replicas()
+    assert _get(replica, cluster.password, cluster.key("value")) == "after"
@@ -0,0 +1,83 @@
+import math
+from array import array
+
+import pytest
+
+import columnar
+from columnar import ScoredColumns, StreamColumns, execute_columnar, execute_numbers
+from connection_pool import Connection
+from resp import RespError
+from standin import StandInThread
+
+
+@pytest.fixture
+def conn():
+    with StandInThread() as server:
+        conn = Connection("127.0.0.1", server.port)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+def test_withscores_replies_become_member_and_score_columns(conn):
+    for score, member in ((1.5, "a"), (2, "b"), (-3.25, "c")):
+        conn.execute_command("ZADD", "z", score, member)
+
+    reply = execute_columnar(conn, "ZRANGE", "z", 0, 10, "WITHSCORES", use_numpy=False)
+    assert reply == ScoredColumns(["c", "a", "b"], array("d", [-3.25, 1.5, 2.0]))
+    reply = execute_columnar(conn, "ZRANGEBYSCORE", "z", 0, 5, "withscores", use_numpy=False)
+    assert reply == ScoredColumns(["a", "b"], array("d", [1.5, 2.0]))
+    # Without WITHSCORES the reply is decoded as usual.
+    assert execute_columnar(conn, "ZRANGE", "z", 0, 10) == ["c", "a", "b"]
+
+
+def test_empty_keys_give_empty_columns(conn):
+    assert execute_columnar(conn, "ZRANGE", "none", 0, 10, "WITHSCORES", use_numpy=False) == (
+        ScoredColumns([], array("d"))
+    )
+    assert execute_columnar(conn, "XRANGE", "none", "-", "+") == StreamColumns([], {})
+
+
+def test_stream_fields_missing_from_some_entries_are_none(conn):
+    conn.execute_command("XADD", "s", "1-1", "a", "1")
+    conn.execute_command("XADD", "s", "1-2", "b", "2")
+    conn.execute_command("XADD", "s", "1-3", "a", "3", "b", "4")
+
+    reply = execute_columnar(conn, "XRANGE", "s", "-", "+")
+    assert reply == StreamColumns(["1-1", "1-2", "1-3"], {"a": ["1", None, "3"], "b": [None, "2", "4"]})
+
+
+def test_numbers_pack_replies_with_nan_for_null(conn):
+    conn.execute_command("ZADD", "z", 2.5, "m")
+    scores = execute_numbers(conn, [("ZSCORE", "z", "m"), ("ZSCORE", "z", "missing")], use_numpy=False)
+    assert scores[0] == 2.5 and math.isnan(scores[1])
+
+    counts = execute_numbers(conn, [("INCRBY", "n", 5), ("INCRBY", "n", 2)], typecode="q", use_numpy=False)
+    assert counts == array("q", [5, 7])
+    with pytest.raises(ValueError):
+        execute_numbers(conn, [("ZSCORE", "z", "missing")], typecode="q", use_numpy=False)
+    with pytest.raises(RespError):
+        execute_numbers(conn, [("ZSCORE", "z")], use_numpy=False)
+
+
+def test_numpy_is_required_only_when_asked_for(conn, monkeypatch):
+    monkeypatch.setattr(columnar, "numpy", None)
+    conn.execute_command("ZADD", "z", 1, "m")
+    reply = execute_columnar(conn, "ZRANGE", "z", 0, 1, "WITHSCORES")
+    assert reply.scores == array("d", [1.0])
+    with pytest.raises(RuntimeError):
+        execute_columnar(conn, "ZRANGE", "z", 0, 1, "WITHSCORES", use_numpy=True)
+
+
+def test_a_failed_decode_marks_the_connection_broken(conn):
+    for i in range(3):
+        conn.execute_command("ZADD", "z", i, f"m{i}")
+
+    def fail_after_header(reader):
+        reader.read_array_header()
+        raise ValueError("bad score")
+
+    with pytest.raises(ValueError):
+        conn.execute_decoded(("ZRANGE", "z", 0, 10, "WITHSCORES"), fail_after_header)
+    assert conn.broken
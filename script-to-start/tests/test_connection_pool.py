@@ -0,0 +1,35 @@
+import time
+
+from connection_pool import Connection, close_pools, get_pool, write_token
+from standin import StandInThread
+
+
+def test_get_pool_keeps_pools_with_other_settings_apart():
+    with StandInThread(password="secret") as server:
+        try:
+            pool = get_pool("127.0.0.1", server.port, password="secret", max_connections=2)
+            assert get_pool("127.0.0.1", server.port, max_connections=2, password="secret") is pool
+            other = get_pool("127.0.0.1", server.port, password="secret", max_connections=8)
+            assert other is not pool
+            assert other.max_connections == 8
+            unauthenticated = get_pool("127.0.0.1", server.port)
+            assert unauthenticated.password is None
+            with pool.connection() as conn:
+                assert conn.execute_command("PING") == "PONG"
+        finally:
+            close_pools()
+
+
+def test_write_token_expires_a_second_after_the_wait():
+    with StandInThread() as server:
+        conn = Connection("127.0.0.1", server.port)
+        try:
+            before = time.time() * 1000
+            token = write_token(conn, "token", 0.5)
+            after = time.time() * 1000
+            assert conn.execute_command("GET", "token") == token
+        finally:
+            conn.close()
+        value, expire_ms = server.server.strings["token"]
+        assert value == token
+        assert before + 1500 <= expire_ms <= after + 1500
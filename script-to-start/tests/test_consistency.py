@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from connection_pool import Connection, close_pools
+from consistency import LAG_KEY, ReplicationChecker
+from standin import StandInThread
+
+
+@pytest.fixture
+def nodes():
+    # A master and a stand-in that is not its replica, so the test decides
+    # what diverges. Like memoryDb, RPUSH takes one value per call.
+    with StandInThread() as master, StandInThread() as other:
+        try:
+            yield master, other
+        finally:
+            close_pools()
+
+
+def _write(port, commands):
+    conn = Connection("127.0.0.1", port)
+    try:
+        pipe = conn.pipeline()
+        for args in commands:
+            pipe.execute_command(*args)
+        return pipe.execute()
+    finally:
+        conn.close()
+
+
+def _address(node):
+    return ("127.0.0.1", node.port)
+
+
+def test_compare_finds_divergent_keys_small_and_digested(nodes):
+    master, other = nodes
+    same = [
+        ("SET", "string", "v"),
+        *[("RPUSH", "big", i) for i in range(100)],
+        ("ZADD", "zset", 1, "a"),
+        ("ZADD", "zset", 2, "b"),
+        ("XADD", "stream", "1-1", "f", "v"),
+    ]
+    _write(master.port, same)
+    _write(other.port, same + [("SET", "string", "changed"), ("RPUSH", "big", "extra")])
+
+    with ReplicationChecker(_address(master), [_address(other)], threshold=64) as checker:
+        types = checker.detect_types(["string", "big", "zset", "stream"])
+        assert types == {"string": "string", "big": "list", "zset": "zset", "stream": "stream"}
+        diffs = {d.key: d for d in checker.compare(types)[_address(other)]}
+
+    assert set(diffs) == {"string", "big"}
+    assert (diffs["string"].expected, diffs["string"].actual) == ("v", "changed")
+    # Lists over the threshold are compared by digest.
+    assert diffs["big"].expected.startswith("sha1:100:")
+    assert diffs["big"].actual.startswith("sha1:101:")
+
+
+def test_wait_for_convergence_on_a_replica():
+    with StandInThread() as master, StandInThread(replicaof=("127.0.0.1", master.port)) as replica:
+        try:
+            replica.wait_synced()
+            _write(master.port, [("SET", "a", "1"), *[("RPUSH", "l", i) for i in range(80)], ("ZADD", "z", 3, "m")])
+            with ReplicationChecker(_address(master), [_address(replica)]) as checker:
+                before = time.time() * 1000
+                report = checker.wait_for_convergence(["a", "l", "z"], timeout=5.0, interval=0.01)
+            assert report.converged
+            assert report.divergent == {}
+            assert report.lag[_address(replica)] is not None
+            # The lag token is written to expire a second after the wait.
+            for node in (master, replica):
+                value, expire_ms = node.server.strings[LAG_KEY]
+                assert before + 6000 <= expire_ms <= time.time() * 1000 + 6000
+        finally:
+            close_pools()
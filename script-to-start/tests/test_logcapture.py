@@ -0,0 +1,70 @@
+import subprocess
+import sys
+import time
+
+from logcapture import LogCollector
+
+CHILD = r"""
+import sys
+out, err = sys.stdout.buffer, sys.stderr.buffer
+out.write(b"12:00:00 info: starting\n")
+out.write(b"12:00:00 dbug: noisy detail\n")
+out.flush()
+err.write(b"12:00:01 fail: something broke\n")
+err.write(b"   at a stack frame\n")
+err.flush()
+out.write(b"12:00:02 warn: half a li")
+out.flush()
+out.write(b"ne at exit")
+"""
+
+
+def _captured(collector, name, lines, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while collector.sources[name].lines < lines:
+        assert time.monotonic() < deadline, collector.tail(name)
+        time.sleep(0.01)
+
+
+def test_levels_are_filtered_and_the_last_partial_line_is_kept():
+    collector = LogCollector(level="info")
+    try:
+        proc = subprocess.Popen(
+            [sys.executable, "-c", CHILD], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        collector.add(proc, "child")
+        proc.wait(timeout=10)
+        _captured(collector, "child", 5)
+
+        lines = sorted(collector.tail("child"))
+        assert lines == sorted([
+            "[child STDOUT] 12:00:00 info: starting",
+            "[child STDERR] 12:00:01 fail: something broke",
+            "[child STDERR]    at a stack frame",
+            "[child STDOUT] 12:00:02 warn: half a line at exit",
+        ])
+        stats = collector.stats()["child"]
+        assert stats.lines == 5
+        assert stats.filtered == 1
+        assert stats.levels == {"trce": 0, "dbug": 1, "info": 1, "warn": 1, "fail": 2, "crit": 0}
+    finally:
+        collector.close()
+
+
+def test_level_can_be_changed_after_creation():
+    collector = LogCollector()
+    try:
+        collector.level = "fail"
+        assert collector.level == "fail"
+        proc = subprocess.Popen(
+            [sys.executable, "-c", CHILD], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        collector.add(proc, "child")
+        proc.wait(timeout=10)
+        _captured(collector, "child", 5)
+        assert [line.split("] ", 1)[1] for line in collector.tail("child")] == [
+            "12:00:01 fail: something broke",
+            "   at a stack frame",
+        ]
+    finally:
+        collector.close()
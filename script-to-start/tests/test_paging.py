@@ -0,0 +1,97 @@
+import time
+
+import paging
+from connection_pool import Connection
+from standin import StandInThread
+
+PAGE_SIZE = 100
+
+
+def _fill_stream(conn, key):
+    # An old entry far from the rest, then 5,000 entries five to a
+    # millisecond ending a few seconds ago.
+    base = int(time.time() * 1000) - 5000
+    ids = ["1000-1"] + [f"{base + i // 5}-{i % 5 + 1}" for i in range(5000)]
+    pipe = conn.pipeline()
+    for entry_id in ids:
+        pipe.execute_command("XADD", key, entry_id, "f", "v")
+    pipe.execute()
+    return ids
+
+
+def test_xrange_pages_read_the_whole_stream_in_order():
+    with StandInThread() as server:
+        conn = Connection("127.0.0.1", server.port)
+        try:
+            ids = _fill_stream(conn, "stream")
+            for prefetch in (False, True):
+                entries = paging.iter_xrange(conn, "stream", page_size=PAGE_SIZE, prefetch=prefetch)
+                assert [entry[0] for entry in entries] == ids
+            assert conn.execute_command("PING") == "PONG"
+        finally:
+            conn.close()
+
+
+def test_xrange_replies_stay_near_the_page_size():
+    with StandInThread() as server:
+        conn = Connection("127.0.0.1", server.port)
+        try:
+            ids = _fill_stream(conn, "stream")
+            plan = paging._xrange_plan("stream", "-", "+", PAGE_SIZE, paging.DEFAULT_WINDOW_MS)
+            args = next(plan)
+            read, sizes = [], []
+            while True:
+                reply = conn.execute_command(*args)
+                if not isinstance(args, paging._Probe):
+                    read += [entry[0] for entry in reply]
+                    sizes.append(len(reply))
+                try:
+                    args = plan.send(len(reply))
+                except StopIteration:
+                    break
+            assert read == ids
+            assert max(sizes) <= 2 * PAGE_SIZE
+        finally:
+            conn.close()
+
+
+def test_lrange_and_zrange_pages_match_one_reply():
+    with StandInThread() as server:
+        conn = Connection("127.0.0.1", server.port)
+        try:
+            conn.execute_command("RPUSH", "list", *range(250))
+            for i in range(250):
+                conn.execute_command("ZADD", "zset", i, f"m{i}")
+            assert list(paging.iter_lrange(conn, "list", page_size=PAGE_SIZE)) == conn.execute_command(
+                "LRANGE", "list", 0, -1
+            )
+            scored = conn.execute_command("ZRANGE", "zset", 0, 249, "WITHSCORES")
+            pairs = list(paging.iter_zrange(conn, "zset", withscores=True, page_size=PAGE_SIZE))
+            assert pairs == list(zip(scored[::2], scored[1::2]))
+        finally:
+            conn.close()
+
+
+def test_abandoning_a_scan_keeps_the_connection_usable():
+    with StandInThread() as server:
+        conn = Connection("127.0.0.1", server.port)
+        try:
+            for i in range(100):
+                conn.execute_command("RPUSH", "list", i)
+                conn.execute_command("XADD", "stream", f"1-{i + 1}", "f", "v")
+            scans = [
+                # Replies read off whole, with the next one already sent.
+                lambda: paging.lrange_pages(conn, "list", page_size=10, prefetch=True),
+                # One reply split into pages and left part read.
+                lambda: paging.xrange_pages(conn, "stream", start="0-0", page_size=10, prefetch=True),
+                lambda: paging.xrange_pages(conn, "stream", start="0-0", page_size=10),
+            ]
+            for scan in scans:
+                for page in scan():
+                    assert len(page) == 10
+                    break
+                assert not conn.broken
+                assert conn.execute_command("PING") == "PONG"
+                assert conn.execute_command("LLEN", "list") == 100
+        finally:
+            conn.close()
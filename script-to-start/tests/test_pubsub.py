@@ -0,0 +1,43 @@
+import pytest
+
+from connection_pool import Connection
+from pubsub import Subscriber
+from standin import StandInThread
+
+
+def _publish(port, channel, data):
+    conn = Connection("127.0.0.1", port)
+    try:
+        return conn.execute_command("PUBLISH", channel, data)
+    finally:
+        conn.close()
+
+
+def test_subscribes_to_many_channels_through_split_reads():
+    # read_size makes the stand-in drop commands that straddle its 1024 byte
+    # reads the way memoryDb does, so a split batch loses confirmations.
+    channels = [f"channel:{i:04}" for i in range(300)]
+    with StandInThread(read_size=1024) as server, Subscriber("127.0.0.1", server.port, timeout=5.0) as sub:
+        replies = sub.subscribe(*channels)
+        assert [reply[1] for reply in replies] == channels
+        assert sub.channels == set(channels)
+
+        assert _publish(server.port, channels[-1], "hello") == 1
+        message = sub.get(timeout=5.0)
+        assert (message.channel, message.data) == (channels[-1], "hello")
+
+
+def test_callback_error_closes_the_subscriber_with_its_cause():
+    def callback(message):
+        raise ValueError(f"bad message {message.data}")
+
+    with StandInThread() as server:
+        with Subscriber("127.0.0.1", server.port, callback=callback, timeout=5.0) as sub:
+            sub.subscribe("events")
+            _publish(server.port, "events", "boom")
+            with pytest.raises(ConnectionError) as raised:
+                sub.get(timeout=5.0)
+            assert isinstance(raised.value.__cause__, ValueError)
+            assert sub.error is raised.value.__cause__
+            with pytest.raises(ConnectionError):
+                sub.subscribe("more")
@@ -0,0 +1,82 @@
+import pytest
+
+from rdb_reader import RdbError, iter_rdb
+from rdb_writer import RdbWriter
+
+
+def _string(text):
+    data = text.encode()
+    return bytes((len(data),)) + data
+
+
+def _server_stream(key, entries):
+    # Layout of RdbFileBuilderService.HandleSteams: the entry count, then
+    # one group per millisecond (base ID, count, field names, then the
+    # sequence delta and values of each entry).
+    out = b"\x15" + _string(key) + bytes((len(entries),))
+    groups = {}
+    for entry_id, fields in entries:
+        groups.setdefault(entry_id.split("-")[0], []).append((entry_id, fields))
+    for group in groups.values():
+        base_id = group[0][0]
+        base_seq = int(base_id.split("-")[1])
+        names = list(group[0][1])
+        out += _string(base_id) + bytes((len(group), len(names)))
+        out += b"".join(_string(name) for name in names)
+        for entry_id, fields in group:
+            out += bytes((int(entry_id.split("-")[1]) - base_seq,))
+            out += b"".join(_string(fields[name]) for name in names)
+    return out
+
+
+def _server_rdb(tmp_path, body):
+    path = tmp_path / "dump.rdb"
+    path.write_bytes(b"REDIS0009" + body + b"\xff")
+    return str(path)
+
+
+def test_stream_with_entries_in_the_same_millisecond(tmp_path):
+    entries = [
+        ("1700000000796-0", {"f": "a"}),
+        ("1700000000796-1", {"f": "b"}),
+        ("1700000000796-2", {"f": "c"}),
+        ("1700000000797-0", {"g": "d"}),
+    ]
+    body = _server_stream("s", entries) + b"\x00" + _string("k") + _string("v")
+    parsed = list(iter_rdb(_server_rdb(tmp_path, body)))
+
+    assert [(e.key, e.type, e.length) for e in parsed] == [("s", "stream", 4), ("k", "string", 1)]
+    assert parsed[0].value == entries
+
+
+def test_stream_values_can_be_skipped(tmp_path):
+    entries = [("5-0", {"f": "a"}), ("5-1", {"f": "b"})]
+    body = _server_stream("s", entries) + _server_stream("empty", [])
+    parsed = list(iter_rdb(_server_rdb(tmp_path, body), load_values=False))
+
+    assert [(e.key, e.length, e.value) for e in parsed] == [("s", 2, None), ("empty", 0, None)]
+
+
+def test_writer_matches_the_server_layout(tmp_path):
+    entries = [("1700000000796-0", {"f": "a"}), ("1700000000796-1", {"f": "b"}), ("1700000000797-0", {"g": "c"})]
+    writer = RdbWriter()
+    writer.add_stream("s", [(tuple(map(int, i.split("-"))), fields) for i, fields in entries])
+
+    assert writer.getvalue() == b"REDIS0009" + _server_stream("s", entries) + b"\xff"
+
+
+def test_truncated_files_raise_rdb_error(tmp_path):
+    writer = RdbWriter()
+    writer.add_string("k", "v", expire_ms=1700000000000)
+    writer.add_list("l", ["a", "b"])
+    writer.add_zset("z", [("m", 1.5)])
+    writer.add_stream("s", [((5, 0), {"f": "a"}), ((5, 1), {"f": "b"})])
+    data = writer.getvalue()
+    path = tmp_path / "dump.rdb"
+    path.write_bytes(data)
+    assert len(list(iter_rdb(str(path)))) == 4
+
+    for cut in range(len(data) - 1, 0, -1):
+        path.write_bytes(data[:cut])
+        with pytest.raises(RdbError):
+            list(iter_rdb(str(path)))
@@ -0,0 +1,138 @@
+import pytest
+
+from resp import (
+    CommandEncoder,
+    ProtocolError,
+    RespError,
+    RespReader,
+    encode_command,
+    encode_into,
+)
+
+
+class ChunkedSocket:
+    # Hands out the data in the given chunks, one per recv_into call.
+    def __init__(self, *chunks):
+        self.chunks = [bytes(chunk) for chunk in chunks if chunk]
+
+    def recv_into(self, buffer):
+        if not self.chunks:
+            return 0
+        chunk = self.chunks.pop(0)
+        size = min(len(chunk), len(buffer))
+        buffer[:size] = chunk[:size]
+        if size < len(chunk):
+            self.chunks.insert(0, chunk[size:])
+        return size
+
+
+REPLIES = (
+    b"+OK\r\n"
+    b"-ERR something went wrong\r\n"
+    b":42\r\n"
+    b":-7\r\n"
+    b"$5\r\nhello\r\n"
+    b"$0\r\n\r\n"
+    b"$-1\r\n"
+    b"*-1\r\n"
+    b"*0\r\n"
+    b"*3\r\n$1\r\na\r\n*2\r\n:1\r\n*1\r\n$-1\r\n-ERR inner\r\n"
+    b"$4\r\n\xc3\xa9\r\n\r\n"
+)
+EXPECTED = [
+    "OK",
+    RespError("ERR something went wrong"),
+    42,
+    -7,
+    "hello",
+    "",
+    None,
+    None,
+    [],
+    ["a", [1, [None]], RespError("ERR inner")],
+    "é\r\n",
+]
+
+
+def test_replies_split_at_every_byte_boundary():
+    for cut in range(len(REPLIES) + 1):
+        reader = RespReader(ChunkedSocket(REPLIES[:cut], REPLIES[cut:]), buffer_size=16)
+        assert reader.read_responses(len(EXPECTED)) == EXPECTED, cut
+        assert reader.position == len(REPLIES)
+
+
+def test_replies_arriving_a_byte_at_a_time():
+    reader = RespReader(ChunkedSocket(*(REPLIES[i:i + 1] for i in range(len(REPLIES)))), buffer_size=8)
+    assert reader.read_responses(len(EXPECTED)) == EXPECTED
+
+
+def test_bytes_mode_and_array_headers():
+    reader = RespReader(ChunkedSocket(b"*2\r\n$2\r\nab\r\n+OK\r\n-ERR no\r\n"), encoding=None)
+    assert reader.read_array_header() == 2
+    assert reader.read_responses(2) == [b"ab", b"OK"]
+    assert reader.read_array_header() == RespError("ERR no")
+
+
+def test_large_bulk_bypasses_the_shared_buffer():
+    payload = bytes(range(256)) * 40
+    data = b"$%d\r\n" % len(payload) + payload + b"\r\n:1\r\n"
+    for cut in (3, 10, 100, 5000, len(data) - 5, len(data) - 4):
+        reader = RespReader(ChunkedSocket(data[:cut], data[cut:]), buffer_size=64, encoding=None)
+        assert reader.read_response() == payload
+        assert reader.read_response() == 1
+        assert reader.position == len(data)
+
+
+def test_closed_socket_and_unknown_prefix():
+    with pytest.raises(ConnectionError):
+        RespReader(ChunkedSocket(b"$5\r\nhel")).read_response()
+    with pytest.raises(ProtocolError):
+        RespReader(ChunkedSocket(b"?oops\r\n")).read_response()
+
+
+def test_encode_argument_types():
+    frame = encode_command(
+        ["SET", "k\u00e9y", b"raw", bytearray(b"ba"), memoryview(b"mv"), -12, 1.5]
+    )
+    assert frame == (
+        b"*7\r\n$3\r\nSET\r\n$4\r\nk\xc3\xa9y\r\n$3\r\nraw\r\n$2\r\nba\r\n"
+        b"$2\r\nmv\r\n$3\r\n-12\r\n$3\r\n1.5\r\n"
+    )
+    # The encoded frame parses back to the same arguments.
+    assert RespReader(ChunkedSocket(frame), encoding=None).read_response() == [
+        b"SET", "k\u00e9y".encode(), b"raw", b"ba", b"mv", b"-12", b"1.5",
+    ]
+    with pytest.raises(TypeError):
+        encode_command(["SET", "flag", True])
+    with pytest.raises(TypeError):
+        encode_command(["SET", "missing", None])
+
+
+def test_encode_command_name_types():
+    expected = b"*2\r\n$3\r\nGET\r\n$1\r\nk\r\n"
+    for name in ("GET", b"GET", bytearray(b"GET"), memoryview(b"GET")):
+        assert encode_command([name, "k"]) == expected
+    # Names outside the preloaded set are cached on first use.
+    for name in (bytearray(b"OBJECT"), "OBJECT", "\u00e9cho"):
+        assert encode_command([name]) == encode_command([name])
+    assert encode_command(["\u00e9cho"]) == b"*1\r\n$5\r\n\xc3\xa9cho\r\n"
+
+
+def test_encode_large_frames():
+    payload = b"x" * 5000
+    args = ["RPUSH", "list"] + [str(n) for n in range(70)] + [payload]
+    frame = encode_into(bytearray(), args)
+    assert frame.startswith(b"*73\r\n$5\r\nRPUSH\r\n")
+    assert frame.endswith(b"$5000\r\n" + payload + b"\r\n")
+
+
+def test_command_encoder_latin1():
+    encoder = CommandEncoder(encoding="latin-1")
+    assert encoder.append("SET", "k", "\u00e9") == len(encoder)
+    encoder.append("GET", "k")
+    assert encoder.take() == (
+        b"*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$1\r\n\xe9\r\n"
+        b"*2\r\n$3\r\nGET\r\n$1\r\nk\r\n"
+    )
+    assert len(encoder) == 0
+    assert bytes(encoder.encode("PING")) == b"*1\r\n$4\r\nPING\r\n"
@@ -0,0 +1,112 @@
+import threading
+
+import pytest
+
+from cluster import wait_for_replica
+from connection_pool import close_pools
+from router import LEAST_OUTSTANDING, Router
+from standin import StandInThread
+
+
+@pytest.fixture
+def nodes():
+    with StandInThread() as master:
+        replicas = [StandInThread(replicaof=("127.0.0.1", master.port)).start() for _ in range(2)]
+        try:
+            for replica in replicas:
+                replica.wait_synced()
+            yield master, replicas
+        finally:
+            close_pools()
+            for replica in replicas:
+                replica.stop()
+
+
+def _router(master, replicas, **kwargs):
+    return Router(
+        ("127.0.0.1", master.port), [("127.0.0.1", r.port) for r in replicas], **kwargs
+    )
+
+
+def _synced(master, replicas):
+    for replica in replicas:
+        wait_for_replica(("127.0.0.1", master.port), ("127.0.0.1", replica.port))
+
+
+def _count_waits(master):
+    waits = []
+    execute = master.server.execute
+
+    async def recording(client, args):
+        if args[0].upper() == "WAIT":
+            waits.append(args)
+        return await execute(client, args)
+
+    master.server.execute = recording
+    return waits
+
+
+def test_round_robin_alternates_replicas(nodes):
+    master, replicas = nodes
+    router = _router(master, replicas)
+    router.execute_command("SET", "k", "v")
+    _synced(master, replicas)
+    assert [router.execute_command("GET", "k") for _ in range(4)] == ["v"] * 4
+    assert [router.served[pool] for pool in router.replicas] == [2, 2]
+    assert router.served[router.master] == 1
+
+
+def test_least_outstanding_avoids_a_busy_replica(nodes):
+    master, replicas = nodes
+    router = _router(master, replicas, strategy=LEAST_OUTSTANDING)
+    busy, idle = router.replicas
+    router.outstanding[busy] += 1
+    for _ in range(3):
+        router.execute_command("GET", "k")
+    assert (router.served[busy], router.served[idle]) == (0, 3)
+    assert router.outstanding == {busy: 1, idle: 0}
+
+
+def test_reads_fall_back_to_the_master_when_a_replica_is_down(nodes):
+    master, replicas = nodes
+    router = _router(master, replicas)
+    router.execute_command("SET", "k", "v")
+    _synced(master, replicas[1:])
+    replicas[0].stop()
+    assert [router.execute_command("GET", "k") for _ in range(4)] == ["v"] * 4
+    down, up = router.replicas
+    assert router.served[down] == 0
+    assert router.served[up] == 2
+    assert router.served[router.master] == 1 + 2
+    assert router.outstanding == {down: 0, up: 0}
+
+
+def test_max_staleness_zero_reads_your_writes(nodes):
+    master, replicas = nodes
+    router = _router(master, replicas, max_staleness=0, wait_timeout=2.0)
+    for i in range(20):
+        router.execute_command("SET", "k", str(i))
+        assert router.execute_command("GET", "k") == str(i)
+    # The reads were served by the replicas once WAIT confirmed them.
+    assert sum(router.served[pool] for pool in router.replicas) == 20
+
+
+def test_concurrent_stale_reads_share_one_wait(nodes):
+    master, replicas = nodes
+    router = _router(master, replicas, max_staleness=0, wait_timeout=2.0)
+    waits = _count_waits(master)
+    router.execute_command("SET", "k", "v")
+    start = threading.Barrier(8)
+    replies = []
+
+    def read():
+        start.wait()
+        replies.append(router.execute_command("GET", "k"))
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert replies == ["v"] * 8
+    assert len(waits) == 1
@@ -0,0 +1,90 @@
+import asyncio
+
+from aio_client import AsyncConnection
+from connection_pool import Connection
+from scripts import ScriptRegistry, is_noscript
+from standin import StandInThread
+
+BODIES = ["return 1", "return 2", "return redis.call('get', KEYS[1])"]
+
+
+def _record(server):
+    # Names the commands the stand-in executes, in order.
+    seen = []
+    execute = server.server.execute
+
+    async def recording(client, args):
+        name = args[0].upper()
+        seen.append(f"{name} {args[1].upper()}" if name == "SCRIPT" else name)
+        return await execute(client, args)
+
+    server.server.execute = recording
+    return seen
+
+
+def _registry():
+    registry = ScriptRegistry()
+    scripts = [registry.register(body) for body in BODIES]
+    return registry, scripts
+
+
+def _ran(reply):
+    # The stand-in has no Lua: a script it knows answers with this error.
+    return not is_noscript(reply) and "not supported" in str(reply)
+
+
+def test_first_call_loads_every_script_then_evalsha_alone():
+    _, scripts = _registry()
+    with StandInThread() as server:
+        seen = _record(server)
+        conn = Connection("127.0.0.1", server.port)
+        try:
+            assert _ran(scripts[2](conn, ["k"], ["v"]))
+            assert seen == ["SCRIPT LOAD"] * 3 + ["EVALSHA"]
+            assert set(server.server.scripts) == {script.sha for script in scripts}
+
+            seen.clear()
+            assert _ran(scripts[0](conn))
+            assert seen == ["EVALSHA"]
+        finally:
+            conn.close()
+
+
+def test_reloads_and_retries_once_after_a_flush():
+    _, scripts = _registry()
+    with StandInThread() as server:
+        seen = _record(server)
+        conn = Connection("127.0.0.1", server.port)
+        try:
+            scripts[0](conn)
+            for flush in (("SCRIPT", "FLUSH", scripts[1].sha), ("FLUSHALL",)):
+                conn.execute_command(*flush)
+                seen.clear()
+                assert _ran(scripts[1](conn))
+                assert seen == ["EVALSHA"] + ["SCRIPT LOAD"] * 3 + ["EVALSHA"]
+        finally:
+            conn.close()
+
+
+def test_async_calls_load_and_reload_the_same_way():
+    _, scripts = _registry()
+
+    async def run(port, seen):
+        conn = await AsyncConnection.connect("127.0.0.1", port)
+        try:
+            assert _ran(await scripts[2].call_async(conn, ["k"], ["v"]))
+            assert sorted(seen[:3]) == ["SCRIPT LOAD"] * 3 and seen[3:] == ["EVALSHA"]
+
+            seen.clear()
+            assert _ran(await scripts[0].call_async(conn))
+            assert seen == ["EVALSHA"]
+
+            await conn.execute_command("FLUSHALL")
+            seen.clear()
+            assert _ran(await scripts[1].call_async(conn))
+            assert seen == ["EVALSHA"] + ["SCRIPT LOAD"] * 3 + ["EVALSHA"]
+        finally:
+            await conn.close()
+
+    with StandInThread() as server:
+        asyncio.run(run(server.port, _record(server)))
@@ -0,0 +1,13 @@
+from resp import encode_command
+from standin import split_commands
+
+
+def test_split_commands_drops_a_command_cut_off_by_the_read():
+    data = encode_command(["SET", "a", "1"]) + encode_command(["SET", "b", "2"])
+    assert split_commands(data) == [[b"SET", b"a", b"1"], [b"SET", b"b", b"2"]]
+    assert split_commands(data[:-3]) == [[b"SET", b"a", b"1"]]
+
+
+def test_split_commands_resynchronises_on_the_next_command():
+    tail = encode_command(["SET", "a", "1"])[5:]
+    assert split_commands(tail + encode_command(["PING"])) == [[b"PING"]]
@@ -0,0 +1,84 @@
+from collections import Counter
+
+from connection_pool import Connection
+from resp import encode_command
+from standin import StandInThread
+from traffic import (
+    COMMAND,
+    REPLY,
+    CaptureProxy,
+    ReplyMatcher,
+    TraceWriter,
+    leading_bulks,
+    load_trace,
+    read_trace,
+    replay,
+)
+
+
+def test_reply_matcher_skips_pushes_and_extra_confirmations():
+    matcher = ReplyMatcher()
+    matcher.command(encode_command(["LRANGE", "list", 0, -1]), "lrange")
+    # Before any SUBSCRIBE an array that starts with "message" is a reply.
+    assert matcher.reply([b"message", b"text"]) == "lrange"
+
+    matcher.command(encode_command(["SUBSCRIBE", "news", "sports"]), "subscribe")
+    matcher.command(encode_command(["PSUBSCRIBE", "n*"]), "psubscribe")
+    matcher.command(encode_command(["UNSUBSCRIBE", "news"]), "unsubscribe")
+    assert matcher.reply([b"subscribe", b"news", 1]) == "subscribe"
+    # Redis and the stand-in confirm each channel; memoryDb only the first.
+    assert matcher.reply([b"subscribe", b"sports", 2]) is None
+    assert matcher.reply([b"message", b"news", b"hello"]) is None
+    assert matcher.reply([b"pmessage", b"n*", b"news", b"hello"]) is None
+    assert matcher.reply([b"psubscribe", b"n*", 3]) == "psubscribe"
+    assert matcher.reply([b"unsubscribe", b"news", 2]) == "unsubscribe"
+    assert len(matcher) == 0
+    assert matcher.reply([b"message", b"sports", b"late"]) is None
+
+
+def test_leading_bulks():
+    frame = encode_command(["SUBSCRIBE", "news", "sports"])
+    assert leading_bulks(frame, 2) == [b"SUBSCRIBE", b"news"]
+    assert leading_bulks(b"*3\r\n$7\r\nmessage\r\n$-1\r\n:1\r\n", 2) == [b"message"]
+    assert leading_bulks(b"+OK\r\n", 2) == []
+
+
+def test_capture_and_replay_a_subscribed_connection(tmp_path):
+    path = tmp_path / "trace.bin"
+    with StandInThread() as server:
+        with TraceWriter(path) as trace:
+            proxy = server.call(CaptureProxy(("127.0.0.1", server.port), trace).start())
+            subscriber = Connection("127.0.0.1", proxy.port)
+            publisher = Connection("127.0.0.1", proxy.port)
+            try:
+                assert subscriber.execute_command("SUBSCRIBE", "news", "sports")[1] == "news"
+                assert subscriber.reader.read_response()[1] == "sports"
+                for n in range(3):
+                    assert publisher.execute_command("PUBLISH", "news", f"item {n}") == 1
+                for n in range(3):
+                    assert subscriber.reader.read_response() == ["message", "news", f"item {n}"]
+                assert publisher.execute_command("SET", "key", "value") == "OK"
+                assert publisher.execute_command("GET", "key") == "value"
+                assert subscriber.execute_command("UNSUBSCRIBE", "news")[1] == "news"
+            finally:
+                subscriber.close()
+                publisher.close()
+                server.call(proxy.stop())
+
+        _, records = read_trace(path)
+        kinds = Counter((record.conn, record.kind) for record in records)
+        # One REPLY per COMMAND on both connections; the pushes are not recorded.
+        assert kinds[(1, COMMAND)] == kinds[(1, REPLY)] == 2
+        assert kinds[(2, COMMAND)] == kinds[(2, REPLY)] == 5
+        original = load_trace(path)[3]
+        assert original.count == 7
+
+        server.reset()
+        report = replay(path, "127.0.0.1", server.port, speed=0, timeout=5.0)
+    assert report["failed_connections"] == []
+    assert report["commands"] == report["replies"] == 7
+    assert report["latency"]["count"] == 7
+    assert report["errors"] == 0
+    # The second confirmation is always there; the messages only if the
+    # replayed PUBLISHes reached the server after the SUBSCRIBE.
+    assert 1 <= report["pushes"] <= 4
@@ -0,0 +1,569 @@
+import argparse
+import asyncio
+import json
+import select
+import socket
+import struct
+import threading
+import time
+from collections import Counter, deque, namedtuple
+
+from connection_pool import Connection
+from latency import LatencyHistogram
+from pipeline import MAX_BATCH_BYTES
+from resp import RespError, RespReader, encode_command
+from script import MASTER_PORT
+
+# Trace file: MAGIC, the wall-clock start time as a little-endian double,
+# then records of RECORD (kind, connection id, microseconds since the start,
+# payload length) followed by the payload. COMMAND payloads are the request
+# frames exactly as the client sent them; REPLY records only mark when a
+# command's reply arrived, for the original latencies. Pushes on subscribed
+# connections answer no command and are not recorded.
+MAGIC = b"RESPTRC1"
+HEADER = struct.Struct("<d")
+RECORD = struct.Struct("<BIQI")
+
+OPEN, COMMAND, REPLY, CLOSE = 1, 2, 3, 4
+
+TraceRecord = namedtuple("TraceRecord", ["kind", "conn", "time", "payload"])
+
+SUBSCRIPTION_COMMANDS = frozenset({b"subscribe", b"unsubscribe", b"psubscribe", b"punsubscribe"})
+PUSH_KINDS = frozenset({b"message", b"pmessage"})
+
+
+def frame_end(buf, pos=0):
+    # Index just past the RESP value that starts at pos, or -1 if buf does
+    # not hold all of it yet. Anything that does not start with an array or
+    # bulk header is a single line (simple replies, inline commands).
+    line = buf.find(b"\r\n", pos)
+    if line < 0:
+        return -1
+    prefix = buf[pos]
+    if prefix == 36:  # $
+        length = int(buf[pos + 1:line])
+        end = line + 2 if length < 0 else line + length + 4
+        return end if end <= len(buf) else -1
+    if prefix == 42:  # *
+        count = int(buf[pos + 1:line])
+        pos = line + 2
+        for _ in range(count):
+            pos = frame_end(buf, pos)
+            if pos < 0:
+                return -1
+        return pos
+    return line + 2
+
+
+def leading_bulks(frame, count):
+    # The first `count` bulk strings of an array frame, as bytes; fewer if
+    # the array is shorter or holds something else, none for other frames.
+    if frame[:1] != b"*":
+        return []
+    line = frame.find(b"\r\n")
+    size = int(frame[1:line])
+    pos = line + 2
+    items = []
+    for _ in range(min(size, count)):
+        if frame[pos:pos + 1] != b"$":
+            break
+        line = frame.find(b"\r\n", pos)
+        length = int(frame[pos + 1:line])
+        if length < 0:
+            break
+        items.append(bytes(frame[line + 2:line + 2 + length]))
+        pos = line + length + 4
+    return items
+
+
+class ReplyMatcher:
+    # Pairs one connection's replies with the commands it sent, in order.
+    # Once the connection has sent a (P)SUBSCRIBE, message pushes answer no
+    # command, and neither do the extra confirmations of an (un)subscribe
+    # that named several channels: memoryDb confirms only the first, Redis
+    # and the stand-in confirm each. A confirmation answers the oldest
+    # pending command when it is for that command's first channel.
+    def __init__(self):
+        self.subscribed = False
+        self._pending = deque()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def command(self, frame, value=True):
+        items = leading_bulks(frame, 2)
+        key = None
+        if items and items[0].lower() in SUBSCRIPTION_COMMANDS:
+            key = (items[0].lower(), items[1] if len(items) > 1 else None)
+            self.subscribed = True
+        self._pending.append((key, value))
+
+    def reply(self, items):
+        # items are the reply's leading bulk strings. Returns the value given
+        # with the command this reply answers, or None for a push.
+        if not self._pending:
+            return None
+        kind = items[0] if self.subscribed and items and isinstance(items[0], bytes) else None
+        if kind in PUSH_KINDS:
+            return None
+        if kind in SUBSCRIPTION_COMMANDS:
+            key = self._pending[0][0]
+            if key is None or key[0] != kind:
+                return None
+            if key[1] is not None and items[1:2] != [key[1]]:
+                return None
+        return self._pending.popleft()[1]
+
+
+class TraceWriter:
+    # Thread-safe; connection ids are handed out in order of open_connection.
+    def __init__(self, path):
+        self._file = open(path, "wb")
+        self._file.write(MAGIC + HEADER.pack(time.time()))
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._connections = 0
+        self.commands = 0
+
+    def _write(self, kind, conn, payload=b""):
+        elapsed = int((time.perf_counter() - self._started) * 1_000_000)
+        with self._lock:
+            self._file.write(RECORD.pack(kind, conn, elapsed, len(payload)))
+            if payload:
+                self._file.write(payload)
+            if kind == COMMAND:
+                self.commands += 1
+
+    def open_connection(self):
+        with self._lock:
+            self._connections += 1
+            conn = self._connections
+        self._write(OPEN, conn)
+        return conn
+
+    def command(self, conn, frame):
+        self._write(COMMAND, conn, frame)
+
+    def reply(self, conn):
+        self._write(REPLY, conn)
+
+    def close_connection(self, conn):
+        self._write(CLOSE, conn)
+
+    @property
+    def connections(self):
+        return self._connections
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_trace(path):
+    # Returns the capture's wall-clock start time and an iterator of
+    # TraceRecords, with time in seconds since the start.
+    f = open(path, "rb")
+    if f.read(len(MAGIC)) != MAGIC:
+        f.close()
+        raise ValueError(f"{path} is not a RESP trace")
+    (started,) = HEADER.unpack(f.read(HEADER.size))
+
+    def records():
+        with f:
+            while True:
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    return
+                kind, conn, elapsed, length = RECORD.unpack(header)
+                yield TraceRecord(kind, conn, elapsed / 1_000_000, f.read(length) if length else b"")
+
+    return started, records()
+
+
+class TracingConnection(Connection):
+    # A Connection whose execute_command calls are written to a trace.
+    # Pipelines go straight to the socket and are not traced; capture
+    # pipelined clients through CaptureProxy instead.
+    def __init__(self, host, port, password=None, timeout=None, trace=None):
+        self.trace = trace
+        self.conn_id = trace.open_connection()
+        super().__init__(host, port, password, timeout)
+
+    def execute_command(self, *args):
+        self.trace.command(self.conn_id, encode_command(args))
+        reply = super().execute_command(*args)
+        self.trace.reply(self.conn_id)
+        return reply
+
+    def close(self):
+        if not self.broken:
+            self.trace.close_connection(self.conn_id)
+        super().close()
+
+
+class CaptureProxy:
+    # Forwards every client connection to `upstream` and writes the traffic
+    # to the trace: each complete request frame as a COMMAND and each reply
+    # frame that answers one as a REPLY. Bytes are forwarded as they arrive,
+    # before they are parsed, so the proxy adds no batching of its own.
+    def __init__(self, upstream, trace, host="127.0.0.1", port=0, chunk_size=64 * 1024):
+        self.upstream = upstream
+        self.trace = trace
+        self.host = host
+        self.port = port
+        self.chunk_size = chunk_size
+        self._server = None
+        self._tasks = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        conn = self.trace.open_connection()
+        try:
+            up_reader, up_writer = await asyncio.open_connection(*self.upstream)
+        except OSError:
+            writer.close()
+            self.trace.close_connection(conn)
+            self._tasks.discard(task)
+            return
+        matcher = ReplyMatcher()
+
+        def command(frame):
+            matcher.command(frame)
+            self.trace.command(conn, frame)
+
+        def reply(frame):
+            if matcher.reply(leading_bulks(frame, 2)):
+                self.trace.reply(conn)
+
+        try:
+            await asyncio.gather(
+                self._pump(reader, up_writer, command),
+                self._pump(up_reader, writer, reply),
+            )
+        except (OSError, asyncio.CancelledError):
+            pass
+        finally:
+            for stream in (writer, up_writer):
+                stream.close()
+            self.trace.close_connection(conn)
+            self._tasks.discard(task)
+
+    async def _pump(self, reader, writer, record):
+        buf = bytearray()
+        parsing = True
+        while True:
+            chunk = await reader.read(self.chunk_size)
+            if not chunk:
+                break
+            writer.write(chunk)
+            if parsing:
+                buf += chunk
+                try:
+                    pos = 0
+                    while pos < len(buf):
+                        end = frame_end(buf, pos)
+                        if end < 0:
+                            break
+                        record(bytes(buf[pos:end]))
+                        pos = end
+                    del buf[:pos]
+                except ValueError:
+                    # Not RESP (an RDB payload, say): keep forwarding only.
+                    parsing = False
+                    buf.clear()
+            await writer.drain()
+        if writer.can_write_eof():
+            writer.write_eof()
+
+
+def load_trace(path):
+    # Groups the COMMAND frames by connection, in order, and works out the
+    # original latencies from the REPLY records.
+    started, records = read_trace(path)
+    connections = {}
+    waiting = {}
+    original = LatencyHistogram()
+    duration = 0.0
+    for record in records:
+        duration = record.time
+        if record.kind == COMMAND:
+            connections.setdefault(record.conn, []).append((record.time, record.payload))
+            waiting.setdefault(record.conn, deque()).append(record.time)
+        elif record.kind == REPLY:
+            pending = waiting.get(record.conn)
+            if pending:
+                original.record(record.time - pending.popleft())
+    return started, duration, connections, original
+
+
+class ConnectionReplay:
+    # Replays one connection's frames on one socket and thread. Frames are
+    # sent at their scheduled time and never reordered; up to
+    # max_inflight_bytes of them may wait for replies at once, which keeps
+    # pipelined traffic pipelined without overrunning memoryDb's 1024 byte
+    # read buffer.
+    def __init__(self, address, frames, schedule, max_inflight_bytes, timeout):
+        self.address = address
+        self.frames = frames
+        self.schedule = schedule
+        self.max_inflight_bytes = max_inflight_bytes
+        self.timeout = timeout
+        self.latency = LatencyHistogram()
+        self.lag = LatencyHistogram()
+        self.sent = 0
+        self.replies = 0
+        self.pushes = 0
+        self.errors = 0
+        self.failure = None
+        self._pending = ReplyMatcher()
+        self._inflight = 0
+
+    def _read_reply(self, reader):
+        reply = reader.read_response()
+        now = time.perf_counter()
+        sent = self._pending.reply(reply[:2] if isinstance(reply, list) else [])
+        if sent is None:
+            self.pushes += 1
+            return
+        self.replies += 1
+        if isinstance(reply, RespError):
+            self.errors += 1
+        sent_at, size = sent
+        self._inflight -= size
+        self.latency.record(now - sent_at)
+
+    def _read_ready(self, sock, reader, timeout):
+        if reader.buffered or select.select([sock], [], [], timeout)[0]:
+            self._read_reply(reader)
+            while reader.buffered and self._pending:
+                self._read_reply(reader)
+            return True
+        return False
+
+    def run(self, start):
+        try:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+        except OSError as exc:
+            self.failure = exc
+            return
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = RespReader(sock, encoding=None)
+        try:
+            for offset, frame in self.frames:
+                due = self.schedule(start, offset)
+                while True:
+                    now = time.perf_counter()
+                    room = not self._pending or self._inflight + len(frame) <= self.max_inflight_bytes
+                    if room and now >= due:
+                        break
+                    wait = max(due - now, 0) if room else self.timeout
+                    if not self._read_ready(sock, reader, wait) and not room:
+                        raise TimeoutError("No reply within the timeout")
+                sock.sendall(frame)
+                now = time.perf_counter()
+                self.lag.record(now - due)
+                self._pending.command(frame, (now, len(frame)))
+                self._inflight += len(frame)
+                self.sent += 1
+            while self._pending:
+                if not self._read_ready(sock, reader, self.timeout):
+                    raise TimeoutError("No reply within the timeout")
+        except (OSError, RespError) as exc:
+            self.failure = exc
+        finally:
+            sock.close()
+
+
+def _percentiles(histogram):
+    return {
+        "count": histogram.count,
+        "p50_ms": histogram.percentile(50) * 1000,
+        "p99_ms": histogram.percentile(99) * 1000,
+        "p999_ms": histogram.percentile(99.9) * 1000,
+        "max_ms": histogram.max_us / 1000,
+    }
+
+
+def replay(path, host, port, speed=1.0, max_inflight_bytes=MAX_BATCH_BYTES, timeout=5.0):
+    # speed is a multiple of the original pace; 0 replays as fast as the
+    # server answers. Every connection of the trace gets its own socket.
+    started, duration, connections, original = load_trace(path)
+    if speed:
+        schedule = lambda start, offset: start + offset / speed
+    else:
+        schedule = lambda start, offset: start
+    replays = [
+        ConnectionReplay((host, port), frames, schedule, max_inflight_bytes, timeout)
+        for _, frames in sorted(connections.items())
+    ]
+    start = time.perf_counter() + 0.05
+    threads = [threading.Thread(target=r.run, args=(start,), daemon=True) for r in replays]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latency, lag = LatencyHistogram(), LatencyHistogram()
+    for r in replays:
+        latency.merge(r.latency)
+        lag.merge(r.lag)
+    commands = sum(r.sent for r in replays)
+    trace_commands = sum(len(frames) for frames in connections.values())
+    return {
+        "trace_started": started,
+        "speed": speed,
+        "connections": len(replays),
+        "commands": commands,
+        "replies": sum(r.replies for r in replays),
+        "pushes": sum(r.pushes for r in replays),
+        "errors": sum(r.errors for r in replays),
+        "failed_connections": [str(r.failure) for r in replays if r.failure is not None],
+        "elapsed_sec": elapsed,
+        "ops_per_sec": commands / elapsed if elapsed > 0 else 0.0,
+        "trace_sec": duration,
+        "trace_ops_per_sec": trace_commands / duration if duration > 0 else 0.0,
+        "latency": _percentiles(latency),
+        "original_latency": _percentiles(original),
+        # At maximum speed every frame is due at the start.
+        "schedule_lag": _percentiles(lag) if speed else None,
+    }
+
+
+def summarize(path):
+    started, records = read_trace(path)
+    names = Counter()
+    connections = set()
+    duration = 0.0
+    for record in records:
+        duration = record.time
+        connections.add(record.conn)
+        if record.kind == COMMAND:
+            end = record.payload.find(b"\r\n")
+            if record.payload[:1] == b"*":
+                # The name is the first bulk string: "*N\r\n$L\r\nNAME\r\n".
+                name_start = record.payload.find(b"\r\n", end + 2) + 2
+                name = record.payload[name_start:record.payload.find(b"\r\n", name_start)]
+            else:
+                name = record.payload[:end].split(b" ", 1)[0]
+            names[name.decode(errors="replace").upper()] += 1
+    return {
+        "started": started,
+        "duration_sec": duration,
+        "connections": len(connections),
+        "commands": dict(names.most_common()),
+    }
+
+
+def print_report(report):
+    print(
+        f"{report['commands']:,} commands on {report['connections']} connections in "
+        f"{report['elapsed_sec']:.2f}s ({report['ops_per_sec']:,.0f} cmd/s); "
+        f"original {report['trace_sec']:.2f}s ({report['trace_ops_per_sec']:,.0f} cmd/s)"
+    )
+    print(f"{'':<18}{'count':>10}{'p50 ms':>10}{'p99 ms':>10}{'p99.9 ms':>10}{'max ms':>10}")
+    for label, key in (("latency", "latency"), ("original latency", "original_latency"), ("schedule lag", "schedule_lag")):
+        stats = report[key]
+        if stats is None:
+            continue
+        print(
+            f"{label:<18}{stats['count']:>10,}{stats['p50_ms']:>10.3f}{stats['p99_ms']:>10.3f}"
+            f"{stats['p999_ms']:>10.3f}{stats['max_ms']:>10.3f}"
+        )
+    print(f"errors: {report['errors']}, replies: {report['replies']:,}, pushes: {report['pushes']:,}")
+    for failure in report["failed_connections"]:
+        print(f"connection failed: {failure}")
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+async def capture(args):
+    with TraceWriter(args.out) as trace:
+        proxy = CaptureProxy(parse_address(args.upstream), trace, *parse_address(args.listen))
+        async with proxy:
+            print(f"Capturing {proxy.host}:{proxy.port} -> {args.upstream} into {args.out}", flush=True)
+            try:
+                if args.duration:
+                    await asyncio.sleep(args.duration)
+                else:
+                    await asyncio.Event().wait()
+            finally:
+                print(f"{trace.commands:,} commands from {trace.connections} connections", flush=True)
+
+
+def parse_speed(text):
+    if text == "max":
+        return 0.0
+    return float(text.rstrip("x"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture RESP traffic and replay it")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    capture_parser = commands.add_parser("capture", help="run a recording proxy")
+    capture_parser.add_argument("--listen", default="127.0.0.1:7000")
+    capture_parser.add_argument("--upstream", default=f"127.0.0.1:{MASTER_PORT}")
+    capture_parser.add_argument("--out", default="trace.bin")
+    capture_parser.add_argument("--duration", type=float, help="seconds; default until Ctrl-C")
+
+    replay_parser = commands.add_parser("replay", help="replay a trace")
+    replay_parser.add_argument("trace")
+    replay_parser.add_argument("--host", default="127.0.0.1")
+    replay_parser.add_argument("--port", type=int, default=MASTER_PORT)
+    replay_parser.add_argument("--speed", type=parse_speed, default=1.0, help="1, 5x, ... or max")
+    replay_parser.add_argument("--inflight-bytes", type=int, default=MAX_BATCH_BYTES)
+    replay_parser.add_argument("--timeout", type=float, default=5.0)
+    replay_parser.add_argument("--json", help="write the report to this file")
+
+    summary_parser = commands.add_parser("summary", help="print what a trace contains")
+    summary_parser.add_argument("trace")
+
+    args = parser.parse_args()
+    if args.command == "capture":
+        try:
+            asyncio.run(capture(args))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "replay":
+        report = replay(args.trace, args.host, args.port, args.speed, args.inflight_bytes, args.timeout)
+        print_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(summarize(args.trace), indent=2))
+
+
+if __name__ == "__main__":
+    main()